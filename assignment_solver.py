@@ -0,0 +1,111 @@
+import time
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError: # scipy comes with scikit-learn, but the greedy backend still works without it
+    linear_sum_assignment = None
+
+
+class AssignmentSolver:
+    """
+    Matches taxis to reservations from a taxi x reservation cost matrix. Two backends are available:
+    - "hungarian": rectangular linear sum assignment, which serves as many reservations as possible with the minimum total pickup distance
+    - "greedy": repeatedly takes the cheapest remaining (taxi, reservation) pair, used for instances too large for the optimal solver
+    Both backends are deterministic, so dispatch results and dispatch time no longer depend on the random seed
+    """
+
+    def __init__(self, backend="hungarian", cost_cutoff=float('inf'), max_optimal_size=250000):
+        """
+        Args:
+        - backend: "hungarian" or "greedy"
+        - cost_cutoff: pairs that cost more than this (and pairs with no route, which cost infinity) are never assigned
+        - max_optimal_size: the largest number of matrix cells the hungarian backend will solve, bigger instances use the greedy backend instead
+        """
+        if backend not in ("hungarian", "greedy"):
+            raise ValueError(f"Unknown assignment backend: {backend}")
+        self.backend = backend
+        self.cost_cutoff = cost_cutoff
+        self.max_optimal_size = max_optimal_size
+        self.timings = {
+            "calls": 0, # number of solved instances
+            "hungarian_calls": 0,
+            "greedy_calls": 0,
+            "total_time": 0.0, # in s
+            "last_time": 0.0, # in s
+            "max_time": 0.0, # in s
+            "last_size": [0, 0], # taxis x reservations of the last instance
+        }
+
+    def solve(self, costs):
+        """
+        Solves one assignment instance
+
+        Args:
+        - costs: taxi x reservation NumPy matrix of pickup costs, infinity where a taxi cannot reach a reservation
+
+        Returns:
+        - a list of (row, column) pairs, each row and each column is used at most once
+        """
+        start = time.perf_counter()
+        valid = np.isfinite(costs) & (costs <= self.cost_cutoff)
+        if not valid.any():
+            pairs = []
+            used = None
+        elif self.backend == "hungarian" and linear_sum_assignment is not None and costs.size <= self.max_optimal_size:
+            pairs = self._solve_optimal(costs, valid)
+            used = "hungarian_calls"
+        else:
+            pairs = self._solve_greedy(costs, valid)
+            used = "greedy_calls"
+        elapsed = time.perf_counter() - start
+
+        self.timings["calls"] += 1
+        if used is not None:
+            self.timings[used] += 1
+        self.timings["total_time"] += elapsed
+        self.timings["last_time"] = elapsed
+        self.timings["max_time"] = max(self.timings["max_time"], elapsed)
+        self.timings["last_size"] = list(costs.shape)
+        return pairs
+
+    @staticmethod
+    def _solve_optimal(costs, valid):
+        """
+        Rectangular linear sum assignment. Forbidden pairs get a penalty larger than any complete set of allowed pairs,
+        so the solver first maximizes the number of matched pairs and then minimizes their total cost
+        """
+        penalty = (costs[valid].sum() + 1.0) * 2
+        matrix = np.where(valid, costs, penalty)
+        rows, cols = linear_sum_assignment(matrix)
+        keep = valid[rows, cols]
+        return list(zip(rows[keep].tolist(), cols[keep].tolist()))
+
+    @staticmethod
+    def _solve_greedy(costs, valid):
+        """
+        Takes the allowed pairs in order of increasing cost and keeps every pair whose taxi and reservation are both still free
+        """
+        candidates = np.flatnonzero(valid)
+        order = candidates[np.argsort(costs.flat[candidates], kind="stable")]
+        rows, cols = np.unravel_index(order, costs.shape)
+        row_free = np.ones(costs.shape[0], dtype=bool)
+        col_free = np.ones(costs.shape[1], dtype=bool)
+        max_pairs = min(valid.any(axis=1).sum(), valid.any(axis=0).sum())
+        pairs = []
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            if row_free[row] and col_free[col]:
+                pairs.append((row, col))
+                row_free[row] = False
+                col_free[col] = False
+                if len(pairs) == max_pairs:
+                    break
+        return pairs
+
+    def get_timings(self):
+        """
+        Returns a copy of the timing counters, including the average time per solved instance
+        """
+        timings = dict(self.timings)
+        timings["average_time"] = timings["total_time"] / timings["calls"] if timings["calls"] > 0 else 0.0
+        return timings
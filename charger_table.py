@@ -0,0 +1,168 @@
+import heapq
+from array import array
+from road_router import RouteResult
+
+
+class NearestChargerTable:
+    """
+    For every edge of the road network, stores the charger with the shortest route, the length and travel time of that route,
+    and the next edge on it. The table comes from a multi-source search that runs backwards over the road network from every charger edge,
+    so sending a taxi to its nearest charger is a table lookup instead of one route per charger. Adding or removing a charger only
+    updates the edges whose nearest charger changes
+    """
+
+    def __init__(self, router):
+        """
+        Builds the reverse adjacency arrays, the table starts out without any chargers
+
+        Args:
+        - router: the RoadRouter whose drivable graph, edge lengths and travel times the table uses
+        """
+        self.router = router
+        num_edges = len(router.edge_ids)
+
+        # predecessors of edge i are stored in pred_source[pred_offset[i]:pred_offset[i+1]], together with the index of the link in the router's successor arrays
+        counts = [0] * (num_edges + 1)
+        for k in range(len(router.succ_target)):
+            counts[router.succ_target[k] + 1] += 1
+        for i in range(num_edges):
+            counts[i + 1] += counts[i]
+        self.pred_offset = array('l', counts)
+        self.pred_source = array('l', [0] * len(router.succ_target))
+        self.pred_link = array('l', [0] * len(router.succ_target))
+        fill = counts[:-1]
+        for node in range(num_edges):
+            for k in range(router.succ_offset[node], router.succ_offset[node + 1]):
+                target = router.succ_target[k]
+                self.pred_source[fill[target]] = node
+                self.pred_link[fill[target]] = k
+                fill[target] += 1
+
+        self.length = array('d', [float('inf')] * num_edges) # route length in m from each edge to its nearest charger, what the search ranks by
+        self.time = array('d', [float('inf')] * num_edges) # travel time in s of the route from each edge to its nearest charger
+        self.next_hop = array('l', [-1] * num_edges) # index of the next edge on the route to the nearest charger, -1 on charger edges
+        self.nearest_edge = array('l', [-1] * num_edges) # index of the charger edge each edge is routed to, -1 if no charger is reachable
+        self.edge_chargers = {} # charger edge index -> list of the ids of the chargers on that edge, in the order they were added
+        self.charger_edge = {} # charger id -> index of its edge
+
+    def __len__(self):
+        return len(self.charger_edge)
+
+    def add_charger(self, charger_id, edge_id):
+        """
+        Adds a charger and updates the edges for which it is now the nearest charger
+
+        Args:
+        - charger_id: the ID of the charger
+        - edge_id: the ID of the edge the charger is on
+
+        Returns:
+        - False if the router does not know the edge, in which case the charger is not in the table
+        """
+        idx = self.router.edge_index.get(edge_id)
+        if idx is None:
+            return False
+        self.charger_edge[charger_id] = idx
+        chargers = self.edge_chargers.setdefault(idx, [])
+        chargers.append(charger_id)
+        if len(chargers) == 1:
+            self._propagate([self._seed(idx)])
+        return True
+
+    def remove_charger(self, charger_id):
+        """
+        Removes a charger. If it was the last charger on its edge, every edge that was routed to that edge is searched again,
+        starting from the neighbouring edges whose nearest charger did not change
+        """
+        idx = self.charger_edge.pop(charger_id, None)
+        if idx is None:
+            return
+        chargers = self.edge_chargers[idx]
+        chargers.remove(charger_id)
+        if chargers:
+            return
+        del self.edge_chargers[idx]
+
+        router = self.router
+        affected = [node for node in range(len(self.nearest_edge)) if self.nearest_edge[node] == idx]
+        for node in affected:
+            self.length[node] = float('inf')
+            self.time[node] = float('inf')
+            self.next_hop[node] = -1
+            self.nearest_edge[node] = -1
+        seeds = []
+        for node in affected:
+            if node in self.edge_chargers:
+                seeds.append(self._seed(node))
+                continue
+            for k in range(router.succ_offset[node], router.succ_offset[node + 1]):
+                nxt = router.succ_target[k]
+                if self.nearest_edge[nxt] != -1:
+                    seeds.append((router.edge_length[node] + router.succ_length[k] + self.length[nxt], node, nxt, k))
+        self._propagate(seeds)
+
+    def _seed(self, idx):
+        """
+        Returns the heap entry for a charger edge, reaching a charger on the edge a taxi is already on costs the length of that edge
+        """
+        return (self.router.edge_length[idx], idx, -1, -1)
+
+    def _propagate(self, seeds):
+        """
+        Runs the backwards search from the given heap entries, only edges whose route length to a charger improves are updated
+
+        Args:
+        - seeds: list of (route length, edge index, next edge index or -1, index of the link to the next edge or -1)
+        """
+        router = self.router
+        edge_time = router.edge_time
+        edge_length = router.edge_length
+        succ_time = router.succ_time
+        succ_length = router.succ_length
+        pred_offset = self.pred_offset
+        pred_source = self.pred_source
+        pred_link = self.pred_link
+        length = self.length
+
+        heap = list(seeds)
+        heapq.heapify(heap)
+        while heap:
+            node_length, node, nxt, k = heapq.heappop(heap)
+            if node_length >= length[node]:
+                continue
+            length[node] = node_length
+            if nxt == -1:
+                self.time[node] = edge_time[node]
+                self.next_hop[node] = -1
+                self.nearest_edge[node] = node
+            else:
+                self.time[node] = edge_time[node] + succ_time[k] + self.time[nxt]
+                self.next_hop[node] = nxt
+                self.nearest_edge[node] = self.nearest_edge[nxt]
+            for p in range(pred_offset[node], pred_offset[node + 1]):
+                prev = pred_source[p]
+                link = pred_link[p]
+                prev_length = edge_length[prev] + succ_length[link] + node_length
+                if prev_length < length[prev]:
+                    heapq.heappush(heap, (prev_length, prev, node, link))
+
+    def nearest(self, edge_id):
+        """
+        Looks up the nearest charger from an edge
+
+        Args:
+        - edge_id: the ID of the edge the taxi is on
+
+        Returns:
+        - the charger ID, the route length in m, and the route object, or None if the edge is unknown to the router or no charger can be reached
+        """
+        idx = self.router.edge_index.get(edge_id)
+        if idx is None or self.nearest_edge[idx] == -1:
+            return None
+        path = []
+        node = idx
+        while node != -1:
+            path.append(self.router.edge_ids[node])
+            node = self.next_hop[node]
+        charger_id = self.edge_chargers[self.nearest_edge[idx]][0]
+        return charger_id, self.length[idx], RouteResult(tuple(path), self.length[idx], self.time[idx])
@@ -0,0 +1,168 @@
+import numpy as np
+
+
+class DispatchCostMatrix:
+    """
+    Taxi x reservation matrix of route lengths used by the dispatchers. Instead of routing every (taxi, reservation) pair separately,
+    one search is run per distinct taxi edge towards all of its distinct pickup edges at once, so the work grows with the number of distinct
+    edges rather than the number of pairs. Pairs can be restricted to a set of candidates and widened later, pairs that were never
+    evaluated cost infinity just like pairs without a route. Pairs the router already knows to be unreachable are marked as evaluated
+    up front and never searched. With a shared route cache, pairs that were already routed on an earlier dispatch are not searched again.
+    Routes are only rebuilt for the pairs that actually get assigned
+    """
+
+    def __init__(self, router, taxi_edges, pickup_edges, fallback, candidates=None, reachability=None, cache=None, v_type="car"):
+        """
+        Builds the matrix
+
+        Args:
+        - router: the local RoadRouter, or None if local routing is disabled
+        - taxi_edges: the edge each available taxi is currently on, one entry per row
+        - pickup_edges: the pickup edge of each pending reservation, one entry per column
+        - fallback: function (from_edge, to_edge) -> route object, used for edges the local router cannot handle
+        - candidates: optional list with one collection of column indices per row, only those pairs are evaluated. All pairs are evaluated if None
+        - reachability: optional RoadRouter whose strongly connected components are used to skip pairs without a route, defaults to the router
+        - cache: optional RouteCache shared across dispatches, routes the local router rebuilds for assigned pairs are stored in it
+        - v_type: the vehicle type used in the cache keys
+        """
+        self.router = router
+        self.fallback = fallback
+        self.cache = cache
+        self.v_type = v_type
+        self.source_edges, self.row_source = self._dedupe(taxi_edges) # distinct taxi edges, and the index of each row's edge among them
+        self.target_edges, self.col_target = self._dedupe(pickup_edges) # distinct pickup edges, and the index of each column's edge among them
+        self.block = np.full((len(self.source_edges), len(self.target_edges)), np.inf) # distinct taxi edge x distinct pickup edge route lengths
+        self.evaluated = np.zeros(self.block.shape, dtype=bool) # which entries of the block have been searched
+        self.trees = {} # (distinct source index, distinct target index) -> SearchTree from the local router that reached the target
+        self.known_routes = {} # (distinct source index, distinct target index) -> route object, for cached pairs and sources the local router does not know
+        self.num_searches = 0
+        self._lengths = None
+
+        reachability = reachability if reachability is not None else router
+        if reachability is not None:
+            self.evaluated |= ~reachability.reachability_matrix(self.source_edges, self.target_edges) # no search can find a route into a component that is not reachable
+
+        if candidates is None:
+            for s in range(len(self.source_edges)):
+                self._evaluate(s, range(len(self.target_edges)))
+        else:
+            self.add_candidates(candidates)
+
+    @staticmethod
+    def _dedupe(edges):
+        """
+        Returns the distinct edges (in order of first appearance) and, for every input entry, the index of its edge among them
+        """
+        distinct = {}
+        inverse = np.empty(len(edges), dtype=np.intp)
+        for i, edge_id in enumerate(edges):
+            inverse[i] = distinct.setdefault(edge_id, len(distinct))
+        return list(distinct.keys()), inverse
+
+    def add_candidates(self, candidates):
+        """
+        Evaluates more (taxi, reservation) pairs, running at most one search per distinct taxi edge
+
+        Args:
+        - candidates: dictionary or list mapping row indices to collections of column indices
+        """
+        targets_by_source = {}
+        items = candidates.items() if isinstance(candidates, dict) else enumerate(candidates)
+        for row, cols in items:
+            s = self.row_source[row]
+            targets_by_source.setdefault(s, set()).update(int(self.col_target[col]) for col in cols)
+        for s, targets in targets_by_source.items():
+            self._evaluate(s, targets)
+
+    def _evaluate(self, s, targets):
+        """
+        Runs one search from a distinct taxi edge to the given distinct pickup edges that have not been evaluated yet
+        """
+        targets = [t for t in targets if not self.evaluated[s, t]]
+        if not targets:
+            return
+        self._lengths = None
+        from_edge = self.source_edges[s]
+        local = self.router is not None and self.router.has_edge(from_edge)
+        if local and self.cache is not None: # the fallback does its own caching
+            missing = []
+            for t in targets:
+                route = self.cache.get(from_edge, self.target_edges[t], self.v_type)
+                if route is None:
+                    missing.append(t)
+                else:
+                    self._store(s, t, route)
+            targets = missing
+            if not targets:
+                return
+        self.num_searches += 1
+        tree = self.router.one_to_many(from_edge, [self.target_edges[t] for t in targets]) if local else None
+        for t in targets:
+            to_edge = self.target_edges[t]
+            if tree is not None:
+                self.evaluated[s, t] = True
+                length = tree.length_to(to_edge)
+                if length < np.inf:
+                    self.block[s, t] = length
+                    self.trees[(s, t)] = tree
+            else:
+                self._store(s, t, self.fallback(from_edge, to_edge))
+
+    def _store(self, s, t, route):
+        """
+        Records an already known route for an entry of the block
+        """
+        self.evaluated[s, t] = True
+        self.known_routes[(s, t)] = route
+        if route and route.edges:
+            self.block[s, t] = route.length
+
+    @property
+    def lengths(self):
+        """
+        Dense taxi x reservation matrix of route lengths, infinity where there is no route or the pair was not evaluated
+        """
+        if self._lengths is None:
+            self._lengths = self.block[np.ix_(self.row_source, self.col_target)]
+        return self._lengths
+
+    def reachable(self):
+        """
+        Returns a boolean taxi x reservation matrix that is True wherever a route is known to exist
+        """
+        return np.isfinite(self.lengths)
+
+    def fully_evaluated(self):
+        """
+        Returns, for every row and every column, whether all of its pairs have been evaluated
+        """
+        evaluated = self.evaluated[np.ix_(self.row_source, self.col_target)]
+        return evaluated.all(axis=1), evaluated.all(axis=0)
+
+    def all_evaluated(self, rows, cols):
+        """
+        Returns whether every pair between the given rows and columns has been evaluated
+        """
+        return bool(self.evaluated[np.ix_(self.row_source[list(rows)], self.col_target[list(cols)])].all())
+
+    def route(self, row, col):
+        """
+        Rebuilds the route from a taxi's edge to a reservation's pickup edge
+
+        Args:
+        - row: the taxi's row in the matrix
+        - col: the reservation's column in the matrix
+
+        Returns:
+        - the route object, its edges are empty if no route exists
+        """
+        s = int(self.row_source[row])
+        t = int(self.col_target[col])
+        if (s, t) in self.trees:
+            route = self.trees[(s, t)].route_to(self.target_edges[t])
+            if self.cache is not None:
+                self.cache.put(self.source_edges[s], self.target_edges[t], self.v_type, route)
+            return route
+        if (s, t) in self.known_routes:
+            return self.known_routes[(s, t)]
+        return self.fallback(self.source_edges[s], self.target_edges[t])
@@ -0,0 +1,74 @@
+import bisect
+import random
+
+
+class CruisingTable:
+    """
+    Destinations for empty taxis circling the map. Which destinations a taxi can reach only depends on the strongly connected component
+    of the edge it is on, so the reachable destinations are stored once per group of components that reach the same ones (in practice every
+    edge that reaches the main component shares a single list). Choosing a new destination is then one random draw from that list, skipping the
+    taxi's own edge, instead of copying the list of destinations and retrying routes until one works
+    """
+
+    def __init__(self, router, destinations):
+        """
+        Args:
+        - router: the RoadRouter whose strongly connected components decide reachability
+        - destinations: the IDs of the edges taxis may cruise to
+        """
+        self.router = router
+        self.destinations = list(destinations)
+        self.dest_components = [] # destination index -> component, -1 for edges the router does not know
+        self.dest_mask = 0 # bitmask of the components that hold a destination
+        for edge_id in self.destinations:
+            idx = router.edge_index.get(edge_id)
+            comp = router.component[idx] if idx is not None else -1
+            self.dest_components.append(comp)
+            if comp >= 0:
+                self.dest_mask |= 1 << comp
+        self.all_destinations = list(range(len(self.destinations)))
+        self.lists = {} # reachable destination components (bitmask) -> sorted indices of the reachable destinations
+        self.component_lists = {} # component -> its entry of lists
+        self.position = {edge_id: i for i, edge_id in enumerate(self.destinations)} # destination edge ID -> index
+
+    def reachable_from(self, from_edge):
+        """
+        Returns the sorted indices of the destinations that can be reached from an edge. Edges the router does not know (internal junction
+        edges) get every destination, like is_reachable answering None
+        """
+        idx = self.router.edge_index.get(from_edge)
+        if idx is None:
+            return self.all_destinations
+        comp = self.router.component[idx]
+        reachable = self.component_lists.get(comp)
+        if reachable is None:
+            key = self.router.component_reach[comp] & self.dest_mask
+            reachable = self.lists.get(key)
+            if reachable is None:
+                reachable = [i for i, dest_comp in enumerate(self.dest_components) if dest_comp >= 0 and (key >> dest_comp) & 1]
+                self.lists[key] = reachable
+            self.component_lists[comp] = reachable
+        return reachable
+
+    def draw(self, from_edge, rng=random):
+        """
+        Picks a random destination, other than from_edge itself, that can be reached from from_edge
+
+        Args:
+        - from_edge: the edge the taxi is on
+        - rng: the random number generator to draw with (anything with a random() method)
+
+        Returns:
+        - the ID of the destination edge, or None if no destination can be reached
+        """
+        reachable = self.reachable_from(from_edge)
+        own = self.position.get(from_edge)
+        rank = bisect.bisect_left(reachable, own) if own is not None else len(reachable)
+        excluded = rank < len(reachable) and reachable[rank] == own
+        count = len(reachable) - excluded
+        if count <= 0:
+            return None
+        pick = int(rng.random() * count)
+        if excluded and pick >= rank:
+            pick += 1 # skips the taxi's own edge
+        return self.destinations[reachable[pick]]
@@ -0,0 +1,182 @@
+import math
+import numpy as np
+from demand_trace import RideRequest
+
+# share of the day's reservations that depart in each period, as (period start, period end, share) with times in simulation seconds (300 s = 1 hour)
+DEPART_TIME_PROFILE = (
+    (0, 1800, 0.06), # midnight to 6am
+    (1800, 2400, 0.07), # 6am to 8am
+    (2400, 3000, 0.11), # 8am to 10am
+    (3000, 4200, 0.26), # 10am to 2pm
+    (4200, 4800, 0.11), # 2pm to 4pm
+    (4800, 5400, 0.09), # 4pm to 6pm
+    (5400, 6000, 0.13), # 6pm to 8pm
+    (6000, 6600, 0.11), # 8pm to 10pm
+    (6600, 7200, 0.06), # 10pm to midnight
+)
+
+
+class AliasTable:
+    """
+    Walker's alias method for drawing from a discrete distribution: O(n) to build, then every draw costs one uniform integer, one uniform float
+    and one comparison, so whole arrays of samples are drawn with a few NumPy operations
+    """
+
+    def __init__(self, weights):
+        """
+        Args:
+        - weights: non-negative weights of the outcomes 0..n-1, not necessarily normalized
+        """
+        weights = np.asarray(weights, dtype=float).ravel()
+        if len(weights) == 0 or weights.min() < 0 or weights.sum() <= 0:
+            raise ValueError("Alias table weights must be non-negative with a positive sum")
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # whatever is left over has a probability of 1 up to rounding errors
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng, size):
+        """
+        Draws size outcomes with a NumPy Generator
+        """
+        idx = rng.integers(0, len(self.prob), size)
+        return np.where(rng.random(size) < self.prob[idx], idx, self.alias[idx])
+
+
+class DemandBatch:
+    """
+    People drawn by a DemandGenerator, as parallel NumPy arrays
+    """
+
+    def __init__(self, edge_ids, depart_times, pickup_edges, dropoff_edges, pickup_positions, dropoff_positions):
+        self.edge_ids = edge_ids # edge index -> edge ID
+        self.depart_times = depart_times
+        self.pickup_edges = pickup_edges # edge indices
+        self.dropoff_edges = dropoff_edges
+        self.pickup_positions = pickup_positions
+        self.dropoff_positions = dropoff_positions
+
+    def __len__(self):
+        return len(self.depart_times)
+
+    def requests(self):
+        """
+        Returns the people as a list of RideRequests
+        """
+        edge_ids = self.edge_ids
+        return [RideRequest(depart_time, edge_ids[pickup], pickup_pos, edge_ids[dropoff], dropoff_pos)
+                for depart_time, pickup, pickup_pos, dropoff, dropoff_pos in zip(self.depart_times.tolist(), self.pickup_edges.tolist(), self.pickup_positions.tolist(),
+                                                                                  self.dropoff_edges.tolist(), self.dropoff_positions.tolist())]
+
+
+class DemandGenerator:
+    """
+    Draws people in bulk: depart times from a time-of-day profile, origin and destination zones from an OD matrix, and edges and lane positions
+    uniformly within the chosen zones. Zones are the cells of a square grid over the middle points of the edges. Without an OD matrix every pair
+    of zones is weighted by the product of their numbers of edges, which makes every pair of edges equally likely, as with choose_random_route
+    """
+
+    def __init__(self, net, edge_ids, zone_size=500.0, od_matrix=None, time_profile=DEPART_TIME_PROFILE, seed=None):
+        """
+        Args:
+        - net: the sumolib network
+        - edge_ids: the edges people can be placed on, every edge should be able to reach every other one
+        - zone_size: width and height of a zone in m
+        - od_matrix: optional (number of zones x number of zones) weights of trips from each zone to each zone, zones are ordered like zone_cells
+        - time_profile: (period start, period end, share) tuples, depart times are uniform within a period
+        - seed: seed of the NumPy random generator, for reproducible demand
+        """
+        if len(edge_ids) < 2:
+            raise ValueError("At least two edges are needed to generate demand")
+        self.rng = np.random.default_rng(seed)
+        self.edge_ids = list(edge_ids)
+        lengths = np.empty(len(self.edge_ids))
+        cells = []
+        for i, edge_id in enumerate(self.edge_ids):
+            lane = net.getEdge(edge_id).getLanes()[0]
+            lengths[i] = lane.getLength()
+            shape = lane.getShape()
+            mid_x, mid_y = shape[len(shape) // 2]
+            cells.append((int(math.floor(mid_x / zone_size)), int(math.floor(mid_y / zone_size))))
+        # safest to place people in the middle of their lanes, see create_reservation
+        self.pos_low = np.maximum(lengths / 4, 13)
+        self.pos_high = np.minimum(lengths * 3 / 4, lengths - 13)
+
+        self.zone_cells = sorted(set(cells)) # zone -> grid cell
+        zone_of_cell = {cell: zone for zone, cell in enumerate(self.zone_cells)}
+        edge_zones = np.array([zone_of_cell[cell] for cell in cells])
+        self.zone_edges = np.argsort(edge_zones, kind="stable") # edge indices grouped by zone
+        self.zone_counts = np.bincount(edge_zones, minlength=len(self.zone_cells))
+        self.zone_starts = np.concatenate(([0], np.cumsum(self.zone_counts)[:-1]))
+
+        num_zones = len(self.zone_cells)
+        if od_matrix is None:
+            od_matrix = np.outer(self.zone_counts, self.zone_counts).astype(float)
+        od_matrix = np.asarray(od_matrix, dtype=float)
+        if od_matrix.shape != (num_zones, num_zones):
+            raise ValueError(f"The OD matrix must be {num_zones} x {num_zones}, one row and column per zone")
+        self.od_table = AliasTable(od_matrix)
+        self.periods = np.array([(start, end) for start, end, _ in time_profile], dtype=float)
+        self.time_table = AliasTable([share for _, _, share in time_profile])
+
+    def _edges_in(self, zones):
+        """
+        Draws one edge uniformly from each of the given zones
+        """
+        offsets = np.floor(self.rng.random(len(zones)) * self.zone_counts[zones]).astype(np.int64)
+        return self.zone_edges[self.zone_starts[zones] + offsets]
+
+    def _draw_od(self, size):
+        od = self.od_table.sample(self.rng, size)
+        num_zones = len(self.zone_cells)
+        return self._edges_in(od // num_zones), self._edges_in(od % num_zones)
+
+    def generate(self, num_people, start_time=0.0, depart_time=None):
+        """
+        Draws people
+
+        Args:
+        - num_people: the number of people
+        - start_time: depart times earlier than this are moved to it, like people who would have departed before the simulation started
+        - depart_time: if given, every person departs at this time instead of at a time drawn from the profile
+
+        Returns:
+        - a DemandBatch
+        """
+        rng = self.rng
+        if depart_time is None:
+            periods = self.periods[self.time_table.sample(rng, num_people)]
+            depart_times = np.round(periods[:, 0] + rng.random(num_people) * (periods[:, 1] - periods[:, 0]), 1)
+            depart_times = np.maximum(depart_times, start_time)
+        else:
+            depart_times = np.full(num_people, float(depart_time))
+
+        pickups, dropoffs = self._draw_od(num_people)
+        same = np.flatnonzero(pickups == dropoffs) # a person has to go somewhere, these are drawn again
+        for _ in range(100):
+            if len(same) == 0:
+                break
+            pickups[same], dropoffs[same] = self._draw_od(len(same))
+            same = same[pickups[same] == dropoffs[same]]
+        if len(same) > 0:
+            raise ValueError("The OD matrix only allows trips that start and end on the same edge")
+
+        pickup_positions = self.pos_low[pickups] + rng.random(num_people) * (self.pos_high[pickups] - self.pos_low[pickups])
+        dropoff_positions = self.pos_low[dropoffs] + rng.random(num_people) * (self.pos_high[dropoffs] - self.pos_low[dropoffs])
+        return DemandBatch(self.edge_ids, depart_times, pickups, dropoffs, pickup_positions, dropoff_positions)
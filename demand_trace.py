@@ -0,0 +1,204 @@
+import gzip
+import json
+from collections import deque
+from spatial_index import GridIndex
+
+
+def safe_lane_pos(lane, pos):
+    """
+    Moves a position into the middle half of a lane (and at least 13 m from either end), where people can be placed without taxis
+    disappearing from the simulation when they reach them
+    """
+    low = max(lane.getLength()*(1/4), 13)
+    high = min(lane.getLength()*(3/4), lane.getLength()-13)
+    return min(max(pos, low), max(low, high))
+
+
+def open_trace(path):
+    """
+    Opens a trace file for reading text, gzip-compressed files are recognized by their first two bytes
+    """
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+class EdgeLocator:
+    """
+    Finds the edge closest to a point, for ride requests given as coordinates. Points are sampled along the first lane of every
+    candidate edge (the lane people are placed on) and kept in a GridIndex; the nearest samples give a few candidate edges, and the
+    exact closest position is then computed on the lane geometry of each candidate. The index is built on the first lookup, so traces
+    that only give edges never pay for it
+    """
+
+    def __init__(self, net, edge_ids, projection, spacing=10.0, candidates=4):
+        """
+        Args:
+        - net: the sumolib network
+        - edge_ids: the edges requests may be snapped to
+        - projection: the NetProjection of the network, used to convert longitude and latitude
+        - spacing: distance in m between the sampled points of a lane
+        - candidates: number of nearest sampled points whose edges are checked exactly
+        """
+        self.net = net
+        self.edge_ids = list(edge_ids)
+        self.projection = projection
+        self.spacing = spacing
+        self.candidates = candidates
+        self.index = None # GridIndex of (edge ID, sample number) -> sampled point
+
+    def _build_index(self):
+        self.index = GridIndex()
+        for edge_id in self.edge_ids:
+            shape = self.net.getEdge(edge_id).getLanes()[0].getShape()
+            sample = 0
+            for (x1, y1), (x2, y2) in zip(shape, shape[1:]):
+                length = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+                steps = max(1, int(length // self.spacing))
+                for step in range(steps + 1):
+                    self.index.update((edge_id, sample), x1 + (x2 - x1) * step / steps, y1 + (y2 - y1) * step / steps)
+                    sample += 1
+
+    def locate_xy(self, x, y):
+        """
+        Returns the closest (edge ID, lane position) to a point in network coordinates, or None if there are no edges
+        """
+        if self.index is None:
+            self._build_index()
+        best = None
+        for edge_id in {edge_id for edge_id, _ in self.index.nearest(x, y, self.candidates)}:
+            lane = self.net.getEdge(edge_id).getLanes()[0]
+            pos, dist = lane.getClosestLanePosAndDist((x, y))
+            if best is None or dist < best[2]:
+                best = (edge_id, pos, dist)
+        return None if best is None else (best[0], safe_lane_pos(self.net.getEdge(best[0]).getLanes()[0], best[1]))
+
+    def locate_lon_lat(self, lon, lat):
+        x, y = self.projection.from_lon_lat(lon, lat)
+        return self.locate_xy(float(x), float(y))
+
+
+class RideRequest:
+    """
+    One ride request, read from a trace or drawn by a DemandGenerator. Positions are None when only the edges are known, they are then chosen at random
+    """
+    __slots__ = ("depart_time", "pickup_edge", "pickup_pos", "dropoff_edge", "dropoff_pos")
+
+    def __init__(self, depart_time, pickup_edge, pickup_pos, dropoff_edge, dropoff_pos):
+        self.depart_time = depart_time
+        self.pickup_edge = pickup_edge
+        self.pickup_pos = pickup_pos
+        self.dropoff_edge = dropoff_edge
+        self.dropoff_pos = dropoff_pos
+
+
+class TraceDemand:
+    """
+    Replays ride requests from a JSON Lines file (optionally gzip-compressed), one request per line, in order of time:
+    - {"time": 2450.0, "pickup_edge": "...", "dropoff_edge": "...", "pickup_pos": 20.0, "dropoff_pos": 35.5} (positions are optional), or
+    - {"time": 2450.0, "pickup_lon": -95.36, "pickup_lat": 29.76, "dropoff_lon": -95.35, "dropoff_lat": 29.75}
+    where time is in simulation seconds (0-7200). The file is read lazily: only the requests within the lookahead window, and at
+    most max_buffered of them, are parsed and snapped to edges ahead of time, so a trace of any length is replayed in bounded memory.
+    Requests before the start time, on edges that are not valid, or that cannot be parsed are skipped and counted
+    """
+
+    def __init__(self, path, valid_edges, locator, start_time=0.0, lookahead=600.0, max_buffered=10000):
+        """
+        Args:
+        - path: the trace file
+        - valid_edges: the edges people can be placed on, requests on other edges are skipped
+        - locator: the EdgeLocator used for requests given as coordinates
+        - start_time: the simulation time the replay starts at, earlier requests are skipped
+        - lookahead: how far ahead of the current time (in s) requests are read
+        - max_buffered: the most requests kept in memory at once
+        """
+        self.path = path
+        self.valid_edges = set(valid_edges)
+        self.locator = locator
+        self.start_time = start_time
+        self.lookahead = lookahead
+        self.max_buffered = max_buffered
+        self.buffer = deque() # RideRequests read ahead, in file order
+        self.file = open_trace(path)
+        self.line_number = 0
+        self.exhausted = False
+        self.stats = {"read": 0, "released": 0, "skipped_early": 0, "skipped_invalid": 0}
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        self.exhausted = True
+
+    def _next_trip(self):
+        """
+        Reads lines until one holds a usable request, returns None at the end of the file
+        """
+        for line in self.file:
+            self.line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            self.stats["read"] += 1
+            try:
+                record = json.loads(line)
+                if float(record["time"]) < self.start_time: # checked before snapping, so fast-forwarding to the start time is cheap
+                    self.stats["skipped_early"] += 1
+                    continue
+                trip = self._parse(record)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping line {self.line_number} of {self.path}: {e}")
+                trip = None
+            if trip is None:
+                self.stats["skipped_invalid"] += 1
+            else:
+                return trip
+        self.close()
+        return None
+
+    def _parse(self, record):
+        depart_time = float(record["time"])
+        ends = []
+        for end in ("pickup", "dropoff"):
+            if f"{end}_edge" in record:
+                edge_id = record[f"{end}_edge"]
+                pos = record.get(f"{end}_pos")
+                if edge_id not in self.valid_edges:
+                    return None
+                if pos is not None:
+                    pos = safe_lane_pos(self.locator.net.getEdge(edge_id).getLanes()[0], float(pos))
+                ends.append((edge_id, pos))
+            else:
+                located = self.locator.locate_lon_lat(float(record[f"{end}_lon"]), float(record[f"{end}_lat"]))
+                if located is None:
+                    return None
+                ends.append(located)
+        (pickup_edge, pickup_pos), (dropoff_edge, dropoff_pos) = ends
+        if pickup_edge == dropoff_edge:
+            return None
+        return RideRequest(depart_time, pickup_edge, pickup_pos, dropoff_edge, dropoff_pos)
+
+    def fill(self, current_time):
+        """
+        Reads requests until the buffer reaches past the lookahead window or holds max_buffered requests
+        """
+        horizon = current_time + self.lookahead
+        while not self.exhausted and len(self.buffer) < self.max_buffered and (not self.buffer or self.buffer[-1].depart_time <= horizon):
+            trip = self._next_trip()
+            if trip is not None:
+                self.buffer.append(trip)
+
+    def pop_due(self, current_time):
+        """
+        Removes and returns the buffered requests whose time is not later than current_time, in file order
+        """
+        self.fill(current_time)
+        due = []
+        while self.buffer and self.buffer[0].depart_time <= current_time:
+            due.append(self.buffer.popleft())
+        self.stats["released"] += len(due)
+        return due
+
+    def __len__(self):
+        return len(self.buffer)
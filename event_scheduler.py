@@ -0,0 +1,54 @@
+import heapq
+import itertools
+
+# kinds of timed events in the simulation loop
+TAXI_RETURN = "taxi_return" # an out of commission taxi can be put back into the simulation, the payload is the taxi ID
+PRICE_PERIOD = "price_period" # a new period of the day starts, with its own demand multiplier, time of day rate and electricity price
+DISPATCH = "dispatch" # the optimized version assigns taxis
+OUTPUT = "output" # the significant data is printed
+
+
+class EventScheduler:
+    """
+    Timed events of the simulation loop, kept in a min-heap by time, so that each step only touches the events that are due instead of
+    checking every timer and every out of commission taxi. Events are never cancelled: whoever handles an event checks that it still
+    applies (e.g. that the taxi is still out of commission with the same return time) and ignores it otherwise
+    """
+
+    def __init__(self):
+        self.heap = [] # (time, sequence number, kind, payload)
+        self.sequence = itertools.count() # keeps events with the same time in the order they were scheduled
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, time, kind, payload=None):
+        """
+        Adds an event
+
+        Args:
+        - time: the simulation time the event is due at
+        - kind: what kind of event it is, one of the constants of this module
+        - payload: whatever the handler of the event needs
+        """
+        heapq.heappush(self.heap, (time, next(self.sequence), kind, payload))
+
+    def next_time(self):
+        """
+        Returns the time of the earliest event, None if there are no events
+        """
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, current_time):
+        """
+        Removes every event whose time is not later than current_time
+
+        Returns:
+        - a dictionary of kind -> [(time, payload), ...] in order of time, only for the kinds that have due events
+        """
+        due = {}
+        heap = self.heap
+        while heap and heap[0][0] <= current_time:
+            time, _, kind, payload = heapq.heappop(heap)
+            due.setdefault(kind, []).append((time, payload))
+        return due
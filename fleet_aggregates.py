@@ -0,0 +1,202 @@
+import heapq
+
+
+class GrowingValues:
+    """
+    Running total, minimum and maximum of keyed values that only ever grow, such as the wait time of a reservation (which is added to
+    again when a reservation is picked up a second time) or the energy used by a taxi. The maximum is kept directly, the minimum
+    with a heap whose outdated entries are dropped when they reach the top
+    """
+
+    def __init__(self, track_minimum=True):
+        """
+        Args:
+        - track_minimum: whether the minimum is needed, values that change every step are cheaper to keep without it
+        """
+        self.values = {} # key -> current value
+        self.total = 0.0
+        self.maximum = None
+        self.track_minimum = track_minimum
+        self.heap = [] # (value, key), may contain outdated values of keys that have grown since
+        self.version = 0 # goes up whenever a value changes or a key is added, so that copies of values are only remade when needed
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, key, amount):
+        """
+        Adds a non-negative amount to the value of a key, keys start out at 0
+        """
+        if amount == 0 and key in self.values:
+            return
+        value = self.values.get(key, 0.0) + amount
+        self.values[key] = value
+        self.version += 1
+        self.total += amount
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if self.track_minimum:
+            heapq.heappush(self.heap, (value, key))
+            if len(self.heap) > 2 * len(self.values) + 16: # too many outdated entries, rebuilds the heap from the current values
+                self.heap = [(current, current_key) for current_key, current in self.values.items()]
+                heapq.heapify(self.heap)
+
+    def set(self, key, value):
+        """
+        Replaces the value of a key with a value that is at least as large
+        """
+        self.add(key, value - self.values.get(key, 0.0))
+
+    def minimum(self):
+        if not self.track_minimum:
+            raise ValueError("The minimum is not tracked")
+        while self.heap:
+            value, key = self.heap[0]
+            if self.values[key] == value:
+                return value
+            heapq.heappop(self.heap)
+        return None
+
+    def mean(self):
+        return self.total / len(self.values) if self.values else None
+
+
+class TaxiTotals:
+    """
+    What one taxi has earned and spent so far
+    """
+    __slots__ = ("trips", "earnings", "charging_trips", "charging_cost", "tows", "tow_cost")
+
+    def __init__(self):
+        self.trips = 0
+        self.earnings = 0.0 # in $
+        self.charging_trips = 0
+        self.charging_cost = 0.0 # in $, base prices included
+        self.tows = 0
+        self.tow_cost = 0.0 # in $, base prices included
+
+
+class FleetAggregates:
+    """
+    Keeps the simulation's financial and fleet totals up to date as trips are completed, taxis charge, taxis are towed, reservations
+    are picked up and energy is used, so that every total, average, minimum and maximum is available without going over the history.
+    Money is kept per taxi so that taxis removed from the fleet stop counting, like they did when the totals were recomputed over the
+    current taxis. Wait times, energy and distance keep counting removed taxis, as before
+    """
+
+    def __init__(self, ride_base_price, ride_distance_rate, charge_base_price, tow_base_price):
+        """
+        Args:
+        - ride_base_price: the base price of a taxi ride in $
+        - ride_distance_rate: the price of a taxi ride per km in $
+        - charge_base_price: the base price of a charging trip in $
+        - tow_base_price: the base price of a tow in $
+        """
+        self.ride_base_price = ride_base_price
+        self.ride_distance_rate = ride_distance_rate
+        self.charge_base_price = charge_base_price
+        self.tow_base_price = tow_base_price
+        self.taxis = {} # taxi ID -> TaxiTotals
+        self.removed_taxis = set() # IDs of taxis whose money no longer counts towards the totals
+        self.trips = 0
+        self.earnings = 0.0
+        self.charging_trips = 0
+        self.charging_cost = 0.0
+        self.tows = 0
+        self.tow_cost = 0.0
+        self.wait_times = GrowingValues() # reservation ID -> total wait time in s
+        self.energy = GrowingValues(track_minimum=False) # taxi ID -> energy used in Wh
+        self.distance = GrowingValues(track_minimum=False) # taxi ID -> distance driven in km
+
+    def _taxi(self, taxi_id):
+        totals = self.taxis.get(taxi_id)
+        if totals is None:
+            totals = self.taxis[taxi_id] = TaxiTotals()
+        return totals
+
+    def record_trip(self, taxi_id, trip_length, demand_multiplier, tod_rate):
+        """
+        Records a completed reservation
+
+        Args:
+        - taxi_id: the taxi that completed the reservation
+        - trip_length: the length of the trip in m
+        - demand_multiplier, tod_rate: the demand multiplier and time of day rate when the trip was completed
+
+        Returns:
+        - what the trip earned in $
+        """
+        trip_earnings = self.ride_base_price + ((trip_length / 1000 * self.ride_distance_rate) * demand_multiplier * tod_rate)
+        totals = self._taxi(taxi_id)
+        totals.trips += 1
+        totals.earnings += trip_earnings
+        if taxi_id not in self.removed_taxis:
+            self.trips += 1
+            self.earnings += trip_earnings
+        return trip_earnings
+
+    def record_charge(self, taxi_id, price_of_charge):
+        """
+        Records a charging trip, price_of_charge is the price of the electricity in $, the base price is added here
+        """
+        cost = self.charge_base_price + price_of_charge
+        totals = self._taxi(taxi_id)
+        totals.charging_trips += 1
+        totals.charging_cost += cost
+        if taxi_id not in self.removed_taxis:
+            self.charging_trips += 1
+            self.charging_cost += cost
+
+    def record_tow(self, taxi_id, price_of_charge):
+        """
+        Records a tow, price_of_charge is the price of the electricity in $, the base price is added here
+        """
+        cost = self.tow_base_price + price_of_charge
+        totals = self._taxi(taxi_id)
+        totals.tows += 1
+        totals.tow_cost += cost
+        if taxi_id not in self.removed_taxis:
+            self.tows += 1
+            self.tow_cost += cost
+
+    def record_wait(self, res_id, wait_time):
+        """
+        Adds to the wait time of a reservation that has just been picked up
+        """
+        self.wait_times.add(res_id, wait_time)
+
+    def record_energy(self, taxi_id, energy):
+        """
+        Adds the energy in Wh a taxi used during a step
+        """
+        self.energy.add(taxi_id, energy)
+
+    def set_distance(self, taxi_id, distance):
+        """
+        Sets the total distance in km a taxi has driven
+        """
+        self.distance.set(taxi_id, distance)
+
+    def remove_taxi(self, taxi_id):
+        """
+        Stops counting a taxi's earnings and costs, for taxis that are removed from the fleet
+        """
+        if taxi_id in self.removed_taxis:
+            return
+        self.removed_taxis.add(taxi_id)
+        totals = self.taxis.get(taxi_id)
+        if totals is not None:
+            self.trips -= totals.trips
+            self.earnings -= totals.earnings
+            self.charging_trips -= totals.charging_trips
+            self.charging_cost -= totals.charging_cost
+            self.tows -= totals.tows
+            self.tow_cost -= totals.tow_cost
+
+    @property
+    def total_cost(self):
+        return self.charging_cost + self.tow_cost
+
+    @property
+    def profit(self):
+        return self.earnings - self.total_cost
@@ -0,0 +1,180 @@
+from traci import constants as tc
+
+BATTERY_PARAM = "device.battery.actualBatteryCapacity"
+SUBSCRIBED_VARS = [tc.VAR_ELECTRICITYCONSUMPTION, tc.VAR_DISTANCE, tc.VAR_ROAD_ID, tc.VAR_LANE_ID, tc.VAR_LANEPOSITION, tc.VAR_POSITION, tc.VAR_PARAMETER]
+
+
+class VehicleState:
+    """
+    The values of one taxi at the current simulation step
+    """
+    __slots__ = ("electricity_consumption", "distance", "road_id", "lane_id", "lane_position", "position", "battery")
+
+    def __init__(self, electricity_consumption, distance, road_id, lane_id, lane_position, position, battery):
+        self.electricity_consumption = electricity_consumption # in Wh/s
+        self.distance = distance # distance driven since the taxi was inserted, in m
+        self.road_id = road_id
+        self.lane_id = lane_id
+        self.lane_position = lane_position # in m from the start of the lane
+        self.position = position # (x, y) in network coordinates
+        self.battery = battery # actual battery capacity in Wh
+
+
+class FleetState:
+    """
+    Per-step snapshot of every taxi in the simulation. Each taxi is subscribed to the variables the simulation loop needs, so that one
+    getAllSubscriptionResults call per step replaces several calls per taxi. Values only change when the simulation steps, except for
+    writes made by the runner itself, which have to go through set_battery and remove so that the snapshot stays correct
+    """
+
+    def __init__(self, backend):
+        """
+        Args:
+        - backend: the traci module, libsumo, or any object with the same vehicle API (for example StandInBackend)
+        """
+        self.backend = backend
+        self.ids = [] # IDs of the vehicles in the simulation, in TraCI's order
+        self.states = {} # vehicle ID -> VehicleState for the current step
+        self.round_trips = 0 # number of calls made to the backend, reported in the status of every snapshot
+
+    def __contains__(self, taxi_id):
+        return taxi_id in self.states
+
+    def refresh(self):
+        """
+        Reads the state of every vehicle after a simulation step. Vehicles without a subscription (new vehicles, or vehicles that were
+        removed and added again) are subscribed first, which also returns their current values
+        """
+        vehicle = self.backend.vehicle
+        self.ids = list(vehicle.getIDList())
+        results = vehicle.getAllSubscriptionResults()
+        self.round_trips += 2
+        self.states = {}
+        for taxi_id in self.ids:
+            values = results.get(taxi_id)
+            if not values:
+                vehicle.subscribe(taxi_id, SUBSCRIBED_VARS, parameters={tc.VAR_PARAMETER: BATTERY_PARAM})
+                values = vehicle.getSubscriptionResults(taxi_id)
+                self.round_trips += 2
+            self.states[taxi_id] = VehicleState(
+                values[tc.VAR_ELECTRICITYCONSUMPTION],
+                values[tc.VAR_DISTANCE],
+                values[tc.VAR_ROAD_ID],
+                values[tc.VAR_LANE_ID],
+                values[tc.VAR_LANEPOSITION],
+                values[tc.VAR_POSITION],
+                float(values[tc.VAR_PARAMETER]),
+            )
+
+    def get(self, taxi_id):
+        """
+        Returns the VehicleState of a taxi, or None if it is not in the simulation
+        """
+        return self.states.get(taxi_id)
+
+    def battery(self, taxi_id):
+        return self.states[taxi_id].battery
+
+    def road_id(self, taxi_id):
+        return self.states[taxi_id].road_id
+
+    def lane_position(self, taxi_id):
+        return self.states[taxi_id].lane_position
+
+    def set_battery(self, taxi_id, battery):
+        """
+        Sets the actual battery capacity of a taxi in the simulation and in the snapshot
+        """
+        self.backend.vehicle.setParameter(taxi_id, BATTERY_PARAM, str(battery)) # libsumo only accepts strings
+        self.round_trips += 1
+        if taxi_id in self.states:
+            self.states[taxi_id].battery = float(battery)
+
+    def remove(self, taxi_id):
+        """
+        Removes a taxi from the simulation and from the snapshot
+        """
+        self.backend.vehicle.remove(taxi_id)
+        self.round_trips += 1
+        self.discard(taxi_id)
+
+    def discard(self, taxi_id):
+        """
+        Drops a taxi from the snapshot, for taxis that were removed from the simulation by other means
+        """
+        if self.states.pop(taxi_id, None) is not None:
+            self.ids.remove(taxi_id)
+
+class _StandInVehicleDomain:
+    """
+    The subset of traci.vehicle used by FleetState, backed by plain dictionaries
+    """
+
+    def __init__(self):
+        self.vehicles = {} # vehicle ID -> dictionary of variable ID -> value
+        self.subscriptions = set()
+
+    def getIDList(self):
+        return tuple(self.vehicles.keys())
+
+    def subscribe(self, taxi_id, var_ids=None, begin=None, end=None, parameters=None):
+        if taxi_id not in self.vehicles:
+            raise KeyError(f"Vehicle '{taxi_id}' is not known.")
+        self.subscriptions.add(taxi_id)
+
+    def getSubscriptionResults(self, taxi_id):
+        return dict(self.vehicles[taxi_id]) if taxi_id in self.subscriptions else {}
+
+    def getAllSubscriptionResults(self):
+        return {taxi_id: dict(self.vehicles[taxi_id]) for taxi_id in self.subscriptions}
+
+    def setParameter(self, taxi_id, key, value):
+        if key == BATTERY_PARAM:
+            self.vehicles[taxi_id][tc.VAR_PARAMETER] = str(value)
+
+    def remove(self, taxi_id):
+        del self.vehicles[taxi_id]
+        self.subscriptions.discard(taxi_id)
+
+
+class StandInBackend:
+    """
+    Pure-Python replacement for the traci module that supports exactly what FleetState needs, so that the fleet state can be
+    exercised without SUMO. Vehicles are placed and moved by hand with add and move
+    """
+
+    def __init__(self):
+        self.vehicle = _StandInVehicleDomain()
+
+    def add(self, taxi_id, road_id, lane_position=0.0, battery=8000.0, position=(0.0, 0.0)):
+        self.vehicle.vehicles[taxi_id] = {
+            tc.VAR_ELECTRICITYCONSUMPTION: 0.0,
+            tc.VAR_DISTANCE: 0.0,
+            tc.VAR_ROAD_ID: road_id,
+            tc.VAR_LANE_ID: f"{road_id}_0",
+            tc.VAR_LANEPOSITION: lane_position,
+            tc.VAR_POSITION: position,
+            tc.VAR_PARAMETER: str(battery),
+        }
+
+    def move(self, taxi_id, road_id, lane_position, distance, consumption, step_length=0.5, position=None):
+        """
+        Moves a vehicle as if one simulation step had passed
+
+        Args:
+        - taxi_id: the ID of the vehicle
+        - road_id, lane_position: the vehicle's new location
+        - distance: the distance driven during the step in m
+        - consumption: the electricity consumption during the step in Wh/s, the energy used is also taken out of the battery
+        - step_length: the length of the step in s
+        - position: optional new (x, y) in network coordinates
+        """
+        values = self.vehicle.vehicles[taxi_id]
+        values[tc.VAR_ROAD_ID] = road_id
+        values[tc.VAR_LANE_ID] = f"{road_id}_0"
+        values[tc.VAR_LANEPOSITION] = lane_position
+        if position is not None:
+            values[tc.VAR_POSITION] = position
+        values[tc.VAR_DISTANCE] += distance
+        values[tc.VAR_ELECTRICITYCONSUMPTION] = consumption
+        values[tc.VAR_PARAMETER] = str(float(values[tc.VAR_PARAMETER]) - consumption * step_length)
@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+
+ENTITY_KINDS = ("taxis", "passengers")
+
+
+def diff_frames(previous, current):
+    """
+    Returns what changed between two frames
+
+    Args:
+    - previous: the last frame a client was sent
+    - current: the newest frame
+
+    Returns:
+    - a dictionary with the time, the added or changed entries of each kind, and the IDs removed since the previous frame,
+      or None if nothing changed
+    """
+    delta = {"time": current["time"]}
+    changed_any = False
+    for kind in ENTITY_KINDS:
+        old = previous[kind]
+        new = current[kind]
+        changed = {entity_id: values for entity_id, values in new.items() if old.get(entity_id) != values}
+        removed = [entity_id for entity_id in old if entity_id not in new]
+        delta[kind] = changed
+        delta[f"removed_{kind}"] = removed
+        changed_any = changed_any or bool(changed) or bool(removed)
+    return delta if changed_any else None
+
+
+def format_event(event, data, event_id=None):
+    """
+    Formats one server-sent event
+    """
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class FleetStream:
+    """
+    Pushes taxi and passenger updates to any number of server-sent event clients. The simulation thread publishes each step's
+    StateSnapshot, every client gets a keyframe with the full state when it connects, followed by deltas that only contain
+    what changed. Each client is rate-limited on its own, a client that falls behind skips the snapshots it missed and gets a single
+    delta against the last frame it was sent. A snapshot is converted into a frame (longitude and latitude included) only once,
+    however many clients are connected, with one projection call per kind of object
+    """
+
+    def __init__(self, to_lat_lon_dict, heartbeat=15.0):
+        """
+        Args:
+        - to_lat_lon_dict: function converting lists of IDs, x and y network coordinates to {id: {'lat': ..., 'lon': ...}}
+        - heartbeat: wall-clock seconds without a new snapshot after which a comment is sent to keep the connection open
+        """
+        self.to_lat_lon_dict = to_lat_lon_dict
+        self.heartbeat = heartbeat
+        self.condition = threading.Condition() # guards snapshot, version, closed and num_clients, and wakes clients up on every publish
+        self.snapshot = None
+        self.version = 0 # incremented on every publish
+        self.closed = False
+        self.num_clients = 0
+        self.frame_lock = threading.Lock()
+        self.frame_cache = (0, None) # (version, frame) of the last frame that was built
+
+    def publish(self, snapshot):
+        """
+        Makes a new snapshot available to the clients, called by the simulation thread after every step
+        """
+        with self.condition:
+            self.snapshot = snapshot
+            self.version += 1
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        Ends every client's stream, called when the simulation ends
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def _frame(self, version, snapshot):
+        """
+        Returns the frame of a snapshot, building it if no client has done so yet
+        """
+        with self.frame_lock:
+            if self.frame_cache[0] == version:
+                return self.frame_cache[1]
+            taxi_positions = self.to_lat_lon_dict([taxi.taxi_id for taxi in snapshot.taxis], [taxi.x for taxi in snapshot.taxis], [taxi.y for taxi in snapshot.taxis])
+            taxis = {}
+            for taxi in snapshot.taxis:
+                position = taxi_positions[taxi.taxi_id]
+                # rounding keeps positions to about 10 cm and battery levels to 0.1 %, so that tiny changes do not end up in the deltas
+                taxis[taxi.taxi_id] = {
+                    "lat": round(position["lat"], 6),
+                    "lon": round(position["lon"], 6),
+                    "battery": round(taxi.battery_level, 1),
+                    "state": taxi.state,
+                    "color": taxi.color,
+                }
+            passenger_positions = self.to_lat_lon_dict([passenger.person_id for passenger in snapshot.passengers], [passenger.x for passenger in snapshot.passengers], [passenger.y for passenger in snapshot.passengers])
+            passengers = {person_id: {"lat": round(position["lat"], 6), "lon": round(position["lon"], 6)} for person_id, position in passenger_positions.items()}
+            frame = {"time": snapshot.time, "taxis": taxis, "passengers": passengers}
+            self.frame_cache = (version, frame)
+            return frame
+
+    def events(self, max_rate=5.0):
+        """
+        Generator of the server-sent events for one client. Ends when the stream is closed
+
+        Args:
+        - max_rate: the maximum number of updates per wall-clock second sent to this client, 0 for no limit
+
+        Returns:
+        - an iterator of event strings: one "keyframe" event, then "delta" events, then an "end" event
+        """
+        min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        with self.condition:
+            self.num_clients += 1
+        try:
+            sent_version = 0
+            sent_frame = None
+            last_send = None
+            while True:
+                if last_send is not None:
+                    remaining = last_send + min_interval - time.perf_counter()
+                    if remaining > 0:
+                        time.sleep(remaining) # snapshots published in the meantime are coalesced into the next delta
+                with self.condition:
+                    if not self.closed and self.version == sent_version:
+                        self.condition.wait(self.heartbeat)
+                    closed = self.closed
+                    version = self.version
+                    snapshot = self.snapshot
+                if version != sent_version and snapshot is not None:
+                    frame = self._frame(version, snapshot)
+                    if sent_frame is None:
+                        yield format_event("keyframe", frame, version)
+                    else:
+                        delta = diff_frames(sent_frame, frame)
+                        if delta is not None:
+                            yield format_event("delta", delta, version)
+                    sent_version = version
+                    sent_frame = frame
+                    last_send = time.perf_counter()
+                elif not closed:
+                    yield ": keepalive\n\n"
+                if closed:
+                    yield format_event("end", {"time": sent_frame["time"] if sent_frame is not None else None})
+                    return
+        finally:
+            with self.condition:
+                self.num_clients -= 1
@@ -0,0 +1,89 @@
+import xml.etree.ElementTree as ET
+import numpy as np
+from pyproj import CRS, Transformer
+
+
+class NetProjection:
+    """
+    Converts SUMO network coordinates to longitude and latitude the same way SUMO does (traci.simulation.convertGeo):
+    the net offset is removed, then the net's projection is inverted. The projection parameters are read once, and whole
+    NumPy arrays of points are converted in a single pyproj call
+    """
+
+    def __init__(self, proj_parameter, net_offset):
+        """
+        Args:
+        - proj_parameter: the projParameter of the net's location element, a proj string or "!" for a net without projection
+        - net_offset: (x, y) netOffset of the net's location element
+        """
+        self.proj_parameter = proj_parameter
+        self.offset_x, self.offset_y = float(net_offset[0]), float(net_offset[1])
+        if proj_parameter == "!":
+            self.transformer = None # the net is not geo-referenced, network coordinates minus the offset are returned as they are
+            self.inverse_transformer = None
+        else:
+            self.transformer = Transformer.from_crs(CRS.from_user_input(proj_parameter), CRS.from_epsg(4326), always_xy=True)
+            self.inverse_transformer = Transformer.from_crs(CRS.from_epsg(4326), CRS.from_user_input(proj_parameter), always_xy=True)
+
+    @classmethod
+    def from_net(cls, net):
+        """
+        Creates the projection of a network loaded with sumolib
+        """
+        return cls(net._location["projParameter"], net.getLocationOffset())
+
+    @classmethod
+    def from_net_file(cls, net_file):
+        """
+        Creates the projection of a .net.xml file, only reading the file up to its location element
+        """
+        for _, elem in ET.iterparse(net_file, events=("start",)):
+            if elem.tag == "location":
+                return cls(elem.get("projParameter"), elem.get("netOffset").split(","))
+        raise ValueError(f"{net_file} has no location element")
+
+    def to_lon_lat(self, x, y):
+        """
+        Converts network coordinates to longitude and latitude
+
+        Args:
+        - x, y: numbers or arrays of the same shape
+
+        Returns:
+        - lon, lat as NumPy arrays of the same shape as the inputs
+        """
+        x = np.asarray(x, dtype=float) - self.offset_x
+        y = np.asarray(y, dtype=float) - self.offset_y
+        if self.transformer is None:
+            return x, y
+        lon, lat = self.transformer.transform(x, y)
+        return np.asarray(lon), np.asarray(lat)
+
+    def from_lon_lat(self, lon, lat):
+        """
+        Converts longitude and latitude to network coordinates, the inverse of to_lon_lat
+
+        Args:
+        - lon, lat: numbers or arrays of the same shape
+
+        Returns:
+        - x, y as NumPy arrays of the same shape as the inputs
+        """
+        x = np.asarray(lon, dtype=float)
+        y = np.asarray(lat, dtype=float)
+        if self.inverse_transformer is not None:
+            x, y = self.inverse_transformer.transform(x, y)
+        return np.asarray(x) + self.offset_x, np.asarray(y) + self.offset_y
+
+    def to_lat_lon_dict(self, ids, x, y):
+        """
+        Converts many points at once into the {id: {'lat': ..., 'lon': ...}} dictionaries returned by the endpoints
+
+        Args:
+        - ids: the IDs of the points
+        - x, y: sequences of network coordinates, in the same order as ids
+        """
+        if len(ids) == 0:
+            return {}
+        lon, lat = self.to_lon_lat(x, y)
+        return {point_id: {'lat': point_lat, 'lon': point_lon} for point_id, point_lat, point_lon in zip(ids, lat.tolist(), lon.tolist())}
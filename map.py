@@ -1,73 +1,253 @@
 import xml.etree.ElementTree as ET
+import argparse
+import gzip
 import json
-from pyproj import Transformer
-
-# Parse the .net.xml file
-tree = ET.parse('downtown_houston.net.xml')
-root = tree.getroot()
-
-# Create a transformer from UTM Zone 15N to WGS84
-transformer = Transformer.from_crs("EPSG:32615", "EPSG:4326", always_xy=True)
-
-# Dictionaries to store nodes and features
-nodes = {}
-features = []
-
-# Extract nodes (junctions)
-for node in root.findall('junction'):
-    node_id = node.get('id')
-    x = float(node.get('x'))
-    y = float(node.get('y'))
-    # Transform coordinates from UTM to WGS84
-    lon, lat = transformer.transform(x, y)
-    nodes[node_id] = (lon, lat)
-
-# Extract edges
-for edge in root.findall('edge'):
-    if edge.get('function') == 'internal':
-        continue  # Skip internal edges
-    edge_id = edge.get('id')
-
-    # Handle edges with multiple lanes
-    lanes = edge.findall('lane')
-    for lane in lanes:
-        shape = lane.get('shape')
-        if not shape:
+import math
+import os
+import numpy as np
+from geo_projection import NetProjection
+
+try:
+    import brotli
+except ImportError:
+    brotli = None # brotli files are only written if the brotli package is installed, gzip is always available
+
+# Levels of detail: (name, simplification tolerance in m, whether every lane is kept, decimals of the coordinates)
+# "full" is written to network.geojson as before. The coarser levels keep one lane per edge, lanes of the same edge are only a few
+# meters apart and cannot be told apart when zoomed out
+LEVELS_OF_DETAIL = (
+    ("full", 0.0, True, 6),
+    ("medium", 1.0, False, 6),
+    ("low", 5.0, False, 5),
+)
+
+
+def simplify(points, tolerance):
+    """
+    Simplifies a polyline with the Douglas-Peucker algorithm
+
+    Args:
+    - points: NumPy array of shape (n, 2), in meters
+    - tolerance: the maximum distance in meters between the original and the simplified line, 0 keeps every point
+
+    Returns:
+    - the indices of the points that are kept, always including the first and the last
+    """
+    num_points = len(points)
+    if tolerance <= 0 or num_points <= 2:
+        return np.arange(num_points)
+    keep = np.zeros(num_points, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, num_points - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
             continue
-        # Parse the shape into coordinate pairs
-        coords = []
-        for point in shape.strip().split(' '):
-            x_str, y_str = point.split(',')
-            x = float(x_str)
-            y = float(y_str)
-            lon, lat = transformer.transform(x, y)
-            coords.append([lon, lat])
-
-        # Create a LineString feature
-        feature = {
+        start = points[first]
+        direction = points[last] - start
+        inner = points[first + 1:last] - start
+        norm = math.hypot(direction[0], direction[1])
+        if norm == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(direction[0] * inner[:, 1] - direction[1] * inner[:, 0]) / norm
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def read_lanes(net_file):
+    """
+    Streams a .net.xml file and collects the shapes of all non-internal lanes, every element is freed once it has been read
+
+    Returns:
+    - the NetProjection of the network
+    - list of (properties, index of the lane within its edge, NumPy array of the shape points in network coordinates)
+    """
+    projection = None
+    lanes = []
+    for _, elem in ET.iterparse(net_file, events=("end",)):
+        if elem.tag == "location":
+            projection = NetProjection(elem.get("projParameter"), elem.get("netOffset").split(","))
+        elif elem.tag == "edge":
+            if elem.get("function") != "internal": # internal edges are only used inside junctions
+                edge_id = elem.get("id")
+                for lane_index, lane in enumerate(elem.findall("lane")):
+                    shape = lane.get("shape")
+                    if not shape:
+                        continue
+                    points = np.array([[float(value) for value in point.split(",")[:2]] for point in shape.strip().split(" ")])
+                    properties = {
+                        "id": edge_id,
+                        "lane_id": lane.get("id"),
+                        "speed": lane.get("speed"),
+                        "allow": lane.get("allow"),
+                        "disallow": lane.get("disallow"),
+                    }
+                    lanes.append((properties, lane_index, points))
+            elem.clear()
+        elif elem.tag in ("junction", "connection", "request", "roundabout"):
+            elem.clear()
+    if projection is None:
+        raise ValueError(f"{net_file} has no location element")
+    return projection, lanes
+
+
+def build_features(projection, lanes, tolerance, all_lanes, decimals):
+    """
+    Builds the GeoJSON features of one level of detail. Shapes are simplified in network coordinates, then every remaining point
+    is projected with a single call
+
+    Returns:
+    - list of GeoJSON LineString features
+    """
+    selected = []
+    shape_x = []
+    shape_y = []
+    for properties, lane_index, points in lanes:
+        if not all_lanes and lane_index > 0:
+            continue
+        kept = points[simplify(points, tolerance)]
+        selected.append((properties, len(shape_x), len(shape_x) + len(kept)))
+        shape_x.extend(kept[:, 0].tolist())
+        shape_y.extend(kept[:, 1].tolist())
+    lon, lat = projection.to_lon_lat(shape_x, shape_y)
+    coords = np.round(np.column_stack((lon, lat)), decimals).tolist()
+    return [
+        {
             "type": "Feature",
-            "properties": {
-                "id": edge_id,
-                "lane_id": lane.get('id'),
-                "speed": lane.get('speed'),
-                "allow": lane.get('allow'),
-                "disallow": lane.get('disallow'),
-            },
-            "geometry": {
-                "type": "LineString",
-                "coordinates": coords
-            }
+            "properties": properties,
+            "geometry": {"type": "LineString", "coordinates": coords[start:end]},
         }
-        features.append(feature)
+        for properties, start, end in selected
+    ]
+
+
+def write_compressed(path, data):
+    """
+    Writes a file along with its precompressed .gz (and .br if brotli is installed) copies
+
+    Args:
+    - path: path of the uncompressed file
+    - data: the file contents as bytes
+    """
+    with open(path, "wb") as f:
+        f.write(data)
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0)) # a fixed mtime keeps the output identical between runs
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def feature_collection(features):
+    return json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode("utf-8")
+
+
+def derive_level(source_path, name, out_path):
+    """
+    Builds a coarser level of detail from an already exported network.geojson, for when only the full level is available. Shapes are
+    simplified in a flat approximation of longitude and latitude around the network's mean latitude, which is accurate to well under
+    a meter over the extent of a city
+
+    Args:
+    - source_path: the full level GeoJSON file
+    - name: the name of the level of detail to build, one of LEVELS_OF_DETAIL
+    - out_path: path of the file to write, precompressed copies are written next to it
+
+    Returns:
+    - False if the source file does not exist, in which case nothing is written
+    """
+    if not os.path.isfile(source_path):
+        return False
+    _, tolerance, all_lanes, decimals = next(level for level in LEVELS_OF_DETAIL if level[0] == name)
+    with open(source_path, "rb") as f:
+        features = json.load(f)["features"]
+    if not all_lanes:
+        features = [feature for feature in features if (feature["properties"].get("lane_id") or "_0").rsplit("_", 1)[-1] == "0"]
+    latitudes = [point[1] for feature in features for point in feature["geometry"]["coordinates"]]
+    mean_lat = sum(latitudes) / len(latitudes) if latitudes else 0.0
+    scale = np.array([111320.0 * math.cos(math.radians(mean_lat)), 110540.0]) # meters per degree of longitude and latitude
+    derived = []
+    for feature in features:
+        points = np.array(feature["geometry"]["coordinates"], dtype=float)
+        kept = points[simplify(points * scale, tolerance)] if len(points) else points
+        derived.append({
+            "type": "Feature",
+            "properties": feature["properties"],
+            "geometry": {"type": "LineString", "coordinates": np.round(kept, decimals).tolist()},
+        })
+    write_compressed(out_path, feature_collection(derived))
+    return True
+
+
+def lon_lat_to_tile(lon, lat, zoom):
+    """
+    Returns the x and y of the web mercator (slippy map) tile containing a point
+    """
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def write_tiles(features, zoom, out_dir):
+    """
+    Splits features into web mercator tiles, a feature goes into every tile its bounding box touches. Tiles without features are not written
+
+    Returns:
+    - the number of tiles written
+    """
+    tiles = {}
+    for feature in features:
+        coords = np.array(feature["geometry"]["coordinates"])
+        min_x, max_y = lon_lat_to_tile(coords[:, 0].min(), coords[:, 1].min(), zoom) # tile y grows southwards
+        max_x, min_y = lon_lat_to_tile(coords[:, 0].max(), coords[:, 1].max(), zoom)
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                tiles.setdefault((x, y), []).append(feature)
+    for (x, y), tile_features in tiles.items():
+        tile_dir = os.path.join(out_dir, str(zoom), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        write_compressed(os.path.join(tile_dir, f"{y}.geojson"), feature_collection(tile_features))
+    return len(tiles)
+
+
+def export_network(net_file, out_dir=".", tile_zooms=(), tile_level="full"):
+    """
+    Exports the road network as GeoJSON: network.geojson with every lane, network_<level>.geojson for the coarser levels of detail,
+    precompressed copies of each, and optionally web mercator tiles in network_tiles/<level>/<zoom>/<x>/<y>.geojson
 
-# Create a FeatureCollection
-geojson_data = {
-    "type": "FeatureCollection",
-    "features": features
-}
+    Args:
+    - net_file: the .net.xml file
+    - out_dir: the directory the files are written to
+    - tile_zooms: zoom levels for which tiles are written
+    - tile_level: the level of detail used for the tiles
+    """
+    projection, lanes = read_lanes(net_file)
+    for name, tolerance, all_lanes, decimals in LEVELS_OF_DETAIL:
+        features = build_features(projection, lanes, tolerance, all_lanes, decimals)
+        file_name = "network.geojson" if name == "full" else f"network_{name}.geojson"
+        data = feature_collection(features)
+        write_compressed(os.path.join(out_dir, file_name), data)
+        print(f"{file_name}: {len(features)} features, {len(data) / 1024:.0f} KB")
+        if name == tile_level:
+            for zoom in tile_zooms:
+                num_tiles = write_tiles(features, zoom, os.path.join(out_dir, "network_tiles", name))
+                print(f"Zoom {zoom}: {num_tiles} tiles")
 
-# Save to a GeoJSON file
-with open('network.geojson', 'w') as f:
-    json.dump(geojson_data, f)
 
-print("GeoJSON file 'network.geojson' created successfully.")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the road network as GeoJSON for the frontend")
+    parser.add_argument("--net", default="downtown_houston.net.xml", help="the .net.xml file")
+    parser.add_argument("--out-dir", default=".", help="the directory the files are written to")
+    parser.add_argument("--tiles", type=int, nargs="*", default=[], help="zoom levels for which tiles are written")
+    parser.add_argument("--tile-level", default="full", choices=[level[0] for level in LEVELS_OF_DETAIL], help="the level of detail used for the tiles")
+    args = parser.parse_args()
+    export_network(args.net, args.out_dir, args.tiles, args.tile_level)
+    print("GeoJSON file 'network.geojson' created successfully.")
@@ -0,0 +1,132 @@
+import argparse
+import hashlib
+import json
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from price_forecast import PriceForecastTable, PRICE_MODEL_PARAMS, FORECAST_DAY, train_price_model
+
+CACHE_DIR = "model_cache"
+FORMAT_VERSION = 1 # bump when the layout of the cached files changes
+
+
+def file_fingerprint(path):
+    """
+    Returns the SHA-256 of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PriceModelCache:
+    """
+    Keeps what the optimized version derives from the historical electricity prices on disk, so that warm starts skip reading the Excel file
+    and training the price model. There are three kinds of files, each only rebuilt from the previous one when it is missing:
+    - a columnar copy of the historical data (.npz), keyed by the data file's contents
+    - the fitted [price model, scaler] (.joblib), keyed by the data, the model's hyperparameters and the scikit-learn version
+    - the forecast table (.npz), keyed by the model, the step length and the forecast day
+    Files are written to a temporary name first and then renamed, so a run that is interrupted never leaves a partial file behind
+    """
+
+    def __init__(self, data_path, cache_dir=CACHE_DIR, model_params=PRICE_MODEL_PARAMS):
+        """
+        Args:
+        - data_path: the Excel file with the historical electricity prices
+        - cache_dir: the directory the cached files are kept in
+        - model_params: hyperparameters of the price model
+        """
+        self.data_path = data_path
+        self.cache_dir = cache_dir
+        self.model_params = dict(model_params)
+        self.data_key = file_fingerprint(data_path)[:16]
+        model_fingerprint = json.dumps({"format": FORMAT_VERSION, "data": self.data_key, "params": self.model_params, "sklearn": sklearn.__version__}, sort_keys=True)
+        self.model_key = hashlib.sha256(model_fingerprint.encode()).hexdigest()[:16]
+        self.events = [] # (kind, "hit" or "built"), in the order the files were needed
+
+    def _path(self, file_name):
+        return os.path.join(self.cache_dir, file_name)
+
+    def _write(self, path, write):
+        """
+        Writes a cache file through a temporary file, write is called with the open file
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def load_data(self, rebuild=False):
+        """
+        Returns the historical data as a DataFrame, from the columnar copy if there is one
+        """
+        path = self._path(f"elec_data_{self.data_key}.npz")
+        if not rebuild and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as cached:
+                columns = [str(name) for name in cached["columns"]]
+                data = pd.DataFrame({name: cached[f"column_{i}"] for i, name in enumerate(columns)})
+            self.events.append(("data", "hit"))
+            return data
+        data = pd.read_excel(self.data_path)
+        arrays = {f"column_{i}": data[name].to_numpy() for i, name in enumerate(data.columns)}
+        self._write(path, lambda f: np.savez(f, columns=np.array([str(name) for name in data.columns]), **arrays))
+        self.events.append(("data", "built"))
+        return data
+
+    def load_models(self, rebuild=False):
+        """
+        Returns the fitted [price model, scaler], training them if they are not cached
+        """
+        path = self._path(f"price_model_{self.model_key}.joblib")
+        if not rebuild and os.path.exists(path):
+            models = joblib.load(path)
+            self.events.append(("model", "hit"))
+            return models
+        data = self.load_data(rebuild)
+        x_vals = data[[data.columns[0], data.columns[1]]] # day, time of day
+        y_vals = data[data.columns[2]] # price of electricity in $/kWh
+        models = train_price_model(x_vals, y_vals, self.model_params)
+        self._write(path, lambda f: joblib.dump(models, f))
+        self.events.append(("model", "built"))
+        return models
+
+    def load_table(self, step_length, day_number=FORECAST_DAY, rebuild=False):
+        """
+        Returns the PriceForecastTable for a step length. A table that has to be built is checked against the model before it is cached,
+        a cached table is returned without its model so the model file is not loaded on warm starts
+
+        Args:
+        - step_length: the length of a simulation step in s
+        - day_number: the day the prices are predicted for
+        - rebuild: whether to ignore the cached files and rebuild everything from the Excel file
+        """
+        path = self._path(f"price_table_{self.model_key}_{step_length:g}_{day_number}.npz")
+        if not rebuild and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as cached:
+                prices = cached["prices"]
+            self.events.append(("table", "hit"))
+            return PriceForecastTable(prices, step_length, day_number)
+        table = PriceForecastTable.from_models(self.load_models(rebuild), step_length, day_number)
+        table.check()
+        self._write(path, lambda f: np.savez(f, prices=table.prices))
+        self.events.append(("table", "built"))
+        return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the cached electricity price model and forecast table used by the optimized version")
+    parser.add_argument("--data", default="historical_elec_cost_data.xlsx", help="the Excel file with the historical electricity prices")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="the directory the cached files are kept in")
+    parser.add_argument("--step-length", type=float, default=0.5, help="the simulation step length the forecast table is built for")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the cached files and retrain the model from the Excel file")
+    args = parser.parse_args()
+    cache = PriceModelCache(args.data, args.cache_dir)
+    table = cache.load_table(args.step_length, rebuild=args.rebuild)
+    for kind, outcome in cache.events:
+        print(f"{kind}: {outcome}")
+    print(f"Forecast table for step length {args.step_length:g} s: {len(table.prices)} prices, key {cache.model_key}")
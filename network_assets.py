@@ -0,0 +1,81 @@
+import gzip
+import hashlib
+import os
+import threading
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz")) # preferred order of the precompressed variants
+
+
+class StaticAsset:
+    """
+    One static file and its precompressed variants, loaded into memory once. The ETag is a hash of the uncompressed contents,
+    so it only changes when the file is regenerated
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, "rb") as f:
+            self.identity = f.read()
+        self.etag = hashlib.sha1(self.identity).hexdigest()
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix) and os.path.getmtime(path + suffix) >= self.mtime:
+                with open(path + suffix, "rb") as f:
+                    self.variants[encoding] = f.read()
+        if "gzip" not in self.variants:
+            self.variants["gzip"] = gzip.compress(self.identity, mtime=0) # files written before precompression was added
+
+    def body(self, accepted):
+        """
+        Picks the smallest variant the client accepts
+
+        Args:
+        - accepted: function returning whether the client accepts an encoding
+
+        Returns:
+        - the content encoding (None for uncompressed) and the body
+        """
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and accepted(encoding):
+                return encoding, self.variants[encoding]
+        return None, self.identity
+
+
+class AssetStore:
+    """
+    Serves static files from a directory, reloading a file only when it changes on disk. Files that can be derived from other files
+    are built the first time they are asked for and missing
+    """
+
+    def __init__(self, root=".", builders=None):
+        """
+        Args:
+        - root: the directory the files are served from
+        - builders: optional dictionary of relative path -> function(path) that writes the file at path, returning False if it cannot
+        """
+        self.root = os.path.abspath(root)
+        self.builders = builders or {}
+        self.assets = {} # relative path -> StaticAsset
+        self.lock = threading.Lock()
+
+    def get(self, relative_path):
+        """
+        Returns the StaticAsset of a file, or None if the file does not exist (and cannot be built) or lies outside of the root directory
+        """
+        path = os.path.abspath(os.path.join(self.root, relative_path))
+        if os.path.commonpath([path, self.root]) != self.root:
+            return None
+        if not os.path.isfile(path):
+            builder = self.builders.get(relative_path)
+            if builder is None:
+                return None
+            with self.lock:
+                if not os.path.isfile(path) and not builder(path): # another request may have built it while this one waited
+                    return None
+        with self.lock:
+            asset = self.assets.get(relative_path)
+            if asset is None or asset.mtime != os.path.getmtime(path):
+                asset = StaticAsset(path)
+                self.assets[relative_path] = asset
+            return asset
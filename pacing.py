@@ -0,0 +1,99 @@
+import time
+from collections import deque
+
+PACING_MODES = ("afap", "realtime", "attached")
+
+
+class PacingController:
+    """
+    Decides how long the simulation loop waits after each step. Three modes are available:
+    - "afap": as fast as possible, never waits
+    - "realtime": keeps the simulation at a fixed real-time factor (simulated seconds per wall-clock second), only waiting for whatever
+      is left of each step's time budget after the step's own work
+    - "attached": like "realtime" while someone is watching (the SUMO GUI is open, or a client has polled the backend recently), like "afap" otherwise
+    Also measures the achieved number of steps per second over a sliding window
+    """
+
+    def __init__(self, mode="attached", real_time_factor=50.0, client_timeout=5.0, gui=False, window=100, sleep=time.sleep):
+        """
+        Args:
+        - mode: "afap", "realtime" or "attached"
+        - real_time_factor: simulated seconds per wall-clock second while throttled
+        - client_timeout: in attached mode, how many wall-clock seconds a client counts as attached after its last request
+        - gui: whether the SUMO GUI is open, which always counts as attached
+        - window: number of steps used to measure the achieved step rate
+        - sleep: function used to wait, taking a number of seconds
+        """
+        if mode not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode: {mode}")
+        if real_time_factor <= 0:
+            raise ValueError("The real-time factor must be positive")
+        self.mode = mode
+        self.real_time_factor = real_time_factor
+        self.client_timeout = client_timeout
+        self.gui = gui
+        self.sleep = sleep
+        self.last_client_time = None # wall-clock time of the last client request
+        self.deadline = None # wall-clock time at which the current step's budget runs out
+        self.step_times = deque(maxlen=window) # wall-clock times at which the last steps finished
+        self.total_sleep = 0.0 # in s
+
+    def client_seen(self):
+        """
+        Records that a client has just made a request
+        """
+        self.last_client_time = time.perf_counter()
+
+    def is_attached(self):
+        if self.gui:
+            return True
+        return self.last_client_time is not None and time.perf_counter() - self.last_client_time <= self.client_timeout
+
+    def is_throttled(self):
+        return self.mode == "realtime" or (self.mode == "attached" and self.is_attached())
+
+    def step_done(self, step_length):
+        """
+        Called at the end of every simulation step, waits if the simulation is ahead of its real-time target
+
+        Args:
+        - step_length: the simulated length of the step in s
+        """
+        now = time.perf_counter()
+        self.step_times.append(now)
+        if not self.is_throttled():
+            self.deadline = None
+            return
+        budget = step_length / self.real_time_factor
+        if self.deadline is None or now - self.deadline > budget:
+            # first throttled step, or the loop fell more than a step behind. starting over avoids a burst of unthrottled steps to catch up
+            self.deadline = now + budget
+        else:
+            self.deadline += budget
+        remaining = self.deadline - now
+        if remaining > 0:
+            self.sleep(remaining)
+            self.total_sleep += remaining
+
+    def steps_per_second(self):
+        """
+        Returns the achieved step rate over the sliding window
+        """
+        if len(self.step_times) < 2 or self.step_times[-1] <= self.step_times[0]:
+            return 0.0
+        return (len(self.step_times) - 1) / (self.step_times[-1] - self.step_times[0])
+
+    def get_stats(self, step_length):
+        """
+        Returns the pacing settings along with the achieved step rate and real-time factor
+        """
+        steps_per_second = self.steps_per_second()
+        return {
+            "mode": self.mode,
+            "target_real_time_factor": self.real_time_factor,
+            "throttled": self.is_throttled(),
+            "attached": self.is_attached(),
+            "steps_per_second": steps_per_second,
+            "achieved_real_time_factor": steps_per_second * step_length,
+            "total_sleep": self.total_sleep,
+        }
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+
+DAY_LENGTH = 7200 # simulation seconds in one day
+HOUR_LENGTH = 300 # simulation seconds in one hour
+FORECAST_DAY = 2501 # historical data goes up to day 2500, so the current day is set to 2501
+PRICE_PERIOD_STARTS = (0, 1200, 1800, 2400, 3000, 4200, 4800, 5400, 6000, 6600) # the periods of the day with their own demand multiplier, time of day rate and electricity price, see set_time_dependent_price_variables
+PRICE_MODEL_PARAMS = {"n_estimators": 300, "max_depth": 10, "min_samples_split": 10, "min_samples_leaf": 1} # hyperparameters of the price model
+
+
+def train_price_model(x_vals, y_vals, model_params=PRICE_MODEL_PARAMS):
+    """
+    Train the price model on historical data
+
+    Args:
+    - x_vals: Matrix that stores the day and time of day
+    - y_vals: corresponding price of charging vehicles in $/kWh
+    - model_params: hyperparameters of the random forest
+
+    Returns:
+    - [price model, scaler]
+    """
+    scaler_obj = StandardScaler()
+    x_scaled = scaler_obj.fit_transform(x_vals)
+    price_model = RandomForestRegressor(**model_params)
+    price_model.fit(x_scaled, y_vals)
+    return [price_model, scaler_obj]
+
+
+def predict_prices(models, times, day_number=FORECAST_DAY):
+    """
+    Runs the price model on a batch of times of day
+
+    Args:
+    - models: [price model, scaler]
+    - times: times of day in s, between 0 and 7200
+    - day_number: the day the prices are predicted for
+
+    Returns:
+    - the predicted prices in $/kWh as a NumPy array
+    """
+    features = pd.DataFrame({'Day Number': np.full(len(times), day_number), 'Simulation Time': times})
+    return models[0].predict(models[1].transform(features))
+
+
+class PriceForecastTable:
+    """
+    Electricity prices predicted by the trained model for every step of a simulated day. Predicted prices only depend on the time of day,
+    so the model is evaluated once, in one batch, and charging decisions look prices up instead of running the model for every taxi on every step
+    """
+
+    def __init__(self, prices, step_length, day_number=FORECAST_DAY, models=None):
+        """
+        Args:
+        - prices: the predicted price in $/kWh at each step of the day
+        - step_length: the length of a simulation step in s, which is the resolution of the table
+        - day_number: the day the prices are predicted for
+        - models: [price model, scaler] the prices were predicted with, needed by check (None for tables loaded from the model cache)
+        """
+        self.prices = np.asarray(prices, dtype=float)
+        self.step_length = step_length
+        self.day_number = day_number
+        self.models = models
+        self.times = np.arange(len(self.prices)) * step_length
+
+    @classmethod
+    def from_models(cls, models, step_length, day_number=FORECAST_DAY):
+        """
+        Builds the table by running the price model on every step of the day in one batch
+        """
+        return cls(predict_prices(models, np.arange(0, DAY_LENGTH, step_length), day_number), step_length, day_number, models)
+
+    def price_at(self, time):
+        """
+        Returns the predicted price in $/kWh at a simulation time, times past midnight wrap around to the start of the day
+        """
+        idx = int(round((time % DAY_LENGTH) / self.step_length)) % len(self.prices)
+        return float(self.prices[idx])
+
+    def forecast(self, sim_time, hours=6):
+        """
+        Returns the predicted prices for each of the next hours, keyed by the number of hours from sim_time
+        """
+        return {hour: self.price_at(sim_time + hour*HOUR_LENGTH) for hour in range(1, hours+1)}
+
+    def check(self, num_samples=48, tolerance=1e-9):
+        """
+        Compares the table against the model run one time at a time, the way prices were predicted before the table existed
+
+        Args:
+        - num_samples: number of times of day to compare, spread evenly over the day
+        - tolerance: largest accepted difference in $/kWh
+
+        Returns:
+        - the largest difference found
+        """
+        if self.models is None:
+            raise ValueError("The price forecast table was loaded without its model and cannot be checked")
+        max_difference = 0.0
+        for idx in np.linspace(0, len(self.times) - 1, num_samples).astype(int):
+            time = float(self.times[idx])
+            features = pd.DataFrame({'Day Number': [self.day_number], 'Simulation Time': [time]})
+            live_price = self.models[0].predict(self.models[1].transform(features))[0]
+            max_difference = max(max_difference, abs(self.price_at(time) - float(live_price)))
+        if max_difference > tolerance:
+            raise ValueError(f"Price forecast table differs from the model by up to {max_difference} $/kWh")
+        return max_difference
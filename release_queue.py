@@ -0,0 +1,49 @@
+import heapq
+
+
+class ReleaseQueue:
+    """
+    Reservations that have not been released into the simulation yet, ordered by depart time, so that each step only touches the
+    reservations whose depart time has just passed. Entries of reservations that are queued again (with a new depart time) or
+    discarded stay in the heap and are skipped when they reach the top
+    """
+
+    def __init__(self):
+        self.heap = [] # (depart time, reservation ID)
+        self.depart_times = {} # reservation ID -> depart time of its current entry, only for queued reservations
+
+    def __len__(self):
+        return len(self.depart_times)
+
+    def __contains__(self, res_id):
+        return res_id in self.depart_times
+
+    def push(self, res_id, depart_time):
+        """
+        Queues a reservation, replacing its previous entry if it was already queued
+        """
+        self.depart_times[res_id] = depart_time
+        heapq.heappush(self.heap, (depart_time, res_id))
+
+    def discard(self, res_id):
+        """
+        Takes a reservation out of the queue, if it is queued
+        """
+        self.depart_times.pop(res_id, None)
+
+    def pop_due(self, current_time):
+        """
+        Removes and returns every queued reservation whose depart time is not later than current_time
+
+        Returns:
+        - the reservation IDs, sorted by ID so that reservations are released in the order they were created
+        """
+        due = []
+        heap = self.heap
+        while heap and heap[0][0] <= current_time:
+            depart_time, res_id = heapq.heappop(heap)
+            if self.depart_times.get(res_id) == depart_time:
+                del self.depart_times[res_id]
+                due.append(res_id)
+        due.sort()
+        return due
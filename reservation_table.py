@@ -0,0 +1,204 @@
+from array import array
+import numpy as np
+
+FIELDS = ("person_id", "pickup_edge", "dropoff_edge", "pickup_pos", "dropoff_pos", "depart_time", "route_edges", "route_length") # order of the values of a reservation record
+
+
+class ReservationRecord:
+    """
+    Read-only view of one row of a ReservationTable that can be indexed like the lists reservations used to be stored as:
+    [person id, from edge, to edge, depart pos, arrival pos, depart time, edges of route from pickup to dropoff, route length].
+    A view reads the table when it is indexed, so it should not be kept after its reservation is deleted or replaced
+    """
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, index):
+        return self.table._getters[index](self.row)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __iter__(self):
+        return (getter(self.row) for getter in self.table._getters)
+
+    def __repr__(self):
+        return f"ReservationRecord({list(self)})"
+
+
+class ReservationTable:
+    """
+    Stores reservations column by column in typed arrays instead of one Python list per reservation. Edge IDs are interned to
+    integers, positions, times and lengths are stored as doubles, and the pickup-to-dropoff routes of all reservations share a single
+    buffer of edge indices, each reservation keeping an offset and a count into it. The table can be used like the dictionary of
+    reservation ID -> list it replaces: indexing returns a ReservationRecord, and assigning a list of the 8 values adds or replaces a reservation
+    """
+
+    def __init__(self, edge_ids=()):
+        """
+        Args:
+        - edge_ids: edge IDs to intern up front (for example every edge of the network), other edges are interned when first seen
+        """
+        self.edge_ids = [] # edge index -> edge ID
+        self.edge_index = {} # edge ID -> edge index
+        for edge_id in edge_ids:
+            self.intern_edge(edge_id)
+
+        self.rows = {} # reservation ID -> row, in the order the reservations were added
+        self.free_rows = [] # rows of deleted reservations, reused by new ones
+        self.person_ids = [] # row -> person ID, None for free rows
+        self.pickup_edges = array('i')
+        self.dropoff_edges = array('i')
+        self.pickup_positions = array('d')
+        self.dropoff_positions = array('d')
+        self.depart_times = array('d')
+        self.route_lengths = array('d')
+        self.route_offsets = array('q') # row -> start of the row's route in route_buffer
+        self.route_counts = array('i') # row -> number of edges in the row's route
+        self.route_buffer = array('i') # edge indices of every route, one after the other
+        self.route_garbage = 0 # number of entries of route_buffer that belong to deleted or replaced routes
+        self._getters = (
+            lambda row: self.person_ids[row],
+            lambda row: self.edge_ids[self.pickup_edges[row]],
+            lambda row: self.edge_ids[self.dropoff_edges[row]],
+            lambda row: self.pickup_positions[row],
+            lambda row: self.dropoff_positions[row],
+            lambda row: self.depart_times[row],
+            self._route_edges,
+            lambda row: self.route_lengths[row],
+        )
+
+    def intern_edge(self, edge_id):
+        """
+        Returns the integer index of an edge ID, adding it if it is new
+        """
+        idx = self.edge_index.get(edge_id)
+        if idx is None:
+            idx = len(self.edge_ids)
+            self.edge_index[edge_id] = idx
+            self.edge_ids.append(edge_id)
+        return idx
+
+    def add(self, res_id, person_id, pickup_edge, dropoff_edge, pickup_pos, dropoff_pos, depart_time, route_edges, route_length):
+        """
+        Adds a reservation, or replaces it if the ID is already in the table (the reservation keeps its place in the iteration order)
+        """
+        row = self.rows.get(res_id)
+        if row is not None:
+            self.route_garbage += self.route_counts[row]
+        elif self.free_rows:
+            row = self.free_rows.pop()
+            self.rows[res_id] = row
+        else:
+            row = len(self.person_ids)
+            self.rows[res_id] = row
+            self.person_ids.append(None)
+            for column in (self.pickup_edges, self.dropoff_edges, self.route_counts):
+                column.append(0)
+            for column in (self.pickup_positions, self.dropoff_positions, self.depart_times, self.route_lengths):
+                column.append(0.0)
+            self.route_offsets.append(0)
+        self.person_ids[row] = person_id
+        self.pickup_edges[row] = self.intern_edge(pickup_edge)
+        self.dropoff_edges[row] = self.intern_edge(dropoff_edge)
+        self.pickup_positions[row] = pickup_pos
+        self.dropoff_positions[row] = dropoff_pos
+        self.depart_times[row] = depart_time
+        self.route_lengths[row] = route_length
+        self.route_offsets[row] = len(self.route_buffer)
+        self.route_counts[row] = len(route_edges)
+        self.route_buffer.extend(self.intern_edge(edge_id) for edge_id in route_edges)
+        self._compact_routes()
+
+    def __setitem__(self, res_id, values):
+        self.add(res_id, *values)
+
+    def __delitem__(self, res_id):
+        row = self.rows.pop(res_id)
+        self.person_ids[row] = None
+        self.route_garbage += self.route_counts[row]
+        self.route_counts[row] = 0
+        self.free_rows.append(row)
+        self._compact_routes()
+
+    def _compact_routes(self):
+        """
+        Rewrites the route buffer without the routes of deleted or replaced reservations once they take up more than half of it
+        """
+        if self.route_garbage < 4096 or self.route_garbage * 2 < len(self.route_buffer):
+            return
+        buffer = array('i')
+        for row in self.rows.values():
+            start = self.route_offsets[row]
+            self.route_offsets[row] = len(buffer)
+            buffer.extend(self.route_buffer[start:start + self.route_counts[row]])
+        self.route_buffer = buffer
+        self.route_garbage = 0
+
+    def __contains__(self, res_id):
+        return res_id in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getitem__(self, res_id):
+        return ReservationRecord(self, self.rows[res_id])
+
+    def get(self, res_id, default=None):
+        row = self.rows.get(res_id)
+        return ReservationRecord(self, row) if row is not None else default
+
+    def keys(self):
+        return self.rows.keys()
+
+    def values(self):
+        return (ReservationRecord(self, row) for row in self.rows.values())
+
+    def items(self):
+        return ((res_id, ReservationRecord(self, row)) for res_id, row in self.rows.items())
+
+    def _route_edges(self, row):
+        start = self.route_offsets[row]
+        edge_ids = self.edge_ids
+        return tuple(edge_ids[idx] for idx in self.route_buffer[start:start + self.route_counts[row]])
+
+    def person_id(self, res_id):
+        return self.person_ids[self.rows[res_id]]
+
+    def pickup_edge(self, res_id):
+        return self.edge_ids[self.pickup_edges[self.rows[res_id]]]
+
+    def pickup_pos(self, res_id):
+        return self.pickup_positions[self.rows[res_id]]
+
+    def depart_time(self, res_id):
+        return self.depart_times[self.rows[res_id]]
+
+    def route_edges(self, res_id):
+        return self._route_edges(self.rows[res_id])
+
+    def depart_time_array(self):
+        """
+        Returns the depart times of every reservation in the table as a NumPy array (a copy, in no particular order)
+        """
+        rows = np.fromiter(self.rows.values(), dtype=np.int64, count=len(self.rows))
+        return np.array(self.depart_times, dtype=float)[rows]
+
+    def get_stats(self):
+        """
+        Returns the number of reservations and the approximate memory used by the typed arrays in bytes
+        """
+        columns = (self.pickup_edges, self.dropoff_edges, self.pickup_positions, self.dropoff_positions, self.depart_times,
+                   self.route_lengths, self.route_offsets, self.route_counts, self.route_buffer)
+        return {
+            "reservations": len(self.rows),
+            "interned_edges": len(self.edge_ids),
+            "route_buffer_entries": len(self.route_buffer),
+            "array_bytes": sum(column.itemsize * len(column) for column in columns),
+        }
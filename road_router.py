@@ -0,0 +1,509 @@
+import argparse
+import heapq
+import math
+import random
+from array import array
+import numpy as np
+
+
+class RouteResult:
+    """
+    Lightweight stand-in for the stage object returned by traci.simulation.findRoute. Only the fields the simulation reads are provided
+    """
+    __slots__ = ("edges", "length", "travelTime", "cost")
+
+    def __init__(self, edges=(), length=0.0, travel_time=0.0):
+        self.edges = edges # tuple of edge ids from the start edge to the destination edge (inclusive), empty if no route exists
+        self.length = length # in m, includes the internal junction lanes driven between edges
+        self.travelTime = travel_time # in s, free-flow estimate
+        self.cost = travel_time # findRoute reports the travel time as the cost of a route
+
+    def __bool__(self):
+        return True # mirrors the TraCI stage object, which is always truthy even when no route exists
+
+    def __repr__(self):
+        return f"RouteResult(edges={self.edges}, length={self.length}, travelTime={self.travelTime})"
+
+
+class SearchTree:
+    """
+    Result of a one-to-many search from a single edge. Keeps the predecessor links so that routes to individual destinations can be rebuilt on demand
+    """
+
+    def __init__(self, router, source, cost, length, pred):
+        self.router = router
+        self.source = source # index of the start edge
+        self.cost = cost # settled edge index -> travel time in s
+        self.length = length # edge index -> route length in m
+        self.pred = pred # edge index -> index of the previous edge on the route
+
+    def length_to(self, edge_id):
+        """
+        Returns the length of the fastest route to an edge in m, or infinity if the edge was not reached
+        """
+        idx = self.router.edge_index.get(edge_id)
+        if idx is None or idx not in self.cost:
+            return float('inf')
+        return self.length[idx]
+
+    def route_to(self, edge_id):
+        """
+        Rebuilds the fastest route to an edge, the route has no edges if the edge was not reached
+        """
+        idx = self.router.edge_index.get(edge_id)
+        if idx is None or idx not in self.cost:
+            return RouteResult()
+        return self.router._build_route(self.pred, idx, self.cost[idx], self.length[idx])
+
+
+class RoadRouter:
+    """
+    In-process shortest path router over a sumolib network. The drivable graph is stored as compact adjacency arrays (CSR layout),
+    where the nodes are the network's edges and the links are the connections between them. Routes are chosen by free-flow travel time
+    the same way SUMO's default router does, so that the resulting edges and length match traci.simulation.findRoute without needing a
+    TraCI round-trip for every query
+    """
+
+    def __init__(self, net, v_class="passenger", max_speed=100.0, minor_penalty=1.5, turnaround_penalty=5.0):
+        """
+        Builds the adjacency arrays from the network
+
+        Args:
+        - net: the sumolib network object, it should be read with withInternal=True so that the lengths of the junction lanes are known
+        - v_class: the vehicle class used to filter out lanes and connections that taxis are not allowed to use
+        - max_speed: the maximum speed of the vehicle type in m/s (see vehicle_type.add.xml)
+        - minor_penalty: time penalty in seconds SUMO adds for passing a minor link at an unsignalized junction (--weights.minor-penalty)
+        - turnaround_penalty: time penalty in seconds SUMO adds for turning around (--weights.turnaround-penalty)
+        """
+        self.v_class = v_class
+        self.edge_ids = [] # index -> edge id
+        self.edge_index = {} # edge id -> index
+        self.edge_length = array('d') # length of each edge in m
+        self.edge_time = array('d') # free-flow travel time over each edge in s
+        self.edge_start_xy = array('d') # x, y of the junction each edge starts at, stored interleaved
+        self.edge_end_xy = array('d') # x, y of the junction each edge ends at, stored interleaved
+
+        drivable = [edge for edge in net.getEdges(withInternal=False) if edge.allows(v_class)]
+        for edge in drivable:
+            self.edge_index[edge.getID()] = len(self.edge_ids)
+            self.edge_ids.append(edge.getID())
+            self.edge_length.append(edge.getLength())
+            speed = min(self._edge_speed(edge, v_class), max_speed)
+            self.edge_time.append(edge.getLength() / speed)
+            self.edge_start_xy.extend(edge.getFromNode().getCoord()[:2])
+            self.edge_end_xy.extend(edge.getToNode().getCoord()[:2])
+        # point-to-point queries use A* with the straight-line distance between junction centers, times the smallest travel time per meter
+        # of straight-line distance of any edge, as the estimate of the remaining travel time. Every edge takes at least that long per meter
+        # between its junctions whatever its speed or curvature, and crossing a junction never takes negative time, so by the triangle
+        # inequality the estimate never exceeds the remaining travel time and A* returns the same routes as Dijkstra
+        self.time_per_meter = float('inf')
+        for i in range(len(self.edge_ids)):
+            chord = math.hypot(self.edge_end_xy[2*i] - self.edge_start_xy[2*i], self.edge_end_xy[2*i+1] - self.edge_start_xy[2*i+1])
+            if chord > 0:
+                self.time_per_meter = min(self.time_per_meter, self.edge_time[i] / chord)
+        if self.time_per_meter == float('inf'):
+            self.time_per_meter = 0.0
+
+        # successors of edge i are stored in succ_target[succ_offset[i]:succ_offset[i+1]], each link carries the length and travel time of the junction lanes in between
+        self.succ_offset = array('l', [0])
+        self.succ_target = array('l')
+        self.succ_length = array('d')
+        self.succ_time = array('d')
+        for edge in drivable:
+            for to_edge, conns in edge.getAllowedOutgoing(v_class).items():
+                to_idx = self.edge_index.get(to_edge.getID())
+                if to_idx is None:
+                    continue
+                via_length, via_time = self._via_cost(net, conns, max_speed, minor_penalty, turnaround_penalty)
+                self.succ_target.append(to_idx)
+                self.succ_length.append(via_length)
+                self.succ_time.append(via_time)
+            self.succ_offset.append(len(self.succ_target))
+
+        self._compute_components()
+
+    @staticmethod
+    def _edge_speed(edge, v_class):
+        """
+        Returns the speed limit of an edge, which is the fastest of its lanes that the vehicle class may use
+        """
+        speeds = [lane.getSpeed() for lane in edge.getLanes() if lane.allows(v_class)]
+        return max(speeds) if speeds else edge.getSpeed()
+
+    @staticmethod
+    def _via_cost(net, conns, max_speed, minor_penalty, turnaround_penalty):
+        """
+        Computes the cost of crossing a junction from one edge to the next. Like SUMO's router, the crossing is costed over the internal
+        edges of the junction rather than the individual internal lanes: an internal edge is as long and as fast as its first lane, and its
+        penalty is that of the link leading into its first lane, whichever of its parallel lanes the connection actually uses
+
+        Args:
+        - net: the sumolib network object
+        - conns: the lane-level connections between the two edges
+        - max_speed: the maximum speed of the vehicle type in m/s
+        - minor_penalty: time penalty in seconds for passing a minor link without a traffic light
+        - turnaround_penalty: time penalty in seconds for turning around
+
+        Returns:
+        - the length (m) and travel time (s) of the cheapest sequence of internal edges, both 0 if the network was read without internal lanes
+        """
+        best = None
+        by_via = {conn.getViaLaneID(): conn for conn in conns} # internal lane -> the connection crossing the junction over it
+        for conn in conns:
+            via_length = 0.0
+            via_time = 0.0
+            link = conn
+            try:
+                # a junction can be crossed over a chain of internal edges, SUMO penalizes each turnaround or minor link along the chain separately.
+                # the chain is followed along the first lanes of the internal edges, since those decide their costs
+                if link.getViaLaneID():
+                    link = by_via.get(net.getLane(link.getViaLaneID()).getEdge().getLanes()[0].getID(), link)
+                while link is not None and link.getViaLaneID():
+                    via_time += RoadRouter._link_penalty(link, minor_penalty, turnaround_penalty)
+                    via_lane = net.getLane(link.getViaLaneID())
+                    first_lane = via_lane.getEdge().getLanes()[0]
+                    via_length += first_lane.getLength()
+                    via_time += first_lane.getLength() / min(first_lane.getSpeed(), max_speed)
+                    link = via_lane.getOutgoing()[0] if via_lane.getOutgoing() else None
+            except KeyError:
+                # internal lanes were not loaded, only the penalty of the first link is known
+                via_length = 0.0
+                via_time = RoadRouter._link_penalty(conn, minor_penalty, turnaround_penalty)
+            if best is None or via_time < best[1]:
+                best = (via_length, via_time)
+        return best if best is not None else (0.0, 0.0)
+
+    @staticmethod
+    def _link_penalty(link, minor_penalty, turnaround_penalty):
+        """
+        Returns the time penalty SUMO's router adds for passing a single link. Only links without a traffic light and without priority
+        are penalized (SUMO gives priority to the upper case link states), turning around costs the turnaround penalty instead of the minor one
+        """
+        state = link.getState()
+        if link.getTLSID() or not state or "A" <= state <= "Z":
+            return 0.0
+        if link.getDirection() == 't':
+            return turnaround_penalty
+        return minor_penalty
+
+    def check(self, sumo_route, num_pairs=100, rng=None, tolerance=0.05):
+        """
+        Compares the router against SUMO's router: half of the pairs are a random edge and one of its successors, which checks the cost of
+        single junction crossings, the other half are random pairs of edges. Routes may only differ in their edges when SUMO's route is
+        equally fast (ties between equally fast routes can be broken either way)
+
+        Args:
+        - sumo_route: function (from edge, to edge) -> the stage returned by traci.simulation.findRoute for the same vehicle type
+        - num_pairs: number of pairs of edges to compare
+        - rng: the random.Random the pairs are drawn with, a fixed seed by default so that the check does not disturb the simulation's random numbers
+        - tolerance: largest accepted difference in travel time (s) and length (m)
+
+        Returns:
+        - the number of pairs compared
+        """
+        rng = rng if rng is not None else random.Random(0)
+        if len(self.edge_ids) < 2:
+            return 0
+        mismatches = []
+        for i in range(num_pairs):
+            source = rng.randrange(len(self.edge_ids))
+            start, end = self.succ_offset[source], self.succ_offset[source + 1]
+            if i % 2 == 0 and end > start:
+                target = self.succ_target[rng.randrange(start, end)]
+            else:
+                target = rng.randrange(len(self.edge_ids))
+            from_edge, to_edge = self.edge_ids[source], self.edge_ids[target]
+            local = self.find_route(from_edge, to_edge)
+            sumo = sumo_route(from_edge, to_edge)
+            if bool(local.edges) != bool(sumo.edges):
+                mismatches.append(f"{from_edge} -> {to_edge}: reachable locally {bool(local.edges)}, in SUMO {bool(sumo.edges)}")
+            elif local.edges and (abs(local.travelTime - sumo.travelTime) > tolerance or (tuple(local.edges) == tuple(sumo.edges) and abs(local.length - sumo.length) > tolerance)):
+                mismatches.append(f"{from_edge} -> {to_edge}: local {local.travelTime:.2f} s / {local.length:.2f} m, SUMO {sumo.travelTime:.2f} s / {sumo.length:.2f} m")
+        if mismatches:
+            raise ValueError(f"Local routes differ from SUMO's on {len(mismatches)} of {num_pairs} pairs, e.g. " + "; ".join(mismatches[:3]))
+        return num_pairs
+
+    def has_edge(self, edge_id):
+        return edge_id in self.edge_index
+
+    def _compute_components(self):
+        """
+        Finds the strongly connected components of the drivable graph with an iterative version of Tarjan's algorithm, then records
+        which components can be reached from each component so that reachability between any two edges can be answered without routing
+        """
+        succ_offset = self.succ_offset
+        succ_target = self.succ_target
+        num_edges = len(self.edge_ids)
+        index = [-1] * num_edges
+        low = [0] * num_edges
+        on_stack = [False] * num_edges
+        component = [-1] * num_edges
+        stack = []
+        counter = 0
+        num_components = 0
+        for root in range(num_edges):
+            if index[root] != -1:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [[root, succ_offset[root]]] # edges whose successors are still being explored, with the position of the next successor
+            while work:
+                frame = work[-1]
+                node = frame[0]
+                if frame[1] < succ_offset[node + 1]:
+                    nxt = succ_target[frame[1]]
+                    frame[1] += 1
+                    if index[nxt] == -1:
+                        index[nxt] = low[nxt] = counter
+                        counter += 1
+                        stack.append(nxt)
+                        on_stack[nxt] = True
+                        work.append([nxt, succ_offset[nxt]])
+                    elif on_stack[nxt]:
+                        low[node] = min(low[node], index[nxt])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = num_components
+                        if member == node:
+                            break
+                    num_components += 1
+
+        self.component = array('l', component) # edge index -> id of its strongly connected component
+        self.component_size = array('l', [0] * num_components)
+        for comp in component:
+            self.component_size[comp] += 1
+        self.main_component = max(range(num_components), key=lambda comp: self.component_size[comp]) if num_components > 0 else -1
+
+        # Tarjan's algorithm finishes a component only after every component reachable from it, so the reachable sets can be
+        # built in that same order. Each set is stored as a bitmask with one bit per component
+        successors = [set() for _ in range(num_components)]
+        for node in range(num_edges):
+            for k in range(succ_offset[node], succ_offset[node + 1]):
+                if component[succ_target[k]] != component[node]:
+                    successors[component[node]].add(component[succ_target[k]])
+        self.component_reach = []
+        for comp in range(num_components):
+            reach = 1 << comp
+            for succ in successors[comp]:
+                reach |= self.component_reach[succ]
+            self.component_reach.append(reach)
+
+    def in_main_component(self, edge_id):
+        """
+        Returns whether an edge belongs to the largest strongly connected component, in which every edge can reach every other edge
+        """
+        idx = self.edge_index.get(edge_id)
+        return idx is not None and self.component[idx] == self.main_component
+
+    def is_reachable(self, from_edge, to_edge):
+        """
+        Checks in constant time whether any route exists between two edges
+
+        Args:
+        - from_edge: the ID of the edge the route would start on
+        - to_edge: the ID of the edge the route would end on
+
+        Returns:
+        - True or False, or None if either edge is unknown to the router (for example an internal junction edge)
+        """
+        source = self.edge_index.get(from_edge)
+        target = self.edge_index.get(to_edge)
+        if source is None or target is None:
+            return None
+        return bool((self.component_reach[self.component[source]] >> self.component[target]) & 1)
+
+    def reachability_matrix(self, from_edges, to_edges):
+        """
+        Checks reachability for every combination of start and destination edges, working on distinct components so that the common case
+        of everything lying in the main component costs a single check
+
+        Args:
+        - from_edges: the IDs of the start edges, one per row
+        - to_edges: the IDs of the destination edges, one per column
+
+        Returns:
+        - a boolean NumPy matrix, entries involving edges unknown to the router are True since only a real search can tell
+        """
+        sources = np.array([self.component[self.edge_index[e]] if e in self.edge_index else -1 for e in from_edges], dtype=np.int64)
+        targets = np.array([self.component[self.edge_index[e]] if e in self.edge_index else -1 for e in to_edges], dtype=np.int64)
+        distinct_sources, source_inverse = np.unique(sources, return_inverse=True)
+        distinct_targets, target_inverse = np.unique(targets, return_inverse=True)
+        block = np.ones((len(distinct_sources), len(distinct_targets)), dtype=bool)
+        for i, a in enumerate(distinct_sources.tolist()):
+            if a < 0:
+                continue
+            for j, b in enumerate(distinct_targets.tolist()):
+                if b >= 0:
+                    block[i, j] = bool((self.component_reach[a] >> b) & 1)
+        return block[np.ix_(source_inverse.reshape(-1), target_inverse.reshape(-1))]
+
+    def _search(self, source, targets=None):
+        """
+        Runs Dijkstra's algorithm by travel time from a single edge
+
+        Args:
+        - source: index of the start edge
+        - targets: optional set of edge indices, the search stops early once all of them are settled
+
+        Returns:
+        - dictionaries mapping each settled edge index to its travel time, its route length, and its predecessor on the route
+        """
+        edge_time = self.edge_time
+        edge_length = self.edge_length
+        succ_offset = self.succ_offset
+        succ_target = self.succ_target
+        succ_length = self.succ_length
+        succ_time = self.succ_time
+
+        best = {source: edge_time[source]}
+        length = {source: edge_length[source]}
+        pred = {source: -1}
+        settled = set()
+        remaining = set(targets) if targets is not None else None
+        heap = [(edge_time[source], source)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if remaining is not None:
+                remaining.discard(node)
+                if not remaining:
+                    break
+            for k in range(succ_offset[node], succ_offset[node + 1]):
+                nxt = succ_target[k]
+                new_cost = cost + succ_time[k] + edge_time[nxt]
+                if new_cost < best.get(nxt, float('inf')):
+                    best[nxt] = new_cost
+                    length[nxt] = length[node] + succ_length[k] + edge_length[nxt]
+                    pred[nxt] = node
+                    heapq.heappush(heap, (new_cost, nxt))
+        return {node: best[node] for node in settled}, length, pred
+
+    def _build_route(self, pred, target, cost, length):
+        """
+        Walks the predecessor links back from the target edge and packages the route
+        """
+        path = []
+        node = target
+        while node != -1:
+            path.append(self.edge_ids[node])
+            node = pred[node]
+        path.reverse()
+        return RouteResult(tuple(path), length, cost)
+
+    def one_to_many(self, from_edge, to_edges):
+        """
+        Runs a single search from one edge that stops once every destination edge has been reached
+
+        Args:
+        - from_edge: the ID of the edge the routes start on
+        - to_edges: the IDs of the destination edges, unknown edges are ignored
+
+        Returns:
+        - a SearchTree holding the route lengths to every reached edge, or None if the start edge is unknown to the router
+        """
+        source = self.edge_index.get(from_edge)
+        if source is None:
+            return None
+        targets = {self.edge_index[edge_id] for edge_id in to_edges if edge_id in self.edge_index}
+        cost, length, pred = self._search(source, targets)
+        return SearchTree(self, source, cost, length, pred)
+
+    def find_route(self, from_edge, to_edge):
+        """
+        Finds the fastest route between two edges
+
+        Args:
+        - from_edge: the ID of the edge the route starts on
+        - to_edge: the ID of the edge the route ends on
+
+        Returns:
+        - a RouteResult with the same edges and length findRoute would return (no edges if the destination cannot be reached),
+          or None if either edge is unknown to the router (for example an internal junction edge), in which case the caller should fall back to TraCI
+        """
+        source = self.edge_index.get(from_edge)
+        target = self.edge_index.get(to_edge)
+        if source is None or target is None:
+            return None
+        if source == target:
+            return RouteResult((from_edge,), self.edge_length[source], self.edge_time[source])
+        found = self._astar(source, target)
+        if found is None:
+            return RouteResult()
+        cost, length, pred = found
+        return self._build_route(pred, target, cost, length)
+
+    def _astar(self, source, target):
+        """
+        Runs an A* search by travel time between two edges
+
+        Args:
+        - source: index of the start edge
+        - target: index of the destination edge
+
+        Returns:
+        - the travel time and length of the fastest route, plus the predecessor links to rebuild it, or None if the target is unreachable
+        """
+        edge_time = self.edge_time
+        edge_length = self.edge_length
+        end_xy = self.edge_end_xy
+        succ_offset = self.succ_offset
+        succ_target = self.succ_target
+        succ_length = self.succ_length
+        succ_time = self.succ_time
+        target_x = self.edge_start_xy[2*target]
+        target_y = self.edge_start_xy[2*target+1]
+        time_per_meter = self.time_per_meter
+        hypot = math.hypot
+
+        best = {source: edge_time[source]}
+        length = {source: edge_length[source]}
+        pred = {source: -1}
+        settled = set()
+        heap = [(edge_time[source], edge_time[source], source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                return cost, length[node], pred
+            if node in settled:
+                continue
+            settled.add(node)
+            for k in range(succ_offset[node], succ_offset[node + 1]):
+                nxt = succ_target[k]
+                new_cost = cost + succ_time[k] + edge_time[nxt]
+                if new_cost < best.get(nxt, float('inf')):
+                    best[nxt] = new_cost
+                    length[nxt] = length[node] + succ_length[k] + edge_length[nxt]
+                    pred[nxt] = node
+                    estimate = 0.0 if nxt == target else hypot(end_xy[2*nxt] - target_x, end_xy[2*nxt+1] - target_y) * time_per_meter
+                    heapq.heappush(heap, (new_cost + estimate, new_cost, nxt))
+        return None
+
+
+if __name__ == "__main__":
+    import sumolib
+    import traci
+    parser = argparse.ArgumentParser(description="Checks that the local router finds the same routes as SUMO's router on a network")
+    parser.add_argument("--net", default="downtown_houston.net.xml", help="the SUMO network file")
+    parser.add_argument("--additional-files", default="vehicle_type.add.xml", help="the file defining the vehicle type")
+    parser.add_argument("--v-type", default="car", help="the vehicle type to route for")
+    parser.add_argument("--pairs", type=int, default=2000, help="the number of pairs of edges to compare")
+    parser.add_argument("--seed", type=int, default=0, help="the seed the pairs are drawn with")
+    args = parser.parse_args()
+    router = RoadRouter(sumolib.net.readNet(args.net, withInternal=True))
+    traci.start([sumolib.checkBinary("sumo"), "-n", args.net, "--additional-files", args.additional_files, "--no-step-log"])
+    try:
+        compared = router.check(lambda from_edge, to_edge: traci.simulation.findRoute(from_edge, to_edge, vType=args.v_type), args.pairs, random.Random(args.seed))
+        print(f"Local routes match SUMO's on all {compared} pairs")
+    finally:
+        traci.close()
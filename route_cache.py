@@ -0,0 +1,104 @@
+from collections import OrderedDict
+
+
+class RouteCache:
+    """
+    Bounded least-recently-used cache of route objects keyed by (from edge, to edge, vehicle type). It lives for the whole simulation,
+    so edge pairs that are routed again on later steps (waiting reservations, taxis parked on the same edge, charger lookups) are only
+    routed once. Size is capped both by number of entries and by an estimate of the memory the cached routes take up.
+    If route costs depend on time, the cache can be split into time buckets, and everything is dropped when a new bucket starts
+    """
+
+    ENTRY_BYTES = 240 # rough memory cost of one entry (key tuple, dictionary slot, route object) without its edge list, in bytes
+    EDGE_BYTES = 8 # memory cost of one edge reference in a route's edge list, in bytes (the edge ID strings are shared with the network)
+
+    def __init__(self, max_entries=50000, max_bytes=64*1024*1024, time_bucket=None):
+        """
+        Args:
+        - max_entries: the maximum number of cached routes, 0 disables the cache
+        - max_bytes: the maximum estimated memory used by the cached routes, in bytes
+        - time_bucket: length of a time bucket in s, or None if cached routes never expire
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.time_bucket = time_bucket
+        self.entries = OrderedDict() # (from edge, to edge, vehicle type) -> (route object, estimated size in bytes), least recently used first
+        self.num_bytes = 0
+        self.bucket = None # index of the current time bucket
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0, # entries dropped to respect the size limits
+            "invalidations": 0, # times the whole cache was dropped because a new time bucket started
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _estimate_size(self, route):
+        return self.ENTRY_BYTES + self.EDGE_BYTES * len(route.edges) if route else self.ENTRY_BYTES
+
+    def set_time(self, sim_time):
+        """
+        Tells the cache the current simulation time, dropping every cached route if a new time bucket has started
+
+        Args:
+        - sim_time: the current simulation time in s
+        """
+        if self.time_bucket is None:
+            return
+        bucket = int(sim_time // self.time_bucket)
+        if bucket != self.bucket:
+            if self.bucket is not None and self.entries:
+                self.stats["invalidations"] += 1
+            self.bucket = bucket
+            self.clear()
+
+    def get(self, from_edge, to_edge, v_type):
+        """
+        Looks up a route and marks it as recently used
+
+        Returns:
+        - the cached route object, or None if the pair is not cached
+        """
+        key = (from_edge, to_edge, v_type)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def put(self, from_edge, to_edge, v_type, route):
+        """
+        Stores a route, evicting the least recently used routes if the cache grows past its limits
+        """
+        if self.max_entries <= 0:
+            return
+        key = (from_edge, to_edge, v_type)
+        size = self._estimate_size(route)
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.num_bytes -= old[1]
+        self.entries[key] = (route, size)
+        self.num_bytes += size
+        while self.entries and (len(self.entries) > self.max_entries or self.num_bytes > self.max_bytes):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.num_bytes -= evicted_size
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.num_bytes = 0
+
+    def get_stats(self):
+        """
+        Returns a copy of the cache counters, including the current size and the hit rate
+        """
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["entries"] = len(self.entries)
+        stats["estimated_bytes"] = self.num_bytes
+        stats["hit_rate"] = stats["hits"] / lookups if lookups > 0 else 0.0
+        return stats
@@ -0,0 +1,52 @@
+import sumolib
+
+BACKENDS = ("sumo-gui", "sumo", "libsumo")
+
+
+class SimulationBackend:
+    """
+    Thin adapter over the module used to control SUMO, so that the rest of the code does not depend on how SUMO is run:
+    - "sumo-gui": the GUI, controlled through TraCI over a socket
+    - "sumo": the headless binary, controlled through TraCI over a socket
+    - "libsumo": SUMO loaded into this process, no socket and no GUI, by far the fastest option for batch runs
+    Every attribute that is not defined here (vehicle, person, simulation, ...) is looked up on the underlying module,
+    libsumo offers the same API as traci. The exception raised by failed commands differs between the two and is resolved once
+    as TraCIException
+    """
+
+    def __init__(self, name="sumo-gui"):
+        """
+        Args:
+        - name: "sumo-gui", "sumo" or "libsumo"
+        """
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown SUMO backend: {name}")
+        if name == "libsumo":
+            try:
+                import libsumo as module
+            except ImportError as e:
+                raise ImportError("The libsumo backend needs the libsumo package (pip install libsumo, or use the one shipped with SUMO)") from e
+        else:
+            import traci as module
+        self.name = name
+        self.module = module
+        # traci raises traci.exceptions.TraCIException, libsumo raises its own class exported at the top level of the module
+        self.TraCIException = getattr(module, "TraCIException", None) or module.exceptions.TraCIException
+
+    def __getattr__(self, attr):
+        return getattr(self.module, attr)
+
+    @property
+    def gui(self):
+        return self.name == "sumo-gui"
+
+    def start(self, options):
+        """
+        Starts SUMO with the given command line options, the binary is chosen by the backend
+
+        Args:
+        - options: list of command line options, without the binary
+        """
+        binary = sumolib.checkBinary("sumo-gui" if self.gui else "sumo")
+        gui_options = ["--start", "--quit-on-end"] if self.gui else [] # start right away and close the window at the end, only understood by the GUI
+        self.module.start([binary] + gui_options + list(options))
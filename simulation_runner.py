@@ -1,20 +1,39 @@
 import threading
-import traci
 import sumolib
 import xml.etree.ElementTree as ET
 import random
 import sys
 from queue import Queue
 import time
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
+import numpy as np
 from contextlib import suppress
 import math
+from road_router import RoadRouter
+from cost_matrix import DispatchCostMatrix
+from assignment_solver import AssignmentSolver
+from spatial_index import GridIndex
+from route_cache import RouteCache
+from charger_table import NearestChargerTable
+from fleet_state import FleetState
+from sim_backend import SimulationBackend
+from pacing import PacingController
+from state_snapshot import StateSnapshot, TaxiView, PassengerView, ChargerView
+from fleet_stream import FleetStream
+from geo_projection import NetProjection
+from fleet_aggregates import FleetAggregates
+from release_queue import ReleaseQueue
+from reservation_table import ReservationTable
+from price_forecast import PRICE_PERIOD_STARTS
+from model_cache import PriceModelCache
+from demand_trace import TraceDemand, EdgeLocator
+from demand_generator import DemandGenerator
+from cruising_table import CruisingTable
+from event_scheduler import EventScheduler, TAXI_RETURN, PRICE_PERIOD, DISPATCH, OUTPUT
+from taxi_registry import TaxiRegistry, EMPTY, CHARGING, PICKING_UP, DROPPING_OFF, OUT_OF_COMMISSION
 
 
 class SimulationRunner(threading.Thread):
-    def __init__(self, step_length=0.5, sim_start_time=0, sim_end_time=7200, num_people=1000, num_taxis=50, num_chargers=100, optimized=False, output_freq=50):
+    def __init__(self, step_length=0.5, sim_start_time=0, sim_end_time=7200, num_people=1000, num_taxis=50, num_chargers=100, optimized=False, output_freq=50, local_routing=True, assignment_backend="hungarian", dispatch_candidates=8, route_cache_size=50000, route_cache_bucket=None, sumo_backend="sumo-gui", pacing_mode="attached", real_time_factor=50.0, demand_trace=None, trace_lookahead=600.0, demand_seed=None, od_matrix=None):
         """
         Initializes the SimulationRunner object, processes the specified input parameters and defines the global variables
 
@@ -27,6 +46,18 @@ class SimulationRunner(threading.Thread):
         - num_chargers: the number of charging stations to include in the simulation
         - optimized: boolean value that indicates whether the control or the optimized version of the simulation should be run
         - output_freq: how frequently the important data from the simulation should be outputted (in seconds)
+        - local_routing: boolean value that indicates whether routes should be computed in-process from the network file instead of asking SUMO through TraCI
+        - assignment_backend: how the optimized version matches taxis to reservations, either "hungarian" (optimal) or "greedy" (cheapest pair first)
+        - dispatch_candidates: how many of the nearest pickups (by straight-line distance) each taxi is routed to during dispatch, and vice versa. 0 routes every taxi to every pickup
+        - route_cache_size: how many routes are kept between simulation steps so that the same pair of edges is not routed twice, 0 disables the cache
+        - route_cache_bucket: if set, cached routes are dropped every route_cache_bucket seconds of simulation time, for when route costs change over time
+        - sumo_backend: how SUMO is run, "sumo-gui" (GUI over TraCI), "sumo" (headless over TraCI) or "libsumo" (headless, in-process)
+        - pacing_mode: "afap" (as fast as possible), "realtime" (held at real_time_factor) or "attached" (held at real_time_factor only while the GUI is open or a client is polling)
+        - real_time_factor: simulated seconds per wall-clock second when the simulation is throttled
+        - demand_trace: path of a JSON Lines file (optionally gzip-compressed) of ride requests to replay instead of generating num_people people, see demand_trace.py for the format
+        - trace_lookahead: how many seconds of simulation time ahead of the current time the trace is read
+        - demand_seed: seed of the generator that draws the people's depart times and locations, None draws one from Python's random module
+        - od_matrix: optional weights of trips between the zones of the demand generator (see demand_generator.py), None makes every pair of valid edges equally likely
         """
         super().__init__()
 
@@ -39,45 +70,71 @@ class SimulationRunner(threading.Thread):
         self.num_chargers = num_chargers
         self.optimized = optimized
         self.output_freq = output_freq
+        self.local_routing = local_routing
+        self.assignment_solver = AssignmentSolver(backend=assignment_backend) # batch matching used by the optimized version, also keeps timing counters for dispatch
+        self.dispatch_candidates = dispatch_candidates
+        self.route_cache = RouteCache(max_entries=route_cache_size, time_bucket=route_cache_bucket) # shared by every route lookup, lives for the whole run
 
         # this second group of global variables describes the configuration of the simulation
+        self.traci = SimulationBackend(sumo_backend) # every call into SUMO goes through this adapter, which wraps either traci or libsumo
         self.network_file = "downtown_houston.net.xml" # the map on which the simulation will run
         self.sumo_cfg = "simulation2.sumocfg" # SUMO's configuration file
         self.net = None # network object created by SUMO after processing the specified map
+        self.router = None # in-process router built from the network object, used instead of traci.simulation.findRoute when local routing is enabled
+        self.fleet = FleetState(self.traci) # per-step snapshot of the taxis' TraCI variables, refreshed once after every simulation step
+        self.charger_table = None # nearest charger from every edge, used instead of routing to every charger when local routing is enabled
+        self.edge_end_xy = {} # caches the network coordinates of the end of each edge, keys are edge ids
         self.valid_edges = [] # stores the edges on which it makes sense to initialize a person, taxi, or charger object - SUMO will consider some edges as unreachable, this list will exclude most of those unreachable edges
         self.command_queue = Queue() # stores any dynamic requests made by the user while the simulation is running
+        self.snapshot = None # the StateSnapshot of the last completed step, replaced as a whole after every step. the getters used by the Flask endpoints only read from it
+        self.snapshot_energy_version = None # version of the aggregates' energy totals that the last snapshot's electricity consumption was copied from
+        self.location_xy = {} # caches the network coordinates of (lane or edge id, lane position) pairs used for people and chargers
+        self.reservations_version = 0 # incremented whenever a reservation is created, moved or deleted, so that cached depart times know when to refresh
+        self.depart_time_cache = (-1, None) # (reservations version, sorted NumPy array of all depart times)
+        self.taxi_colors = {} # taxi ID -> the (r, g, b) colour last given to the taxi, taxis start out green
+        self.stream = FleetStream(self.to_lat_lon_dict) # pushes every snapshot to the clients of the /stream endpoint
+        self.projection = None # converts network coordinates to longitude and latitude, created with the network
+        self.charger_lat_lon = {} # charger ID -> {'lat': ..., 'lon': ...}, converted once when the charger is created
         self.stop_event = threading.Event() # stores any stopping requests made by the user while the simulation is running
+        self.pacer = PacingController(mode=pacing_mode, real_time_factor=real_time_factor, gui=self.traci.gui, sleep=self.stop_event.wait) # decides how long to wait after each step, waking up early if the simulation is stopped
         self.is_running = False
         self.traci_start_time = -1 # TraCI does not accurately update its time counter from run to run, this variable stores the initial start time TraCI will be using
         self.traci_end_time = -1 # this variable stores the end time TraCI will be using, which is the sum of TraCI's start time and the simulation length
 
         # this third group of global variables keeps track of people/reservations and each person's current state
         self.person_ids = [] # stores the ids of all the people who will be making reservations during the 7200 second period
-        self.all_valid_res = {} # stores the reservation objects. keys are reservation ids, key's value is [person id, from edge, to edge, depart pos, arrival pos, depart time, edges of route from pickup to dropoff, route length]
+        self.pending_people = {} # people whose reservations have not been created yet. keys are reservation ids, each value is (person id, depart time, RideRequest or None)
+        self.demand_seed = demand_seed
+        self.od_matrix = od_matrix
+        self.demand_generator = None # draws people in bulk, created with the network
+        self.cruising_table = None # reachable destinations of empty taxis, created with the network
+        self.demand_trace = demand_trace
+        self.trace_lookahead = trace_lookahead
+        self.trace_demand = None # TraceDemand streaming the ride requests of demand_trace, created with the people
+        self.all_valid_res = ReservationTable() # stores the reservation objects in typed arrays. keys are reservation ids, indexing a key gives a record that reads like [person id, from edge, to edge, depart pos, arrival pos, depart time, edges of route from pickup to dropoff, route length]
         self.unreached_reservations = [] # stores the reservation ids that were unreachable in a time step because they were initialized in an inaccessible corner of the map
-        self.waiting_reservations = [] # stores reservation ids that have not been assigned to taxis
+        self.waiting_reservations = {} # stores reservation ids that have not been assigned to taxis, as keys (values are None) so that the ids stay in the order they were added and can be removed in constant time
+        self.release_queue = ReleaseQueue() # reservations whose people have not been added to the simulation yet, ordered by depart time
         self.assigned_reservations = {} # stores reservation ids that have been assigned to taxis and are waiting to be picked up. keys are reservation ids, key's value is taxi id
         self.heading_home_reservations = {} # stores reservation ids that have been picked up by taxis and are on their way to their destinations. keys are reservation ids, key's value is taxi id
         self.completed_reservations = [] # stores the reservation ids that were successfully dropped off
-        self.reservation_wait_times = {} # stores the amount of time each reservation had to wait before it was picked up. keys are reservation ids, key's value is difference between reservation's pickup time and depart time
 
         # this fourth group of global variables keeps track of the taxis and each taxi's current state
-        self.taxi_ids = [] # keeps track of all the taxis in the simulation
-        self.empty_taxis = {} # keeps track of all the taxis in simulation that are currently unoccupied and unassigned, however these taxis still have random routes. keys are taxi ids, each value is taxi's random destination edge
-        self.charging_taxis = {} # keeps track of all the taxis in simulation that are currently on their way to a charger. keys are taxi ids, each value is corresponding charger id
-        self.picking_up_taxis = {} # keeps track of all the taxis in simulation that are currently on their way to pick up a person. keys are taxi ids, each value is [reservation id, pickup edge]
-        self.dropping_off_taxis = {} # keeps track of all the taxis in simulation that are currently on their way to drop off a person. keys are taxi ids, each value is [reservation id, dropoff edge, pickup time, distance from pickup to dropoff]
-        self.out_of_commission = {} # stores the taxis that are inoperable for some reason. keys are taxi ids, each value is [time when taxi can re-enter simulation, amount of charge taxi should be reset with]
-
-        # this fifth group of global variables keeps track of all the values needed to calculate the cost spent by each taxi on charging and towing
-        self.cost_per_charging_trip = {} # stores how much each taxi spent on charge everytime it visited a charger. keys are taxi ids, each value is [cost of electricity at first charging trip, cost of electricity at second charging trip, ...]
-        self.cost_per_tow = {} # stores how much each taxi spent on charge everytime it needed to be towed due to low charge. keys are taxi ids, each value is [cost of electricity at first tow, cost of electricity at second tow, ...]
+        self.taxi_registry = TaxiRegistry() # every taxi with its state, taxis only change state through the registry's transitions
+        self.taxi_ids = self.taxi_registry.ids() # keeps track of all the taxis in the simulation
+        self.taxi_index = GridIndex() # spatial index of the taxis' last known positions, updated as taxis become available for dispatch and cleared when they leave the simulation
+        self.empty_taxis = self.taxi_registry.view(EMPTY) # keeps track of all the taxis in simulation that are currently unoccupied and unassigned, however these taxis still have random routes. keys are taxi ids, each value is taxi's random destination edge
+        self.charging_taxis = self.taxi_registry.view(CHARGING) # keeps track of all the taxis in simulation that are currently on their way to a charger. keys are taxi ids, each value is corresponding charger id
+        self.picking_up_taxis = self.taxi_registry.view(PICKING_UP) # keeps track of all the taxis in simulation that are currently on their way to pick up a person. keys are taxi ids, each value is [reservation id, pickup edge]
+        self.dropping_off_taxis = self.taxi_registry.view(DROPPING_OFF) # keeps track of all the taxis in simulation that are currently on their way to drop off a person. keys are taxi ids, each value is [reservation id, dropoff edge, pickup time, distance from pickup to dropoff]
+        self.out_of_commission = self.taxi_registry.view(OUT_OF_COMMISSION) # stores the taxis that are inoperable for some reason. keys are taxi ids, each value is [time when taxi can re-enter simulation, amount of charge taxi should be reset with]
+
+        # this fifth group of global variables keeps track of the prices needed to calculate the cost of charging and towing, the costs themselves are kept by self.aggregates
         self.tow_base_price = 100 # in $
         self.charge_base_price = round(random.uniform(5,10),1) # in $
         self.electricity_costs = [] # in $/kWh
 
-        # this sixth group of global variables keeps track of all the values needed to calculate the earnings of each taxi from successfully completing reservations
-        self.completed_reservations_by_taxi = {} # stores all the reservations each taxi has successfully picked up and dropped off. keys are taxi ids, each value is [distance between pickup and dropoff edges, demand multiplier, time of day rate]
+        # this sixth group of global variables keeps track of the prices needed to calculate the earnings from completed reservations, the earnings themselves are kept by self.aggregates
         #   Based on real-world data, GPT suggestions, and the limitations of the simulation, the price of a taxi ride (the amount earned by the taxi company for each ride) will be calculated as follows:
         #       total price = base price + (distance price * demand multiplier * time of day rate), where
         #           base price is some fixed amount, reasonable values are between $4-$8
@@ -94,13 +151,19 @@ class SimulationRunner(threading.Thread):
         self.tod_rate_evening_rush = self.tod_rate_normal*1.3
 
 
-        self.electricity_consumption_per_taxi = {} # stores the total amount of electricity used by each taxi since the beginning of the simulation. keys are taxi ids, each value is amount of electricity that taxi has used in Wh
-        self.total_distance_driven_per_taxi = {} # stores the total distance each taxi has driven since the beginning of the simulation. keys are taxi ids, each value is amount taxi has driven in km
+        self.aggregates = FleetAggregates(self.taxi_ride_base_price, self.taxi_ride_distance_rate, self.charge_base_price, self.tow_base_price) # running totals of earnings, costs, wait times, energy and distance, updated as things happen
         
         self.active_chargers = [] # keeps track of all the chargers that are operational
 
-        self.optimized_pending_res_update_time = self.sim_start_time+10 # optimized taxi assignments happen less frequently than in the control in order to minimize redundant driving. this variable keeps track of when to update
-        self.all_significant_data_update_time = self.sim_start_time+self.output_freq # keeps track of when to output the significant data from the simulation
+        # Timed events of the simulation loop: out of commission taxis returning, price periods starting, optimized taxi assignments and data output
+        self.events = EventScheduler()
+        self.events.schedule(self.sim_start_time, PRICE_PERIOD) # sets the prices of the period the simulation starts in
+        for period_start in PRICE_PERIOD_STARTS:
+            if self.sim_start_time < period_start < self.sim_end_time:
+                self.events.schedule(period_start, PRICE_PERIOD)
+        if self.optimized:
+            self.events.schedule(self.sim_start_time+10, DISPATCH) # optimized taxi assignments happen less frequently than in the control in order to minimize redundant driving
+        self.events.schedule(self.sim_start_time+self.output_freq, OUTPUT) # outputs the significant data from the simulation
 
         # Counters
         self.person_counter = 0
@@ -127,10 +190,11 @@ class SimulationRunner(threading.Thread):
         try:
             self.initialize_network()
             self.initialize_simulation()
-            self.traci_start_time = traci.simulation.getTime()
+            self.check_local_routing()
+            self.traci_start_time = self.traci.simulation.getTime()
             self.traci_end_time = self.sim_end_time - self.sim_start_time + self.traci_start_time
             self.generate_detectors_xml()
-            self.generate_persons_xml()
+            self.generate_people()
             self.write_times_into_sumo_file()
             self.spawn_taxis()
             self.simulation_loop()
@@ -146,37 +210,114 @@ class SimulationRunner(threading.Thread):
         Initializes the network by processing the specified map and storing important information
         """
         print("Initializing network and filtering valid edges...")
-        self.net = sumolib.net.readNet(self.network_file)
+        self.net = sumolib.net.readNet(self.network_file, withInternal=True) # internal lanes are needed so that local routes have the same length as SUMO's
+        self.router = RoadRouter(self.net) # also computes the strongly connected components, which are needed even if local routing is disabled
+        print(f"Built local router over {len(self.router.edge_ids)} drivable edges, the main component has {self.router.component_size[self.router.main_component] if self.router.main_component >= 0 else 0} of them")
         self.valid_edges = [
             edge.getID()
-            for edge in self.net.getEdges()
-            if edge.getLaneNumber() > 0 and edge.getOutgoing() and edge.getIncoming() and edge.getLanes()[0].getLength() >= 30
-        ] # stores the edges in the simulation that are less likely to be unreachable
+            for edge in self.net.getEdges(withInternal=False)
+            if edge.getLaneNumber() > 0 and edge.getOutgoing() and edge.getIncoming() and edge.getLanes()[0].getLength() >= 30 and self.router.in_main_component(edge.getID())
+        ] # stores the edges in the simulation that can all reach each other, because they lie in the main strongly connected component
         print(f"Num valid edges: {len(self.valid_edges)}")
+        self.projection = NetProjection.from_net(self.net)
+        demand_seed = self.demand_seed if self.demand_seed is not None else random.getrandbits(64) # runs seeded through random stay reproducible
+        self.demand_generator = DemandGenerator(self.net, self.valid_edges, od_matrix=self.od_matrix, seed=demand_seed)
+        self.cruising_table = CruisingTable(self.router, self.valid_edges)
+        for edge in self.net.getEdges(withInternal=True):
+            self.all_valid_res.intern_edge(edge.getID()) # reservations store edges as integer indices
+        if self.local_routing:
+            self.charger_table = NearestChargerTable(self.router)
+
+    def find_route(self, from_edge, to_edge, v_type="car"):
+        """
+        Finds the fastest route a taxi can take between two edges. Answers from the route cache when possible, otherwise uses the local router
+        when it is enabled, and falls back to TraCI's router if local routing is disabled or the router does not know one of the edges
+        (for example when a taxi is in the middle of a junction)
+
+        Args:
+        - from_edge: the ID of the edge the route starts on
+        - to_edge: the ID of the edge the route ends on
+        - v_type: the vehicle type to route for, the local router only handles taxis ("car")
+
+        Returns:
+        - the route object, its edges are empty if no route exists
+        """
+        route = self.route_cache.get(from_edge, to_edge, v_type)
+        if route is not None:
+            return route
+        if self.local_routing and self.router is not None and v_type == "car":
+            route = self.router.find_route(from_edge, to_edge)
+        if route is None:
+            route = self.traci.simulation.findRoute(from_edge, to_edge, vType=v_type)
+        self.route_cache.put(from_edge, to_edge, v_type, route)
+        return route
+
+    def is_reachable(self, from_edge, to_edge):
+        """
+        Checks in constant time whether any route exists between two edges, using the strongly connected components of the network
+
+        Args:
+        - from_edge: the ID of the edge the route would start on
+        - to_edge: the ID of the edge the route would end on
+
+        Returns:
+        - True or False, or None if the answer is unknown (for example when a taxi is in the middle of a junction)
+        """
+        if self.router is None:
+            return None
+        return self.router.is_reachable(from_edge, to_edge)
+
+    def choose_random_route(self):
+        """
+        Picks two different valid edges at random along with the route between them. Every valid edge can reach every other one,
+        so a route is only computed once per pair and there is no need to retry after failed routes
+
+        Returns:
+        - the start edge ID, the destination edge ID, and the route object
+        """
+        while True:
+            start_edge_id = random.choice(self.valid_edges)
+            dest_edge_id = random.choice(self.valid_edges)
+            if dest_edge_id == start_edge_id or self.is_reachable(start_edge_id, dest_edge_id) is False:
+                continue
+            route = self.find_route(start_edge_id, dest_edge_id)
+            if route and route.edges:
+                return start_edge_id, dest_edge_id, route
 
 
     def initialize_simulation(self):
         """
         Initializes the SUMO simulation and activates TraCI
         """
-        print("Starting SUMO simulation...")
-        sumo_binary = sumolib.checkBinary('sumo-gui')
-        sumo_cmd = [
-            sumo_binary,
+        print(f"Starting SUMO simulation ({self.traci.name})...")
+        sumo_options = [
             "-c",
             self.sumo_cfg,
-            "--start",
-            "--quit-on-end",
             "--step-length",
             str(self.step_length),
             "--additional-files",
-            "vehicle_type.add.xml,persons.add.xml,detectors.add.xml",
+            "vehicle_type.add.xml,detectors.add.xml",
             "--collision.action",
             "none",
         ]
-        traci.start(sumo_cmd)
+        self.traci.start(sumo_options)
         print("SUMO simulation started.")
 
+    def check_local_routing(self):
+        """
+        Compares the local router against SUMO's router on a sample of routes before any route is used. If they disagree, for example on a
+        network with junction types the router does not model, routes are taken from TraCI for the whole run
+        """
+        if not self.local_routing or self.router is None:
+            return
+        try:
+            compared = self.router.check(lambda from_edge, to_edge: self.traci.simulation.findRoute(from_edge, to_edge, vType="car"))
+            print(f"Local router matches SUMO's router on {compared} sampled routes")
+        except ValueError as e:
+            print(f"{e}\nFalling back to routing through TraCI")
+            self.local_routing = False
+            self.charger_table = None
+
     def generate_detectors_xml(self):
         """
         Adds the user-specified number of chargers at random locations
@@ -191,9 +332,12 @@ class SimulationRunner(threading.Thread):
             charger_id = f"charger_{self.charger_counter}"
             self.charger_counter += 1
             self.active_chargers.append((charger_id, lane.getID(), lane_pos))
+            if self.charger_table is not None:
+                self.charger_table.add_charger(charger_id, edge_id)
             detectors.append(f'''
 <inductionLoop id="{charger_id}" lane="{lane.getID()}" pos="{str(lane_pos)}" freq="10" file="detector_output.xml" />
             ''')
+        self.convert_charger_positions(self.active_chargers)
             # print(f"Added valid charger {charger_id} on lane {lane.getID()} (length: {lane_length}) at position {lane_pos}")
         with open('detectors.add.xml', 'w') as f:
             f.write('<additional>\n')
@@ -201,75 +345,75 @@ class SimulationRunner(threading.Thread):
             f.write('</additional>\n')
         print(f"Updated detectors.add.xml with {len(detectors)} chargers.")
 
-    def generate_persons_xml(self):
+    def generate_people(self):
         """
-        Creates the user-specified number of people, assigns each a departure time, and chooses pickup and dropoff locations at random but ensures a route exists between them
+        Creates the user-specified number of people, drawing their departure times and pickup and dropoff locations in one batch from the demand generator.
+        People are only kept in memory until they depart, their reservations (and routes) are created when they are released into the simulation
+        If a demand trace was given, its ride requests are replayed instead, the trace is read as the simulation goes
         """
-        persons = []
-        for _ in range(self.num_people):
-            edges_are_valid = False
-            pickup_edge_id = random.choice(self.valid_edges)
-            dropoff_edge_id = random.choice(self.valid_edges)
-            curr_route = None
-            while not edges_are_valid:
-                curr_route = traci.simulation.findRoute(pickup_edge_id, dropoff_edge_id, vType="car")
-                if curr_route and curr_route.edges and dropoff_edge_id != pickup_edge_id:
-                    edges_are_valid = True
-                else:
-                    pickup_edge_id = random.choice(self.valid_edges)
-                    dropoff_edge_id = random.choice(self.valid_edges)
+        if self.demand_trace is not None:
+            locator = EdgeLocator(self.net, self.valid_edges, self.projection)
+            self.trace_demand = TraceDemand(self.demand_trace, self.valid_edges, locator, start_time=self.sim_start_time, lookahead=self.trace_lookahead)
+            print(f"Replaying ride requests from '{self.demand_trace}'.")
+            return
+        self.add_pending_people(self.demand_generator.generate(self.num_people, start_time=self.sim_start_time).requests())
+        print(f"Scheduled {self.num_people} people.")
+
+    def add_pending_people(self, requests):
+        """
+        Creates a person for each ride request and queues them until their depart time
+
+        Args:
+        - requests: a list of RideRequests
+        """
+        for request in requests:
             person_id = f"person_{self.person_counter}"
             self.person_counter += 1
             self.person_ids.append(person_id)
-            depart_time = self.set_depart_time()
-            pickup_lane = self.net.getEdge(pickup_edge_id).getLanes()[0]
-            dropoff_lane = self.net.getEdge(dropoff_edge_id).getLanes()[0]
-            persons.append(f'''
-<person id="{person_id}" depart="{depart_time}">
-    <stop lane="{pickup_lane.getID()}" duration = "{7200 - depart_time}"/>
-</person>
-            ''') # duration ensures that a person can stay in the simulation for as long as it takes to get picked up by a taxi
-            pickup_pos = random.uniform(max(pickup_lane.getLength()*(1/4), 13), min(pickup_lane.getLength()*(3/4), pickup_lane.getLength()-13))
-            dropoff_pos = random.uniform(max(dropoff_lane.getLength()*(1/4), 13), min(dropoff_lane.getLength()*(3/4), dropoff_lane.getLength()-13))
-            res_id = len(persons)-1
-            self.all_valid_res[res_id] = [person_id, pickup_edge_id, dropoff_edge_id, pickup_pos, dropoff_pos, depart_time, curr_route.edges, curr_route.length]
-            # print(f"Person {person_id} added with ride from {pickup_edge_id} to {dropoff_edge_id}")
-        with open('persons.add.xml', 'w') as f:
-            f.write('<additional>\n')
-            f.writelines(persons)
-            f.write('</additional>\n')
-        print(f"Validated and wrote {len(persons)} person routes to 'persons.add.xml'.")
+            res_id = self.person_counter-1
+            self.pending_people[res_id] = (person_id, request.depart_time, request)
+            self.release_queue.push(res_id, request.depart_time)
 
-    def set_depart_time(self):
+    def add_trace_people(self, simulation_time):
         """
-        Decides a passenger's depart time based on real-world reservation activity trends. If the depart time is set to be earlier than the user-specified start time,
-        which can happen if the user starts the simulation in the middle of the day, the person will depart at the simulation's start time
+        Turns the ride requests of the demand trace whose time has come into people, who are added to the simulation in the same step
+        """
+        self.add_pending_people(self.trace_demand.pop_due(simulation_time))
+
+    def create_reservation(self, res_id, person_id, depart_time, trip=None):
+        """
+        Creates a reservation at the locations of a ride request (from the demand generator or the demand trace), or at random locations
+        between which a route exists
+
+        Args:
+        - res_id: The ID of the reservation
+        - person_id: The ID of the person making the reservation
+        - depart_time: The simulation time at which the person departs
+        - trip: The RideRequest with the reservation's locations, None to choose them at random
+        """
+        if trip is not None:
+            pickup_edge_id, dropoff_edge_id = trip.pickup_edge, trip.dropoff_edge
+            curr_route = self.find_route(pickup_edge_id, dropoff_edge_id)
+            if not curr_route or not curr_route.edges:
+                print(f"Ride request of person {person_id} from {pickup_edge_id} to {dropoff_edge_id} has no route and was skipped")
+                return
+        else:
+            pickup_edge_id, dropoff_edge_id, curr_route = self.choose_random_route()
+        pickup_lane = self.net.getEdge(pickup_edge_id).getLanes()[0]
+        dropoff_lane = self.net.getEdge(dropoff_edge_id).getLanes()[0]
+        # safest to initialize person and charger objects in the middle of their specified lanes to prevent taxis from disappearing from the simulation when they reach their destination
+        if trip is not None and trip.pickup_pos is not None:
+            pickup_pos = trip.pickup_pos
+        else:
+            pickup_pos = random.uniform(max(pickup_lane.getLength()*(1/4), 13), min(pickup_lane.getLength()*(3/4), pickup_lane.getLength()-13))
+        if trip is not None and trip.dropoff_pos is not None:
+            dropoff_pos = trip.dropoff_pos
+        else:
+            dropoff_pos = random.uniform(max(dropoff_lane.getLength()*(1/4), 13), min(dropoff_lane.getLength()*(3/4), dropoff_lane.getLength()-13))
+        self.all_valid_res.add(res_id, person_id, pickup_edge_id, dropoff_edge_id, pickup_pos, dropoff_pos, depart_time, curr_route.edges, curr_route.length)
+        self.reservations_version += 1
+        # print(f"Person {person_id} added with ride from {pickup_edge_id} to {dropoff_edge_id}")
 
-        Returns:
-        - the simulation time in seconds at which the passenger should depart
-        """
-        depart_time_prob = random.random()
-        if depart_time_prob <= 0.06:  # 6% of reservations should happen between midnight and 6am
-            depart_time = round(random.uniform(0, 1800), 1)
-        elif depart_time_prob <= 0.13:  # 7% of reservations should happen between 6am and 8am
-            depart_time = round(random.uniform(1800, 2400), 1)
-        elif depart_time_prob <= 0.24:  # 11% of reservations should happen between 8am and 10am
-            depart_time = round(random.uniform(2400, 3000), 1)
-        elif depart_time_prob <= 0.5:  # 26% of reservations should happen between 10am and 2pm
-            depart_time = round(random.uniform(3000, 4200), 1)
-        elif depart_time_prob <= 0.61:  # 11% of reservations should happen between 2pm and 4pm
-            depart_time = round(random.uniform(4200, 4800), 1)
-        elif depart_time_prob <= 0.7:  # 9% of reservations should happen between 4pm and 6pm
-            depart_time = round(random.uniform(4800, 5400), 1)
-        elif depart_time_prob <= 0.83:  # 13% of reservations should happen between 6pm and 8pm
-            depart_time = round(random.uniform(5400, 6000), 1)
-        elif depart_time_prob <= 0.94:  # 11% of reservations should happen between 8pm and 10pm
-            depart_time = round(random.uniform(6000, 6600), 1)
-        else:  # 6% of reservations should happen between 10pm and 11:59pm
-            depart_time = round(random.uniform(6600, 7200), 1)
-
-        return max(depart_time, self.sim_start_time)
-    
     def write_times_into_sumo_file(self):
         """
         Adds the user-specified start and end times to the simulation's configuration file
@@ -290,29 +434,18 @@ class SimulationRunner(threading.Thread):
         Creates the user-specified number of taxis and initializes each with a random route and a random amount of charge
         """
         for _ in range(self.num_taxis):
-            edges_are_valid = False
-            rand_route = None
-            start_edge_id = random.choice(self.valid_edges)
-            dest_edge_id = random.choice(self.valid_edges)
-            while not edges_are_valid:
-                rand_route = traci.simulation.findRoute(start_edge_id, dest_edge_id, vType="car")
-                if rand_route and rand_route.edges and dest_edge_id != start_edge_id:
-                    edges_are_valid = True
-                else:
-                    start_edge_id = random.choice(self.valid_edges)
-                    dest_edge_id = random.choice(self.valid_edges)
+            start_edge_id, dest_edge_id, rand_route = self.choose_random_route()
             taxi_id = f"taxi_{self.taxi_counter}"
             self.taxi_counter += 1
             route_id = f"route_{taxi_id}"
-            traci.route.add(route_id, rand_route.edges)
-            traci.vehicle.add(taxi_id, routeID=route_id, typeID="car", departPos="random", departLane="best", departSpeed="max")
-            self.empty_taxis[taxi_id] = dest_edge_id
+            self.traci.route.add(route_id, rand_route.edges)
+            self.traci.vehicle.add(taxi_id, routeID=route_id, typeID="car", departPos="random", departLane="best", departSpeed="max")
+            self.taxi_registry.add(taxi_id, EMPTY, dest_edge_id)
             charge_amount = random.randint(7,60)
             charge_amount = charge_amount*100
-            traci.vehicle.setParameter(taxi_id, "device.battery.actualBatteryCapacity", charge_amount) #Wh
-            traci.vehicle.setParameter(taxi_id, "device.battery.maximumBatteryCapacity", 8000)  # Wh
+            self.traci.vehicle.setParameter(taxi_id, "device.battery.actualBatteryCapacity", str(charge_amount)) #Wh
+            self.traci.vehicle.setParameter(taxi_id, "device.battery.maximumBatteryCapacity", "8000")  # Wh
             # print(f"Spawned {taxi_id} at edge {start_edge_id} with {charge_amount} Wh charge (maximum is {float(traci.vehicle.getParameter(taxi_id, 'device.battery.maximumBatteryCapacity'))} Wh)")
-            self.taxi_ids.append(taxi_id)
         print(f"Confirmed Taxis in Simulation: {len(self.taxi_ids)}")
 
 
@@ -323,34 +456,141 @@ class SimulationRunner(threading.Thread):
         Returns
         - the simulation status, including the current time and the numbers of active people, taxis, and chargers
         """
-        try:
-            simulation_time = traci.simulation.getTime() - self.traci_start_time
-            # num_taxis = len([tid for tid in traci.vehicle.getIDList() if tid in self.taxi_ids])
-            # num_people = len([pid for pid in traci.person.getIDList() if pid in self.person_ids])
-            num_taxis_in_sim = len(traci.vehicle.getIDList())
-            num_taxis_out_of_commission = len(self.out_of_commission.keys())
-            num_people_in_sim = len(self.waiting_reservations) + len(self.assigned_reservations.keys()) + len(self.heading_home_reservations.keys()) # both number of pending reservations and number of occupied taxis
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        return dict(snapshot.status)
+
+    def publish_snapshot(self):
+        """
+        Collects everything the Flask endpoints report into a new StateSnapshot and publishes it. Runs on the simulation thread after every step,
+        taxi data comes from the fleet state so this only costs a single call into SUMO
+        """
+        current_time = self.traci.simulation.getTime()
+        waiting_or_assigned = set(self.waiting_reservations)
+        waiting_or_assigned.update(self.assigned_reservations.keys())
+
+        taxis = []
+        taxis_on_lane = {} # lane id -> positions of the taxis on it, used to find chargers that are in use
+        for taxi_id in self.fleet.ids:
+            taxi_state = self.fleet.get(taxi_id)
+            state = self.taxi_registry.state(taxi_id, EMPTY)
+            x, y = taxi_state.position
+            taxis.append(TaxiView(taxi_id, x, y, taxi_state.battery / 8000 * 100.0, taxi_state.lane_id, taxi_state.lane_position, state, self.taxi_colors.get(taxi_id, (0, 255, 0)))) # every taxi's maximum battery capacity is 8000 Wh
+            taxis_on_lane.setdefault(taxi_state.lane_id, []).append(taxi_state.lane_position)
+
+        reservations = self.all_valid_res
+        passengers = []
+        for res_id in waiting_or_assigned:
+            if res_id in reservations:
+                x, y = self.get_location_xy(reservations.pickup_edge(res_id), reservations.pickup_pos(res_id))
+                passengers.append(PassengerView(reservations.person_id(res_id), x, y))
+        taxi_positions = {taxi.taxi_id: (taxi.x, taxi.y) for taxi in taxis}
+        for res_id, taxi_id in self.heading_home_reservations.items():
+            if res_id in reservations and taxi_id in taxi_positions:
+                x, y = taxi_positions[taxi_id] # people riding in a taxi are shown where the taxi is
+                passengers.append(PassengerView(reservations.person_id(res_id), x, y))
+
+        chargers = []
+        distance_threshold = 5.0  # meters within which a taxi is considered to be using the charger
+        for charger_id, lane_id, position in self.active_chargers:
+            x, y = self.get_location_xy(None, position, lane_id)
+            in_use = any(abs(taxi_position - position) < distance_threshold for taxi_position in taxis_on_lane.get(lane_id, ()))
+            chargers.append(ChargerView(charger_id, x, y, in_use))
+
+        # a reservation has started once its depart time has passed, and is unsatisfied if it has waited more than 15 minutes without being picked up
+        if self.depart_time_cache[0] != self.reservations_version:
+            self.depart_time_cache = (self.reservations_version, np.sort(reservations.depart_time_array()))
+        total_started = int(np.searchsorted(self.depart_time_cache[1], current_time, side="right"))
+        unsatisfied_count = 0
+        for res_id in waiting_or_assigned:
+            if res_id in reservations and current_time - reservations.depart_time(res_id) > 900:
+                unsatisfied_count += 1
+
+        taxis_with_passengers = set(self.dropping_off_taxis.keys())
+        taxis_with_passengers.update(self.heading_home_reservations.values())
+
+        status = {
+            "simulation_time": current_time - self.traci_start_time,
+            "num_taxis_in_sim": len(self.fleet.ids),
+            "num_taxis_out_of_commission": len(self.out_of_commission.keys()),
+            "num_people_in_sim": len(self.waiting_reservations) + len(self.assigned_reservations.keys()) + len(self.heading_home_reservations.keys()), # both number of pending reservations and number of occupied taxis
             # Please note that num_people_in_sim will be different from the number of people shown on the bottom right corner of the SUMO display window. This is because,
             # due to our implementation, the number on the SUMO window only counts the number of reservations waiting to be picked up, and omits the number of people
             # riding in taxis
-            num_active_chargers = len(self.active_chargers)
-
-            # return {
-            #     "simulation_time": simulation_time,
-            #     "num_taxis": num_taxis,
-            #     "num_people": num_people,
-            #     "num_chargers": num_chargers,
-            # }
-            return {
-                "simulation_time": simulation_time,
-                "num_taxis_in_sim": num_taxis_in_sim,
-                "num_taxis_out_of_commission": num_taxis_out_of_commission,
-                "num_people_in_sim": num_people_in_sim,
-                "num_active_chargers": num_active_chargers,
-            }
-        except Exception as e:
-            print(f"Error fetching simulation status: {e}")
-            return {}
+            "num_active_chargers": len(self.active_chargers),
+            "dispatch_timings": self.assignment_solver.get_timings(),
+            "route_cache": self.route_cache.get_stats(),
+            "fleet_round_trips": self.fleet.round_trips,
+            "pacing": self.pacer.get_stats(self.step_length),
+            "stream_clients": self.stream.num_clients,
+        }
+        energy = self.aggregates.energy
+        if self.snapshot is not None and self.snapshot_energy_version == energy.version:
+            electricity_consumption = self.snapshot.electricity_consumption # no taxi's total has changed since the last snapshot
+        else:
+            electricity_consumption = dict(energy.values)
+            self.snapshot_energy_version = energy.version
+        self.snapshot = StateSnapshot(
+            time=current_time,
+            status=status,
+            taxis=tuple(taxis),
+            passengers=tuple(passengers),
+            chargers=tuple(chargers),
+            electricity_consumption=electricity_consumption,
+            average_wait_time=self.aggregates.wait_times.mean() or 0.0,
+            active_passengers=len(self.waiting_reservations) + len(self.assigned_reservations) + len(self.heading_home_reservations),
+            taxis_with_passengers=len(taxis_with_passengers),
+            unsatisfaction={
+                "unsatisfied_rate": (unsatisfied_count / total_started) if total_started > 0 else 0.0,
+                "unsatisfied_count": unsatisfied_count,
+                "total_started": total_started,
+                "time": current_time,
+            },
+            total_earnings=self.aggregates.earnings,
+            total_cost=self.aggregates.total_cost,
+        ) # publishing is a single reference assignment, readers see either the previous snapshot or this one
+        self.stream.publish(self.snapshot)
+
+    def set_taxi_color(self, taxi_id, color):
+        """
+        Sets the colour of a taxi in SUMO and remembers it for the stream
+        """
+        self.traci.vehicle.setColor(taxi_id, color)
+        self.taxi_colors[taxi_id] = color
+
+    def get_location_xy(self, edge_id, lane_pos, lane_id=None):
+        """
+        Returns the network coordinates of a position on an edge's first lane (or on the given lane), the results are cached
+        """
+        key = (lane_id or edge_id, lane_pos)
+        if key not in self.location_xy:
+            lane = self.net.getLane(lane_id) if lane_id is not None else self.net.getEdge(edge_id).getLanes()[0]
+            self.location_xy[key] = tuple(self.getXYFromLanePos(lane, lane_pos))
+        return self.location_xy[key]
+
+    def to_lat_lon(self, x, y):
+        """
+        Converts network coordinates to {'lat': ..., 'lon': ...} using the network's projection, without asking SUMO
+        """
+        lon, lat = self.projection.to_lon_lat(x, y)
+        return {'lat': float(lat), 'lon': float(lon)}
+
+    def to_lat_lon_dict(self, ids, x, y):
+        """
+        Converts many points to {id: {'lat': ..., 'lon': ...}} with a single projection call
+        """
+        return self.projection.to_lat_lon_dict(ids, x, y)
+
+    def convert_charger_positions(self, chargers):
+        """
+        Converts the positions of new chargers to longitude and latitude once, since chargers never move
+
+        Args:
+        - chargers: list of (charger ID, lane ID, lane position)
+        """
+        points = [self.get_location_xy(None, position, lane_id) for _, lane_id, position in chargers]
+        self.charger_lat_lon.update(self.to_lat_lon_dict([charger[0] for charger in chargers], [point[0] for point in points], [point[1] for point in points]))
 
     def simulation_loop(self):
         """
@@ -361,14 +601,17 @@ class SimulationRunner(threading.Thread):
 
         
         # The optimized version builds a predictive model to guess future electricity prices based on provided historical data
+        # The model is evaluated once for every step of the day, charging decisions look the predictions up
+        # The table (and the model it was built with) are cached on disk, run `python model_cache.py --rebuild` to retrain
         if self.optimized:
             path_to_data = "historical_elec_cost_data.xlsx"
-            historical_data = self.load_historical_data(path_to_data)
-            x_time, y_price = self.get_hist_data(historical_data)
-            pred_models = self.train_prediction_models(x_time, y_price)
+            price_forecast = PriceModelCache(path_to_data).load_table(self.step_length)
         
         while not self.stop_event.is_set() and simulation_time < self.sim_end_time:
-            if simulation_time >= self.all_significant_data_update_time or simulation_time==self.sim_start_time:
+            # Takes the timed events that are due off the scheduler, each kind is handled at its place in the step
+            due_events = self.events.pop_due(simulation_time)
+            output_due = OUTPUT in due_events
+            if output_due or simulation_time==self.sim_start_time:
                 print(f"Time: {simulation_time}")
 
             # Process commands from the queue
@@ -393,11 +636,9 @@ class SimulationRunner(threading.Thread):
 
             try:
                 # Step the simulation forward
-                traci.simulationStep()
-
-                # TraCI does not accurately update its taxi ID list from run to run, this forces a clean slate by deleting any people that carried over from the previous run
-                if simulation_time == self.sim_start_time:
-                    self.clear_residual_variables()
+                self.traci.simulationStep()
+                self.fleet.refresh() # one bulk read of every taxi's state, the rest of the step reads from this snapshot
+                self.route_cache.set_time(simulation_time)
 
                 for unreached_res_id in self.unreached_reservations:
                     # We get here if a reservation that was set at runtime is actually unreachable by the taxis
@@ -405,30 +646,36 @@ class SimulationRunner(threading.Thread):
                     # So at this point in the program, the reservation is reinitialized at a new random location
                     unreached_person_id = self.all_valid_res[unreached_res_id][0]
                     del self.all_valid_res[unreached_res_id]
-                    traci.person.remove(unreached_person_id)
+                    self.reservations_version += 1
+                    self.traci.person.remove(unreached_person_id)
                     self.reinit_res(unreached_res_id, unreached_person_id, simulation_time)
                     print(f"Reservation #{unreached_res_id} was unreached last time step and has now been reinitialized")
                 self.unreached_reservations.clear()
                 
-                # Checks the reservations for any new ones that should be added to the sim (if their depart time has just passed) and creates them
-                for res_id in self.all_valid_res.keys():
-                    end_cond = self.all_valid_res[res_id][5]<=simulation_time and res_id not in self.unreached_reservations and res_id not in self.waiting_reservations and res_id not in self.assigned_reservations.keys() and res_id not in self.heading_home_reservations.keys() and res_id not in self.completed_reservations
-                    if end_cond:
+                # Takes the reservations whose depart time has just passed out of the release queue and creates them in the sim
+                # People are only added to SUMO here, when they depart, new people's reservations are created at the same time
+                if self.trace_demand is not None:
+                    self.add_trace_people(simulation_time)
+                for res_id in self.release_queue.pop_due(simulation_time):
+                    if res_id in self.pending_people:
+                        person_id, depart_time, trip = self.pending_people.pop(res_id)
+                        self.create_reservation(res_id, person_id, depart_time, trip)
+                    if res_id in self.all_valid_res:
                         #print(f"Reservation #{res_id} has just departed")
                         self.new_res_counter += 1
-                        self.waiting_reservations.append(res_id)
+                        self.waiting_reservations[res_id] = None
                         traci_depart_time = self.all_valid_res[res_id][5]-self.sim_start_time+self.traci_start_time # because TraCI does not accurately update its timekeeping from run to run, this scales the simulation depart time to the equivalent time when TraCI should add it
-                        traci.person.add(self.all_valid_res[res_id][0], edgeID=self.all_valid_res[res_id][1], pos=self.all_valid_res[res_id][3], depart=traci_depart_time)
-                        traci.person.appendWaitingStage(self.all_valid_res[res_id][0], duration=max(0, self.traci_end_time - traci_depart_time))
-                        traci.person.setColor(self.all_valid_res[res_id][0], (135,0,175)) # in simulation, people are purple triangles
-                        traci.person.setWidth(self.all_valid_res[res_id][0], 3)
-                        traci.person.setLength(self.all_valid_res[res_id][0], 3)
+                        self.traci.person.add(self.all_valid_res[res_id][0], edgeID=self.all_valid_res[res_id][1], pos=self.all_valid_res[res_id][3], depart=traci_depart_time)
+                        self.traci.person.appendWaitingStage(self.all_valid_res[res_id][0], duration=max(0, self.traci_end_time - traci_depart_time))
+                        self.traci.person.setColor(self.all_valid_res[res_id][0], (135,0,175)) # in simulation, people are purple triangles
+                        self.traci.person.setWidth(self.all_valid_res[res_id][0], 3)
+                        self.traci.person.setLength(self.all_valid_res[res_id][0], 3)
                 # print(f"New reservations added: {self.new_res_counter}")
                 # print(f"Updated Waiting Reservations: {self.waiting_reservations}")
 
                 # Gets the numbers of active people and taxis in the simulation, periodically outputs information about the states of people, taxis, and chargers
-                taxis_in_sim = traci.vehicle.getIDList()
-                if simulation_time >= self.all_significant_data_update_time or simulation_time==self.sim_start_time:
+                taxis_in_sim = self.fleet.ids
+                if output_due or simulation_time==self.sim_start_time:
                     print(f"Total number of pending reservations in sim: {len(self.waiting_reservations) + len(self.assigned_reservations.keys())}") # the number of reservations that have been initialized (excludes reservations with depart times in the future) but have not been picked up by a taxi
                     print(f"Number of unassigned reservations: {len(self.waiting_reservations)}")
                     print(f"Number of assigned reservations: {len(self.assigned_reservations.keys())}")
@@ -443,8 +690,9 @@ class SimulationRunner(threading.Thread):
                     print(f"Number of unoccupied taxis that are on their way to chargers: {len(self.charging_taxis)}")
                     print(f"Number of occupied taxis: {len(self.dropping_off_taxis.keys())}")
 
-                # Some of the variables needed to calculate costs and earnings depend on the simulation time, this sets those variables
-                self.set_time_dependent_price_variables(simulation_time)
+                # Some of the variables needed to calculate costs and earnings depend on the simulation time, this sets those variables when a new period of the day starts
+                for period_start, _ in due_events.get(PRICE_PERIOD, []):
+                    self.set_time_dependent_price_variables(period_start)
 
                 # Sometimes spawning a taxi will fail. this redoes the spawning for the missed taxi
                 # Sometimes though, resetting just doesn't work, and the taxi isn't put back into the simulation
@@ -453,102 +701,73 @@ class SimulationRunner(threading.Thread):
                     for taxi_id in self.taxi_ids:
                         if taxi_id not in taxis_in_sim and taxi_id not in self.out_of_commission.keys():
                             with suppress(Exception):
-                                traci.vehicle.remove(taxi_id)  # sometimes the car does actually exist but for some reason TraCI can't retrieve it. this removes it so it can be reset
+                                self.traci.vehicle.remove(taxi_id)  # sometimes the car does actually exist but for some reason TraCI can't retrieve it. this removes it so it can be reset
+                            self.release_taxi_work(taxi_id, None, None, simulation_time)
                             new_battery_level = random.randint(7, 60)
                             self.reset_taxi_loc(taxi_id, new_battery_level * 100)
-                            taxis_in_sim = traci.vehicle.getIDList()
+                            taxis_in_sim = self.traci.vehicle.getIDList()
 
-                back_in_commission = []
-                for taxi_id in self.out_of_commission.keys():
+                for return_time, taxi_id in due_events.get(TAXI_RETURN, []):
                     # We might get here if a taxi was initialized in a corner of the map where it can't reach any reservations (since they are placed at random locations, sometimes this happens),
                     # if a taxi ran out of battery and needed to be towed, or if it wound up on an unreachable edge while randomly circling. The taxi is treated as out of commission for a certain
                     # amount of time (depending on the reason), then when the time has passed, put the taxi back into the simulation at a new location
-                    if self.out_of_commission[taxi_id][0] <= simulation_time:
+                    # Taxis that were removed, or put back and taken out of commission again since the event was scheduled, are skipped
+                    if taxi_id in self.out_of_commission and self.out_of_commission[taxi_id][0] == return_time:
                         self.reset_taxi_loc(taxi_id, self.out_of_commission[taxi_id][1])
-                        back_in_commission.append(taxi_id)
                         print(f"Out of commission taxi #{taxi_id} has been put back into the simulation at a new location")
-                for taxi_id in back_in_commission:
-                    del self.out_of_commission[taxi_id]
 
                 # The main purpose of this block of code is to check if a taxi has run out of battery, and deal with this accordingly based on the taxi's state, including calculating the cost of the resulting tow
                 # Also takes advantage of the iteration through every taxi to update the electricity consumption and total driving data
                 for taxi_id in self.taxi_ids:
-                    if taxi_id in traci.vehicle.getIDList():
-                        if taxi_id in self.electricity_consumption_per_taxi.keys():
-                            self.electricity_consumption_per_taxi[taxi_id] += traci.vehicle.getElectricityConsumption(taxi_id)*self.step_length
-                        else:
-                            self.electricity_consumption_per_taxi[taxi_id] = traci.vehicle.getElectricityConsumption(taxi_id)*self.step_length
-                        self.total_distance_driven_per_taxi[taxi_id] = traci.vehicle.getDistance(taxi_id)/1000 # in km
-                        if float(traci.vehicle.getParameter(taxi_id, "device.battery.actualBatteryCapacity")) <= 200:
-                            traci.vehicle.setColor(taxi_id, (255,0,0)) # taxis turn red when they get really low on battery
-                        if taxi_id not in self.out_of_commission.keys() and float(traci.vehicle.getParameter(taxi_id, "device.battery.actualBatteryCapacity")) <= 25:
+                    taxi_state = self.fleet.get(taxi_id)
+                    if taxi_state is not None:
+                        self.aggregates.record_energy(taxi_id, taxi_state.electricity_consumption*self.step_length)
+                        self.aggregates.set_distance(taxi_id, taxi_state.distance/1000)
+                        if taxi_state.battery <= 200:
+                            self.set_taxi_color(taxi_id, (255,0,0)) # taxis turn red when they get really low on battery
+                        if taxi_id not in self.out_of_commission.keys() and taxi_state.battery <= 25:
                             print(f"OH NO! TAXI {taxi_id} RAN OUT OF BATTERY")
-                            if taxi_id in self.dropping_off_taxis.keys():
-                                curr_edge = traci.vehicle.getRoadID(taxi_id)
-                                curr_pos = traci.vehicle.getLanePosition(taxi_id)
-                                curr_res_id = self.dropping_off_taxis[taxi_id][0]
-                                print(f"\tTaxi {taxi_id} was on its way to drop off a passenger at reservation #{curr_res_id}")
-                                self.reset_res(curr_res_id, curr_edge, curr_pos, simulation_time)
-                                del self.heading_home_reservations[curr_res_id]
-                                print(f"\tReservation #{curr_res_id} has been unassigned")
-                                del self.dropping_off_taxis[taxi_id]
-                            elif taxi_id in self.picking_up_taxis.keys():
-                                curr_res_id = self.picking_up_taxis[taxi_id][0]
-                                print(f"\tTaxi {taxi_id} was on its way to pick up a passenger at reservation #{curr_res_id}")
-                                self.waiting_reservations.append(curr_res_id)
-                                del self.assigned_reservations[curr_res_id]
-                                print(f"\tReservation #{curr_res_id} has been unassigned")
-                                del self.picking_up_taxis[taxi_id]
-                            else:
-                                if taxi_id in self.charging_taxis.keys():
-                                    print(f"\tTaxi {taxi_id} was on its way to charge")
-                                    del self.charging_taxis[taxi_id]
-                                else:
-                                    print(f"\tTaxi {taxi_id} was unassigned")
-                                    del self.empty_taxis[taxi_id]
-                            self.out_of_commission[taxi_id] = [simulation_time + 300, 8000]
-                            charge_added = 8000-float(traci.vehicle.getParameter(taxi_id, "device.battery.actualBatteryCapacity")) # in Wh
+                            self.release_taxi_work(taxi_id, taxi_state.road_id, taxi_state.lane_position, simulation_time)
+                            self.take_out_of_commission(taxi_id, simulation_time + 300, 8000)
+                            charge_added = 8000-taxi_state.battery # in Wh
                             charge_added = charge_added/1000 # in kWh
                             price_of_charge = charge_added * self.electricity_costs[-1] # in $
-                            if taxi_id in self.cost_per_tow.keys():
-                                self.cost_per_tow[taxi_id].append(price_of_charge)
-                            else:
-                                self.cost_per_tow[taxi_id] = [price_of_charge]
-                            traci.vehicle.remove(taxi_id)
+                            self.aggregates.record_tow(taxi_id, price_of_charge)
+                            self.fleet.remove(taxi_id)
                             print(f"\tTaxi {taxi_id} has been put out of commission and is no longer in sim")
 
 
                 # This block of code performs taxi assignment. If a taxi is running low on battery, it is sent to a charger (optimized version also considers prices), otherwise it can be sent to a pending reservation
                 new_charging_assignments = {} # stores which taxis will start to go to which charger this time step. keys are taxi ids, each value is [charger id, distance to charger, route to charger]
                 new_reservation_assignments = {} # stores which taxis will start to go to pick up which person this time step. keys are taxi ids, each value is [reservation id, distance to pickup point, route to pickup point]
-                if not self.optimized or simulation_time>=self.optimized_pending_res_update_time: # optimized version performs assignments less frequently in order to let the list of pending reservations build up more. allows taxi assignment to mimimize redundant driving
+                if not self.optimized or DISPATCH in due_events: # optimized version performs assignments less frequently in order to let the list of pending reservations build up more. allows taxi assignment to mimimize redundant driving
                     to_charger = []  # stores which taxis of the available ones need to head to charger this time step
                     to_reservation = [] # stores which taxis of the available ones are heading to some reservation's pickup point this time step
                     for taxi_id in self.empty_taxis.keys():
-                        if taxi_id in traci.vehicle.getIDList():
-                            battery_level = float(traci.vehicle.getParameter(taxi_id, "device.battery.actualBatteryCapacity"))
+                        if taxi_id in self.fleet:
+                            battery_level = self.fleet.battery(taxi_id)
                             if not self.optimized: # control will charge if battery is below some amount. this amount varies at each iteration to mimic how the average human will randomly decide to refuel when the current gas/battery gets down to some range
                                 if battery_level < (random.randint(50,60)*10):
                                     to_charger.append(taxi_id)
-                                    traci.vehicle.setColor(taxi_id, (255,165,0)) # taxis turn orange when they reach low charge
+                                    self.set_taxi_color(taxi_id, (255,165,0)) # taxis turn orange when they reach low charge
                                 else:
                                     to_reservation.append(taxi_id)
                             else: # optimized uses a set threshold that doesn't vary (more closely mimicing how a robot fleet might make decisions) to consider charging. makes charging decision based on predicted future electricity prices
                                 low_battery_threshold = 3000  # Wh - if battery is below this amount, might charge
                                 charging_decision = False
                                 if battery_level < low_battery_threshold:
-                                    charging_decision = self.optimized_charging(taxi_id, pred_models, simulation_time, battery_level)
+                                    charging_decision = self.optimized_charging(taxi_id, price_forecast, simulation_time, battery_level)
                                 if charging_decision:
                                     to_charger.append(taxi_id)
                                 else:
                                     to_reservation.append(taxi_id)
-                    if self.optimized:
-                        self.optimized_pending_res_update_time += 10
+                    if DISPATCH in due_events:
+                        self.events.schedule(due_events[DISPATCH][0][0] + 10, DISPATCH)
                     if len(to_charger) > 0: # assigns taxis that need to charge to their closest charger
                         active_chargers_copy = self.active_chargers[:]
                         new_charging_assignments = self.find_nearest_charger(active_chargers_copy, to_charger)
                     if len(self.waiting_reservations) > 0 and len(to_reservation) > 0: # assigns taxis to reachable reservations
-                        waiting_res_copy = self.waiting_reservations[:]
+                        waiting_res_copy = list(self.waiting_reservations)
                         if not self.optimized:
                             new_reservation_assignments = self.efficient_taxi_assignment(waiting_res_copy, to_reservation, simulation_time)
                         else: # optimized version reduced redundant driving
@@ -556,242 +775,182 @@ class SimulationRunner(threading.Thread):
 
                 # For any taxis that need to charge, uses the computed assignments to send them to chargers
                 for taxi_id in new_charging_assignments.keys():
-                    if taxi_id in traci.vehicle.getIDList():
+                    if taxi_id in self.fleet:
                         try:
-                            traci.vehicle.setRoute(taxi_id, new_charging_assignments[taxi_id][2].edges)
-                            del self.empty_taxis[taxi_id]
-                            self.charging_taxis[taxi_id] = new_charging_assignments[taxi_id][0]
+                            self.traci.vehicle.setRoute(taxi_id, new_charging_assignments[taxi_id][2].edges)
+                            self.taxi_registry.transition(taxi_id, CHARGING, new_charging_assignments[taxi_id][0])
                         except:
-                            curr_edge = traci.vehicle.getRoadID(taxi_id)
+                            curr_edge = self.fleet.road_id(taxi_id)
                             for charger_info in self.active_chargers:
                                 if (charger_info[0]==new_charging_assignments[taxi_id][0]):
                                     curr_charger_lane = charger_info[1]
-                                    charger_edge = traci.lane.getEdgeID(curr_charger_lane)
-                                    route_to_charger = traci.simulation.findRoute(curr_edge, charger_edge, vType="car")
-                                    traci.vehicle.setRoute(taxi_id, route_to_charger.edges)
-                                    del self.empty_taxis[taxi_id]
-                                    self.charging_taxis[taxi_id] = new_charging_assignments[taxi_id][0]
+                                    charger_edge = self.get_lane_edge(curr_charger_lane)
+                                    route_to_charger = self.find_route(curr_edge, charger_edge)
+                                    self.traci.vehicle.setRoute(taxi_id, route_to_charger.edges)
+                                    self.taxi_registry.transition(taxi_id, CHARGING, new_charging_assignments[taxi_id][0])
                                     break
                         # print(f"Taxi {taxi_id} is on its way to charger {self.charging_taxis[taxi_id]} and is no longer unassigned")
 
                 # Checks taxis that have been sent to chargers and monitors if they reach those chargers. Charges taxi to full and treats it as unoccupied. Keeps track of the cost of charging
-                delete_from_charging_taxis = []
+                charged_taxis = []
                 for taxi_id in self.charging_taxis.keys():
-                    if taxi_id in traci.vehicle.getIDList():
+                    if taxi_id in self.fleet:
                         corr_charger_id = self.charging_taxis[taxi_id]
-                        curr_taxi_edge = traci.vehicle.getRoadID(taxi_id)
+                        curr_taxi_edge = self.fleet.road_id(taxi_id)
                         for charger_info in self.active_chargers:
                             if charger_info[0] == corr_charger_id:
                                 curr_charger_lane = charger_info[1]
-                                curr_charger_edge = traci.lane.getEdgeID(curr_charger_lane)
+                                curr_charger_edge = self.get_lane_edge(curr_charger_lane)
                                 if curr_taxi_edge == curr_charger_edge:
                                     charger_pos = charger_info[2]
-                                    if traci.vehicle.getLanePosition(taxi_id) >= charger_pos:
+                                    if self.fleet.lane_position(taxi_id) >= charger_pos:
                                         # print(f"{taxi_id} successfully reached charger {corr_charger_id}")
-                                        delete_from_charging_taxis.append(taxi_id)
-                                        init_bat = float(traci.vehicle.getParameter(taxi_id, 'device.battery.actualBatteryCapacity'))
+                                        charged_taxis.append(taxi_id)
+                                        init_bat = self.fleet.battery(taxi_id)
                                         # print(f"\tTaxi {taxi_id} reached charger with {init_bat} Wh remaining")
-                                        self.empty_taxis[taxi_id] = traci.vehicle.getRoadID(taxi_id)
-                                        traci.vehicle.setParameter(taxi_id, "device.battery.actualBatteryCapacity", 8000)  # Wh
-                                        traci.vehicle.setColor(taxi_id, (0,255,0)) # turns green again when it's fully charged
-                                        curr_bat = float(traci.vehicle.getParameter(taxi_id, 'device.battery.actualBatteryCapacity'))
+                                        self.fleet.set_battery(taxi_id, 8000)  # Wh
+                                        self.set_taxi_color(taxi_id, (0,255,0)) # turns green again when it's fully charged
+                                        curr_bat = self.fleet.battery(taxi_id)
                                         # print(f"\t\tTaxi {taxi_id} reached charger {corr_charger_id} and is now charged to {curr_bat}")
                                         charge_added = (curr_bat-init_bat)/1000 # in kWh
                                         price_of_charge = charge_added * self.electricity_costs[-1]
-                                        if taxi_id in self.cost_per_charging_trip.keys():
-                                            self.cost_per_charging_trip[taxi_id].append(price_of_charge)
-                                        else:
-                                            self.cost_per_charging_trip[taxi_id] = [price_of_charge]
+                                        self.aggregates.record_charge(taxi_id, price_of_charge)
                                 break
-                for taxi_id in delete_from_charging_taxis:
-                    del self.charging_taxis[taxi_id]
+                for taxi_id in charged_taxis:
+                    self.taxi_registry.transition(taxi_id, EMPTY, self.fleet.road_id(taxi_id))
 
                 # For any taxis that can be sent to a pending reservation, uses the computed assignments to send them to those reservations
                 for taxi_id in new_reservation_assignments.keys():
-                    if taxi_id in traci.vehicle.getIDList():
+                    if taxi_id in self.fleet:
                         res_id = new_reservation_assignments[taxi_id][0]
                         try:
-                            traci.vehicle.setRoute(taxi_id, new_reservation_assignments[taxi_id][2].edges)
+                            self.traci.vehicle.setRoute(taxi_id, new_reservation_assignments[taxi_id][2].edges)
                         except:
-                            curr_edge = traci.vehicle.getRoadID(taxi_id)
+                            curr_edge = self.fleet.road_id(taxi_id)
                             res_pickup_edge = self.all_valid_res[res_id][1]
-                            route_to_pickup = traci.simulation.findRoute(curr_edge, res_pickup_edge, vType="car")
-                            traci.vehicle.setRoute(taxi_id, route_to_pickup.edges)
-                        self.waiting_reservations.remove(res_id)
+                            route_to_pickup = self.find_route(curr_edge, res_pickup_edge)
+                            self.traci.vehicle.setRoute(taxi_id, route_to_pickup.edges)
+                        del self.waiting_reservations[res_id]
                         self.assigned_reservations[res_id] = taxi_id
                         # print(f"Reservation #{res_id} was assigned to taxi {taxi_id}, so is no longer unassigned")
-                        del self.empty_taxis[taxi_id]
-                        self.picking_up_taxis[taxi_id] = [res_id, self.all_valid_res[res_id][1]]
+                        self.taxi_registry.transition(taxi_id, PICKING_UP, [res_id, self.all_valid_res[res_id][1]])
                         # print(f"Taxi {taxi_id} is on its way to pick up person at reservation #{self.picking_up_taxis[taxi_id][0]} and is no longer unassigned")
 
                 # Checks taxis that have been sent to pick up reservations and monitors if they reach those people. Person boards taxi, taxi is treated as occupied. Keeps track of the reservation's wait time
-                for taxi_id in self.picking_up_taxis.keys():
-                    if taxi_id in traci.vehicle.getIDList():
-                        curr_edge = traci.vehicle.getRoadID(taxi_id)
+                for taxi_id in list(self.picking_up_taxis.keys()):
+                    if taxi_id in self.fleet:
+                        curr_edge = self.fleet.road_id(taxi_id)
                         if curr_edge == self.picking_up_taxis[taxi_id][1]:
                             curr_res_id = self.picking_up_taxis[taxi_id][0]
-                            if traci.vehicle.getLanePosition(taxi_id) >= self.all_valid_res[curr_res_id][3]:
+                            if self.fleet.lane_position(taxi_id) >= self.all_valid_res[curr_res_id][3]:
                                 # print(f"{taxi_id} successfully picked up passenger at reservation #{curr_res_id}")
-                                traci.vehicle.setColor(taxi_id, (65,225,200)) # occupied taxis are blue
-                                traci.person.remove(self.all_valid_res[curr_res_id][0])
+                                self.set_taxi_color(taxi_id, (65,225,200)) # occupied taxis are blue
+                                self.traci.person.remove(self.all_valid_res[curr_res_id][0])
                                 del self.assigned_reservations[curr_res_id]
                                 self.heading_home_reservations[curr_res_id] = taxi_id
                                 # print(f"Reservation #{curr_res_id} was picked up by taxi {taxi_id}, so is no longer waiting for pickup")
-                                self.dropping_off_taxis[taxi_id] = [curr_res_id, self.all_valid_res[curr_res_id][2], simulation_time, 0]
+                                self.taxi_registry.transition(taxi_id, DROPPING_OFF, [curr_res_id, self.all_valid_res[curr_res_id][2], simulation_time, self.all_valid_res[curr_res_id][7]])
                                 # print(f"Taxi {taxi_id} is on its way to dropoff person at reservation #{self.dropping_off_taxis[taxi_id][0]}")
-                                if curr_res_id in self.reservation_wait_times.keys():
-                                    self.reservation_wait_times[curr_res_id] += simulation_time - self.all_valid_res[curr_res_id][5]
-                                    # print(f"This reservation's depart time was {all_valid_res[curr_res_id][5]} and pickup time was {simulation_time}")
-                                else:
-                                    self.reservation_wait_times[curr_res_id] = simulation_time - self.all_valid_res[curr_res_id][5]
-                                    # print(f"This reservation's depart time was {all_valid_res[curr_res_id][5]} and pickup time was {simulation_time}")
+                                route_edges_to_dropoff = self.all_valid_res[curr_res_id][6]
+                                try:
+                                    self.traci.vehicle.setRoute(taxi_id, route_edges_to_dropoff)
+                                except:
+                                    route_to_dropoff = self.find_route(curr_edge, self.all_valid_res[curr_res_id][2])
+                                    self.traci.vehicle.setRoute(taxi_id, route_to_dropoff.edges)
+                                # print(f"Taxi {taxi_id} has a new route from {curr_edge} to {self.dropping_off_taxis[taxi_id][1]}")
+                                self.aggregates.record_wait(curr_res_id, simulation_time - self.all_valid_res[curr_res_id][5])
 
                 # Checks occupied taxis and monitors if they reach person's dropoff point. Taxi is treated as unoccupied. Keeps track of the completed reservation
-                for taxi_id in self.dropping_off_taxis.keys():
-                    if taxi_id in traci.vehicle.getIDList():
-                        curr_edge = traci.vehicle.getRoadID(taxi_id)
+                for taxi_id in list(self.dropping_off_taxis.keys()):
+                    if taxi_id in self.fleet:
+                        curr_edge = self.fleet.road_id(taxi_id)
                         curr_res_id = self.dropping_off_taxis[taxi_id][0]
-                        if taxi_id in self.picking_up_taxis.keys():
-                            del self.picking_up_taxis[taxi_id]
-                            # print(f"Taxi {taxi_id} is no longer picking up")
-                            route_edges_to_dropoff = self.all_valid_res[curr_res_id][6]
-                            try:
-                                traci.vehicle.setRoute(taxi_id, route_edges_to_dropoff)
-                            except:
-                                route_to_dropoff = traci.simulation.findRoute(curr_edge, self.all_valid_res[curr_res_id][2], vType="car")
-                                traci.vehicle.setRoute(taxi_id, route_to_dropoff.edges)
-                            # print(f"Taxi {taxi_id} has a new route from {curr_edge} to {self.dropping_off_taxis[taxi_id][1]}")
-                            self.dropping_off_taxis[taxi_id][3] = self.all_valid_res[curr_res_id][7]
                         if curr_edge == self.dropping_off_taxis[taxi_id][1]:
                             # print(f"{taxi_id} is at destination edge {curr_edge} (dropping off), position {traci.vehicle.getLanePosition(taxi_id)}")
                             # print(f"\tpassenger wants to go to position {self.all_valid_res[curr_res_id][4]}")
-                            if self.all_valid_res[curr_res_id][4] <= traci.vehicle.getLanePosition(taxi_id):
+                            if self.all_valid_res[curr_res_id][4] <= self.fleet.lane_position(taxi_id):
                                 # print(f"{taxi_id} successfully dropped off passenger at reservation #{curr_res_id}")
-                                traci.vehicle.setColor(taxi_id, (0,255,0)) # taxi turns green again when it's empty
+                                self.set_taxi_color(taxi_id, (0,255,0)) # taxi turns green again when it's empty
                                 del self.heading_home_reservations[curr_res_id]
                                 self.completed_reservations.append(curr_res_id)
                                 # print(f"Reservation #{curr_res_id} was dropped off by taxi {taxi_id}, so is no longer picked up")
-                                self.empty_taxis[taxi_id] = traci.vehicle.getRoadID(taxi_id)
+                                self.aggregates.record_trip(taxi_id, self.dropping_off_taxis[taxi_id][3], self.demand_multipliers[-1], self.tod_rate[-1])
+                                self.taxi_registry.transition(taxi_id, EMPTY, self.fleet.road_id(taxi_id))
                                 # print(f"Taxi {taxi_id} has just dropped off person at reservation #{curr_res_id}")
-                                if taxi_id in self.completed_reservations_by_taxi.keys():
-                                    self.completed_reservations_by_taxi[taxi_id].append([self.dropping_off_taxis[taxi_id][3], self.demand_multipliers[-1], self.tod_rate[-1]])
-                                else:
-                                    self.completed_reservations_by_taxi[taxi_id] = [[self.dropping_off_taxis[taxi_id][3], self.demand_multipliers[-1], self.tod_rate[-1]]]
 
 
                 # Unoccupied, unassigned taxis randomly circle the map until they get assigned. This code block monitors these taxis and assigns them new random routes if they complete their old ones
                 # Occasionally, random circling will cause a taxi to end up on an unreachable edge, in this case it is briefly taken out of commission
-                delete_from_empty_taxis = []
-                for taxi_id in self.empty_taxis.keys():
-                    if taxi_id in traci.vehicle.getIDList():
+                for taxi_id in list(self.empty_taxis.keys()):
+                    if taxi_id in self.fleet:
                         #print(f"{taxi_id}: {traci.vehicle.getRoadID(taxi_id)}")
-                        if taxi_id in self.dropping_off_taxis.keys():
-                            del self.dropping_off_taxis[taxi_id]
-                            # print(f"Taxi {taxi_id} is no longer dropping off")
-                        if self.empty_taxis[taxi_id] == traci.vehicle.getRoadID(taxi_id):
+                        if self.empty_taxis[taxi_id] == self.fleet.road_id(taxi_id):
                             # print(f"{taxi_id} has reached its destination edge")
-                            valid_edges_copy = self.valid_edges[:]
+                            # a destination drawn from the table is reachable, so a route is almost always found on the first try. None means the taxi is stranded
                             new_dest_is_valid = False
-                            new_rand_route = None
-                            new_dest_edge = random.choice(valid_edges_copy)
-                            while not new_dest_is_valid:
-                                new_dest_edge = random.choice(valid_edges_copy)
-                                new_rand_route = traci.simulation.findRoute(self.empty_taxis[taxi_id], new_dest_edge, vType="car")
-                                if new_rand_route and new_rand_route.edges and new_dest_edge != self.empty_taxis[taxi_id]:
+                            for _ in range(3):
+                                new_dest_edge = self.cruising_table.draw(self.empty_taxis[taxi_id])
+                                if new_dest_edge is None:
+                                    break
+                                new_rand_route = self.find_route(self.empty_taxis[taxi_id], new_dest_edge)
+                                if new_rand_route and new_rand_route.edges:
                                     new_dest_is_valid = True
-                                else:
-                                    valid_edges_copy.remove(new_dest_edge)
-                                    #print(f"Num edges: {len(valid_edges)}")
-                                    if len(valid_edges_copy)==0:
-                                        # print(f"{taxi_id} wound up on an unreachable edge")
-                                        break
+                                    break
                             if new_dest_is_valid:
-                                traci.vehicle.setRoute(taxi_id, new_rand_route.edges)
-                                self.empty_taxis[taxi_id] = new_dest_edge
+                                self.traci.vehicle.setRoute(taxi_id, new_rand_route.edges)
+                                self.taxi_registry.set_data(taxi_id, new_dest_edge)
                                 # print(f"\t{taxi_id} has a new route {new_rand_route.edges}")
                             else:
                                 # print(f"\tBecause {taxi_id} wound up on an unreachable edge, putting it out of commission for half the time of an out-of-battery tow")
-                                self.out_of_commission[taxi_id] = [simulation_time + 150, float(traci.vehicle.getParameter(taxi_id, 'device.battery.actualBatteryCapacity'))]
-                                traci.vehicle.remove(taxi_id)
-                                delete_from_empty_taxis.append(taxi_id)
-                for taxi_id in delete_from_empty_taxis:
-                    del self.empty_taxis[taxi_id]
+                                self.take_out_of_commission(taxi_id, simulation_time + 150, self.fleet.battery(taxi_id))
+                                self.fleet.remove(taxi_id)
 
                 # This code block periodically outputs significant data, such as profits and electricity consumption
-                if simulation_time >= self.all_significant_data_update_time or simulation_time + self.step_length == self.sim_end_time: # update this line to have these important statistics print more frequently
+                if output_due or simulation_time + self.step_length == self.sim_end_time: # update this line to have these important statistics print more frequently
                     if self.optimized:
                         print("Optimized Version:")
                     else:
                         print("Control Version:")
-                    total_satisfied_reservations = 0
-                    total_earnings = 0
+                    aggregates = self.aggregates
                     print(f"The base price is {self.taxi_ride_base_price} and the distance rate is {self.taxi_ride_distance_rate}")
                     print(f"Demand Multipliers: {self.demand_multipliers}")
                     print(f"TOD Rates: {self.tod_rate}")
-                    for taxi_id in self.taxi_ids:
-                        taxi_earnings = 0
-                        if taxi_id in self.completed_reservations_by_taxi.keys():
-                            total_satisfied_reservations += len(self.completed_reservations_by_taxi[taxi_id])
-                            for completed_trip in self.completed_reservations_by_taxi[taxi_id]:
-                                trip_length = completed_trip[0] / 1000  # in km
-                                trip_demand_multiplier = completed_trip[1]
-                                trip_tod_rate = completed_trip[2]
-                                # print(f"\t\tTaxi {taxi_id} completed a reservation of length {trip_length} km when the demand mult was {trip_demand_multiplier} and the tod rate was {trip_tod_rate}")
-                                trip_earnings = self.taxi_ride_base_price + (
-                                            (trip_length * self.taxi_ride_distance_rate) * trip_demand_multiplier * trip_tod_rate)
-                                # print(f"\t\t\tThis trip earned ${trip_earnings}")
-                                taxi_earnings += trip_earnings
-                        # print(f"\tTaxi Earnings {taxi_id}: ${taxi_earnings}")
-                        total_earnings += taxi_earnings
                     print(f"Electricity Costs: {self.electricity_costs}")
-                    total_num_charging_trips = 0
-                    total_num_tows = 0
-                    total_cost = 0
                     print(f"Charge Base Price: {self.charge_base_price}")
-                    for taxi_id in self.taxi_ids:
-                        taxi_cost = 0
-                        if taxi_id in self.cost_per_charging_trip.keys():
-                            total_num_charging_trips += len(self.cost_per_charging_trip[taxi_id])
-                            taxi_cost += (len(self.cost_per_charging_trip[taxi_id])*self.charge_base_price) + sum(self.cost_per_charging_trip[taxi_id])
-                        if taxi_id in self.cost_per_tow.keys():
-                            total_num_tows += len(self.cost_per_tow[taxi_id])
-                            taxi_cost += (len(self.cost_per_tow[taxi_id]) * self.tow_base_price) + sum(self.cost_per_tow[taxi_id])
-                        # print(f"\tTaxi Cost {taxi_id}: ${taxi_cost}")
-                        total_cost += taxi_cost
-                    
-                    print(f"Total completed reservations: {total_satisfied_reservations} reservations")
-                    print(f"Total Earnings: ${total_earnings}")
-                    if total_satisfied_reservations > 0:
-                        print(f"Average Earnings from One Taxi Ride: ${total_earnings / total_satisfied_reservations}")
+                    print(f"Total completed reservations: {aggregates.trips} reservations")
+                    print(f"Total Earnings: ${aggregates.earnings}")
+                    if aggregates.trips > 0:
+                        print(f"Average Earnings from One Taxi Ride: ${aggregates.earnings / aggregates.trips}")
                     else:
                         print("Average Earnings from One Taxi Ride: $0")
-                    print(f"Average Earnings of One Taxi: ${total_earnings / len(self.taxi_ids)}")
-                    print(f"Total charging trips: {total_num_charging_trips} charging trips")
-                    print(f"Total Cost: ${total_cost}")
-                    print(f"Average Cost of One Taxi: {total_cost / len(self.taxi_ids)}")
-                    print(f"Total Profits: ${total_earnings - total_cost}")
-                    print(f"Average Profits of One Taxi: ${(total_earnings - total_cost) / len(self.taxi_ids)}")
-                    print(f"Number of times a taxi ran out of battery: {total_num_tows}")
-                    total_distance_driven = sum(self.total_distance_driven_per_taxi.values())
-                    print(f"Total Distance Driven: {total_distance_driven} km")
-                    print(f"Average Distance Driven per Taxi: {total_distance_driven / len(self.taxi_ids)} km")
-                    if len(self.reservation_wait_times.values()) > 0:
-                        print(f"Average Wait Time per Reservation: {sum(self.reservation_wait_times.values())/len(self.reservation_wait_times.values())}")
-                        print(f"Minimum Wait Time: {min(self.reservation_wait_times.values())}")
-                        print(f"Maximum Wait Time: {max(self.reservation_wait_times.values())}")
+                    print(f"Average Earnings of One Taxi: ${aggregates.earnings / len(self.taxi_ids)}")
+                    print(f"Total charging trips: {aggregates.charging_trips} charging trips")
+                    print(f"Total Cost: ${aggregates.total_cost}")
+                    print(f"Average Cost of One Taxi: {aggregates.total_cost / len(self.taxi_ids)}")
+                    print(f"Total Profits: ${aggregates.profit}")
+                    print(f"Average Profits of One Taxi: ${aggregates.profit / len(self.taxi_ids)}")
+                    print(f"Number of times a taxi ran out of battery: {aggregates.tows}")
+                    print(f"Total Distance Driven: {aggregates.distance.total} km")
+                    print(f"Average Distance Driven per Taxi: {aggregates.distance.total / len(self.taxi_ids)} km")
+                    if len(aggregates.wait_times) > 0:
+                        print(f"Average Wait Time per Reservation: {aggregates.wait_times.mean()}")
+                        print(f"Minimum Wait Time: {aggregates.wait_times.minimum()}")
+                        print(f"Maximum Wait Time: {aggregates.wait_times.maximum}")
                     else:
                         print("Average Wait Time per Reservation: N/A, no reservations picked up")
-                    print(f"Total electricity consumption: {sum(self.electricity_consumption_per_taxi.values())/1000} kWh")
-                    print(f"Average Electricity consumption by taxi: {(sum(self.electricity_consumption_per_taxi.values())/1000) / len(self.taxi_ids)} kWh")
-                    self.all_significant_data_update_time += self.output_freq
+                    print(f"Total electricity consumption: {aggregates.energy.total/1000} kWh")
+                    print(f"Average Electricity consumption by taxi: {(aggregates.energy.total/1000) / len(self.taxi_ids)} kWh")
+                    if output_due:
+                        self.events.schedule(due_events[OUTPUT][0][0] + self.output_freq, OUTPUT)
 
                 # Increment the timestep
                 simulation_time += self.step_length
-                
-                # Optional: Add a short delay to prevent overloading
-                time.sleep(0.01)
 
-            except traci.exceptions.TraCIException as e:
+                # Publishes the state of this step for the Flask endpoints, then waits for whatever is left of the step's time budget, if the simulation is being throttled
+                self.publish_snapshot()
+                self.pacer.step_done(self.step_length)
+
+            except self.traci.TraCIException as e:
                 print(f"TraCI error during simulation loop at timestep {simulation_time}: {e}")
                 break
             except Exception as e:
@@ -800,77 +959,15 @@ class SimulationRunner(threading.Thread):
 
         print("Exiting simulation loop.")
     
-    def load_historical_data(self, file_path):
-        """
-        Load the provided historical electricity cost data
-
-        Args:
-        - file_path: Path to the data file
-
-        Returns:
-        - Pandas DataFrame with historical data
-        """
-        try:
-            db = pd.read_excel(file_path)
-            return db
-        except Exception as e:
-            print(f"Error reading the file: {e}")
-            return None
-
-    def get_hist_data(self, database):
-        """
-        Process the DataFrame for use by predictive models
-
-        Args:
-        - database: Pandas DataFrame with historical data
-
-        Returns:
-        - The data separated into x-values (day, time of day) and y-values (price of charging vehicles in $/kWh)
-        """
-        features = [database.columns[0], database.columns[1]]
-        elec_price = database.columns[2] # prices given in $/kWh
-        x_vals = database[features]
-        y_vals = database[elec_price]
-        return x_vals, y_vals
-
-    def train_prediction_models(self, x_vals, y_vals):
-        """
-        Train predictive models using historical data
-
-        Args:
-        - x_vals: Matrix that stores the day and time of day
-        - y_vals: corresponding price of charging vehicles in $/kWh
-
-        Returns:
-        - Trained models and scalers
-        """
-        scaler_obj = StandardScaler()
-        x_scaled = scaler_obj.fit_transform(x_vals)
-        price_model = RandomForestRegressor(n_estimators=300, max_depth=10, min_samples_split=10, min_samples_leaf=1)
-        price_model.fit(x_scaled, y_vals)
-        return [price_model, scaler_obj]
-
-    
-    def clear_residual_variables(self):
-        """
-        Sometimes from one run to another, TraCI doesn't immediately update the number of people and chargers. This function forces a clear slate
-        I tried alternatively deleting all the people at the end of each simulation but that did not work. This current solution, although
-        a bit redundant and time expensive, seems to be the only option
-        """
-        for person_id in self.person_ids:
-            with suppress(Exception):
-                traci.person.remove(person_id)
-        for person_id in traci.person.getIDList():
-            traci.person.remove(person_id)
-
     def set_time_dependent_price_variables(self, simulation_time):
         """
         Determines the demand multipliers and time of day rates used to calculate taxi earnings, and the electricity prices used to calculate taxi costs, based on the current time of day
         The demand multiplier is based both on real-world demand trends as well as live updates within the simulation (which allows it to account for sudden surges dynamically caused by the user)
         The time of day rates and the price of charging vehicles are also based on real-world values
+        Called by PRICE_PERIOD events, at the start of the simulation and whenever one of the PRICE_PERIOD_STARTS is reached
 
         Args:
-        - simulation_time: The current time in seconds within the simulation
+        - simulation_time: The time in seconds within the simulation that the event is for, either the start of the simulation or the start of a period
         """
         if simulation_time == 0 or (simulation_time < 1200 and len(self.demand_multipliers)==0): # represents 12am-4am
             self.recent_reservations.append(self.new_res_counter/2.0)
@@ -966,33 +1063,67 @@ class SimulationRunner(threading.Thread):
         self.new_res_counter = 0
         return min(max(demand_multiplier, 0.5), 2.5)
     
+    def take_out_of_commission(self, taxi_id, return_time, battery_level):
+        """
+        Takes a taxi out of commission and schedules its return to the simulation
+
+        Args:
+        - taxi_id: The taxi to take out of commission
+        - return_time: The simulation time at which the taxi can re-enter the simulation
+        - battery_level: The amount of charge the taxi should be reset with
+        """
+        self.taxi_registry.transition(taxi_id, OUT_OF_COMMISSION, [return_time, battery_level])
+        self.taxi_index.remove(taxi_id) # its last known position is stale, it is indexed again once it is available for dispatch
+        self.events.schedule(return_time, TAXI_RETURN, taxi_id)
+
+    def release_taxi_work(self, taxi_id, curr_edge, curr_pos, simulation_time):
+        """
+        Gives up whatever a taxi was doing before it leaves the simulation. A passenger riding in the taxi gets a new reservation where the taxi is,
+        a reservation the taxi was on its way to pick up goes back to waiting for a taxi
+
+        Args:
+        - taxi_id: The taxi leaving the simulation
+        - curr_edge, curr_pos: Where the taxi is, None if it is not known (the passenger is then put back at their pickup point)
+        - simulation_time: The current simulation time
+        """
+        state = self.taxi_registry.state(taxi_id)
+        if state == DROPPING_OFF:
+            curr_res_id = self.dropping_off_taxis[taxi_id][0]
+            print(f"\tTaxi {taxi_id} was on its way to drop off a passenger at reservation #{curr_res_id}")
+            if curr_edge is None:
+                curr_edge = self.all_valid_res[curr_res_id][1]
+                curr_pos = self.all_valid_res[curr_res_id][3]
+            self.reset_res(curr_res_id, curr_edge, curr_pos, simulation_time)
+            del self.heading_home_reservations[curr_res_id]
+            print(f"\tReservation #{curr_res_id} has been unassigned")
+        elif state == PICKING_UP:
+            curr_res_id = self.picking_up_taxis[taxi_id][0]
+            print(f"\tTaxi {taxi_id} was on its way to pick up a passenger at reservation #{curr_res_id}")
+            self.waiting_reservations[curr_res_id] = None
+            del self.assigned_reservations[curr_res_id]
+            print(f"\tReservation #{curr_res_id} has been unassigned")
+        elif state == CHARGING:
+            print(f"\tTaxi {taxi_id} was on its way to charge")
+        else:
+            print(f"\tTaxi {taxi_id} was unassigned")
+
     def reset_taxi_loc(self, taxi_id, battery_level):
         """
-        Adds a taxi that was out of commission back into the simulation. Initializes it with a random route
+        Adds a taxi that was out of commission back into the simulation as an empty taxi. Initializes it with a random route
 
         Args:
         - taxi_id: The taxi to add back into the simulation
         - battery_level: The amount of charge the taxi should have when it is reinitialized
         """
-        edges_are_valid = False
-        rand_route = None
-        start_edge_id = random.choice(self.valid_edges)
-        dest_edge_id = random.choice(self.valid_edges)
-        while not edges_are_valid:
-            rand_route = traci.simulation.findRoute(start_edge_id, dest_edge_id, vType="car")
-            if rand_route and rand_route.edges and dest_edge_id != start_edge_id:
-                edges_are_valid = True
-            else:
-                start_edge_id = random.choice(self.valid_edges)
-                dest_edge_id = random.choice(self.valid_edges)
+        start_edge_id, dest_edge_id, rand_route = self.choose_random_route()
         route_id = f"route_{self.extra_route_counter}"
         self.extra_route_counter += 1
-        traci.route.add(route_id, rand_route.edges)
-        traci.vehicle.add(taxi_id, routeID=route_id, typeID="car", departPos="random", departLane="best", departSpeed="max")
-        self.empty_taxis[taxi_id] = dest_edge_id
-        traci.vehicle.setParameter(taxi_id, "device.battery.actualBatteryCapacity", battery_level)  # Wh
-        traci.vehicle.setParameter(taxi_id, "device.battery.maximumBatteryCapacity", 8000)  # Wh
-        traci.vehicle.setColor(taxi_id, (0,255,0))
+        self.traci.route.add(route_id, rand_route.edges)
+        self.traci.vehicle.add(taxi_id, routeID=route_id, typeID="car", departPos="random", departLane="best", departSpeed="max")
+        self.taxi_registry.respawn(taxi_id, dest_edge_id)
+        self.traci.vehicle.setParameter(taxi_id, "device.battery.actualBatteryCapacity", str(battery_level))  # Wh
+        self.traci.vehicle.setParameter(taxi_id, "device.battery.maximumBatteryCapacity", "8000")  # Wh
+        self.set_taxi_color(taxi_id, (0,255,0))
         print(f"Reset taxi: Spawned taxi {taxi_id} with {battery_level} Wh charge")
 
     def reset_res(self, res_id, curr_edge, curr_pos, simulation_time):
@@ -1006,9 +1137,10 @@ class SimulationRunner(threading.Thread):
         - simulation_time: The time at which the taxi died and the passenger needs to be reset
         """
         person_id = self.all_valid_res[res_id][0]
-        new_route = traci.simulation.findRoute(curr_edge, self.all_valid_res[res_id][2], vType="car")
-        new_assignment = [person_id, curr_edge, self.all_valid_res[res_id][2], curr_pos, self.all_valid_res[res_id][4], simulation_time, new_route.edges, new_route.length]
-        self.all_valid_res[res_id] = new_assignment
+        new_route = self.find_route(curr_edge, self.all_valid_res[res_id][2])
+        self.all_valid_res.add(res_id, person_id, curr_edge, self.all_valid_res[res_id][2], curr_pos, self.all_valid_res[res_id][4], simulation_time, new_route.edges, new_route.length)
+        self.reservations_version += 1
+        self.release_queue.push(res_id, simulation_time) # the person is added to the simulation again at the next step
         self.new_res_counter -= 1 # without this line, the reset reservation would be counted twice
         print(f"Reset reservation: Person {person_id} re-added with ride from {curr_edge} to {self.all_valid_res[res_id][2]}")
         
@@ -1021,46 +1153,32 @@ class SimulationRunner(threading.Thread):
         - person_id: The ID of the passenger that needs to be reinitialized
         - depart_time: The current simulation time, the time at which the passenger should be reinitialized
         """
-        edges_are_valid = False
-        pickup_edge_id = random.choice(self.valid_edges)
-        dropoff_edge_id = random.choice(self.valid_edges)
-        curr_route = None
-        while not edges_are_valid:
-            curr_route = traci.simulation.findRoute(pickup_edge_id, dropoff_edge_id, vType="car")
-            if curr_route and curr_route.edges and dropoff_edge_id != pickup_edge_id:
-                edges_are_valid = True
-            else:
-                pickup_edge_id = random.choice(self.valid_edges)
-                dropoff_edge_id = random.choice(self.valid_edges)
-        pickup_lane = self.net.getEdge(pickup_edge_id).getLanes()[0]
-        dropoff_lane = self.net.getEdge(dropoff_edge_id).getLanes()[0]
-        pickup_pos = random.uniform(max(pickup_lane.getLength()*(1/4), 13), min(pickup_lane.getLength()*(3/4), pickup_lane.getLength()-13))
-        dropoff_pos = random.uniform(max(dropoff_lane.getLength()*(1/4), 13), min(dropoff_lane.getLength()*(3/4), dropoff_lane.getLength()-13))
-        self.all_valid_res[res_id] = [person_id, pickup_edge_id, dropoff_edge_id, pickup_pos, dropoff_pos, depart_time, curr_route.edges, curr_route.length]
+        self.create_reservation(res_id, person_id, depart_time)
+        self.release_queue.push(res_id, depart_time)
         self.new_res_counter -= 1 # without this line, the reset reservation would be counted twice
 
 
-    def optimized_charging(self, taxi_id, models, sim_time, curr_bat):
+    def optimized_charging(self, taxi_id, price_forecast, sim_time, curr_bat):
         """
         Predicts future electricity prices for the next six hours to determine if a taxi that is starting to run low on battery should charge now
 
         Args:
         - taxi_id: The ID of the taxi that is considering charging
-        - models: The predictive models trained from provided historical data
+        - price_forecast: The PriceForecastTable built from the predictive models
         - sim_time: The current simulation time
         - curr_bat: The taxi's current battery level
 
         Returns:
         - a boolean value representing the charging decision (True if the taxi should charge now, False if it should not)
         """
-        future_prices = self.predict_future_prices(models, sim_time)
         curr_price = self.electricity_costs[-1]
         # print(f"Current electricity price: {curr_price}")
         min_battery_threshold = 550 # Wh - if battery is below this amount, must charge
         if curr_bat < min_battery_threshold:
-            traci.vehicle.setColor(taxi_id, (255, 165, 0))  # taxis turn orange when they reach low charge
+            self.set_taxi_color(taxi_id, (255, 165, 0))  # taxis turn orange when they reach low charge
             # print(f"{taxi_id} urgently needs charge")
             return True
+        future_prices = price_forecast.forecast(sim_time)
         if future_prices:
             higher_price_count = sum(1 for price in future_prices.values() if price > curr_price)
             num_future_prices = len(future_prices)
@@ -1070,54 +1188,38 @@ class SimulationRunner(threading.Thread):
         return False
 
 
-    def predict_future_prices(self, models, sim_time, forecast=6):
-        """
-        Uses predictive models to guess what future electricity prices will be for charging vehicles. By default, makes predictions six hours into the future
-
-        Args:
-        - models: The predictive models trained from provided historical data
-        - sim_time: The current simulation time
-        - forecast: Number of hours into the future for which predictions should be made
-
-        Returns:
-        - predicted electricity prices
-        """
-        predictions = {}
-        # print("\tPredicting future prices:")
-        for increase_val in range(forecast):
-            future_time = sim_time + (increase_val+1)*300 # because the sim is scaled so that 300 seconds represents one hour
-            if future_time >= 7200:
-                future_time = future_time - 7200
-            features = pd.DataFrame({'Day Number': [2501], 'Simulation Time': [future_time]}) # historical data goes up to day 2500, so current day is set to 2501
-            elec_price_features = models[1].transform(features)
-            predicted_price = models[0].predict(elec_price_features)[0]
-            # print(f"\t\tfuture time: {future_time}, predicted price: {predicted_price}")
-            predictions[increase_val+1] = float(predicted_price)
-        # print(f"\tPredictions: {predictions}")
-        return predictions
-    
     def find_nearest_charger(self, chargers_to_use, taxis_to_charge):
         """
-        Assigns taxis that need to charge to their nearest active chargers
+        Assigns taxis that need to charge to the charger among chargers_to_use with the shortest route. With local routing the nearest charger comes from the
+        charger table, which follows all the active chargers. The table's answer is used when it is one of chargers_to_use, otherwise (or without
+        local routing, or if the taxi is in the middle of a junction) the taxi is routed to every charger in chargers_to_use
 
         Args:
-        - chargers_to_use: A list of the chargers that are currently active
+        - chargers_to_use: A list of the active chargers the taxis may be sent to, as (charger id, lane id, lane position)
         - taxis_to_charge: The list of taxis that need to charge
 
         Returns:
-        - Assignments mapping each taxi to the charger it should use
+        - Assignments mapping each taxi to the charger it should use, as [charger id, route length in m, route]
         """
         assignments = {}
+        usable_ids = {charger_info[0] for charger_info in chargers_to_use}
         for taxi_id in taxis_to_charge:
-            curr_edge = traci.vehicle.getRoadID(taxi_id)
+            curr_edge = self.fleet.road_id(taxi_id)
+            if self.charger_table is not None and self.router.has_edge(curr_edge):
+                nearest = self.charger_table.nearest(curr_edge)
+                if nearest is None:
+                    continue # the table follows every active charger, so none of chargers_to_use can be reached either
+                if nearest[0] in usable_ids:
+                    assignments[taxi_id] = list(nearest)
+                    continue
             nearest_charger_id = ""
             shortest_length = float('inf')
             shortest_route = None
             for charger_info in chargers_to_use:
                 charger_id = charger_info[0]
                 charger_lane = charger_info[1]
-                charger_edge = traci.lane.getEdgeID(charger_lane)
-                route_to_charger = traci.simulation.findRoute(curr_edge, charger_edge, vType="car")
+                charger_edge = self.get_lane_edge(charger_lane)
+                route_to_charger = self.find_route(curr_edge, charger_edge)
                 if route_to_charger is not None and len(route_to_charger.edges) != 0:
                     if route_to_charger.length < shortest_length:
                         shortest_length = route_to_charger.length
@@ -1148,59 +1250,46 @@ class SimulationRunner(threading.Thread):
         """
         random.shuffle(available_taxis)
         assignments = {}
-        assigned_res = set()
         unreached_this_step = []
-        route_cache = {}
         put_out_of_commission = []
-        count_taxi_reachability = {}
+        cost_matrix, widen = self.build_cost_matrix(pending_reservations, available_taxis)
+        reachable = cost_matrix.reachable()
         # print("Checking Reachability:")
-        for res_id in pending_reservations:
-            is_reachable = False
-            for taxi_id in available_taxis:
-                if taxi_id not in count_taxi_reachability.keys():
-                    count_taxi_reachability[taxi_id] = 0
-                cache_key = (taxi_id, res_id)
-                if cache_key not in route_cache.keys():
-                    route_cache[cache_key] = traci.simulation.findRoute(traci.vehicle.getRoadID(taxi_id), self.all_valid_res[res_id][1], vType="car")
-                if route_cache[cache_key].edges:
-                    is_reachable = True
-                    count_taxi_reachability[taxi_id] += 1
-            if not is_reachable:
+        res_is_reachable = reachable.any(axis=0)
+        for col, res_id in enumerate(pending_reservations):
+            if not res_is_reachable[col]:
                 self.unreached_reservations.append(res_id)
                 unreached_this_step.append(res_id)
-        for taxi_id in available_taxis:
-            if count_taxi_reachability[taxi_id] == 0 and count_taxi_reachability[taxi_id] != len(pending_reservations)-len(unreached_this_step):
+        count_taxi_reachability = reachable.sum(axis=1)
+        for row, taxi_id in enumerate(available_taxis):
+            if count_taxi_reachability[row] == 0 and count_taxi_reachability[row] != len(pending_reservations)-len(unreached_this_step):
                 print(f"\t{taxi_id} CANNOT REACH ANY PASSENGERS AND IS BEING TAKEN OUT OF COMMISSION")
                 put_out_of_commission.append(taxi_id)
-                curr_bat = float(traci.vehicle.getParameter(taxi_id, "device.battery.actualBatteryCapacity"))
-                self.out_of_commission[taxi_id] = [sim_time+150, curr_bat]
-                traci.vehicle.remove(taxi_id)
+                curr_bat = self.fleet.battery(taxi_id)
+                self.take_out_of_commission(taxi_id, sim_time+150, curr_bat)
+                self.fleet.remove(taxi_id)
         # print("Assignments:")
-        for taxi_id in available_taxis:
-            if taxi_id not in put_out_of_commission:
-                nearest_res_id = -1
-                shortest_length = float('inf')
-                shortest_route = None
-                for res_id in pending_reservations:
-                    if res_id not in assigned_res and res_id not in unreached_this_step:
-                        cache_key = (taxi_id, res_id)
-                        if cache_key in route_cache.keys():
-                            route_to_pickup = route_cache.get(cache_key)
-                        else:
-                            route_to_pickup = traci.simulation.findRoute(traci.vehicle.getRoadID(taxi_id), self.all_valid_res[res_id][1], vType="car")
-                        if route_to_pickup and route_to_pickup.edges:
-                            if route_to_pickup.length < shortest_length:
-                                shortest_length = route_to_pickup.length
-                                nearest_res_id = res_id
-                                shortest_route = route_to_pickup
-                if nearest_res_id >= 0:
-                    assignment = [nearest_res_id, shortest_length, shortest_route]
-                    assignments[taxi_id] = assignment
-                    assigned_res.add(nearest_res_id)
+        def closest_first(lengths):
+            # each taxi, in the shuffled order, claims its closest reservation that has not been claimed yet
+            lengths = lengths.copy() # a reservation's column is set to infinity once a taxi claims it
+            pairs = []
+            if lengths.shape[1] == 0:
+                return pairs
+            for i in range(lengths.shape[0]):
+                j = int(np.argmin(lengths[i]))
+                if np.isfinite(lengths[i, j]):
+                    pairs.append((i, j))
+                    lengths[:, j] = np.inf
+            return pairs
+        taxi_rows = [row for row, taxi_id in enumerate(available_taxis) if taxi_id not in put_out_of_commission]
+        res_cols = [col for col in range(len(pending_reservations)) if res_is_reachable[col]]
+        matched = {taxi_rows[i]: res_cols[j] for i, j in closest_first(cost_matrix.lengths[np.ix_(taxi_rows, res_cols)])}
+        self.fill_unmatched(cost_matrix, widen, matched, taxi_rows, res_cols, closest_first)
+        for row in sorted(matched):
+            col = matched[row]
+            assignments[available_taxis[row]] = [pending_reservations[col], float(cost_matrix.lengths[row, col]), cost_matrix.route(row, col)]
         for res_id in unreached_this_step:
-            self.waiting_reservations.remove(res_id)
-        for taxi_id in put_out_of_commission:
-            del self.empty_taxis[taxi_id]
+            del self.waiting_reservations[res_id]
         # if len(assignments) != 0:
         #     print(f"{len(assignments)} taxis successfully assigned to reservations")
         return assignments
@@ -1208,7 +1297,7 @@ class SimulationRunner(threading.Thread):
     def optimized_taxi_assignment(self, pending_reservations, available_taxis, sim_time):
         """
         Assigns taxis that can pick up reservations to their closest unassigned pending reservation
-        Optimized version: Taxi assignment minimizes driving distance
+        Optimized version: Taxis and reservations are matched as one batch so that as many reservations as possible are served with the minimum total pickup distance
         Assignment works in two steps:
         - check if any reservations are unreachable or any taxis are stuck on inaccessible sections of the map
         - assign the available reservations and taxis based on route distance
@@ -1222,131 +1311,166 @@ class SimulationRunner(threading.Thread):
         - Assignments mapping each taxi to the reservation it should pick up
         """
         assignments = {}
-        available_res = {}
-        unassigned_taxis = []
-        unassigned_res = []
         unreached_this_step = []
-        route_cache = {}
         put_out_of_commission = []
-        count_taxi_reachability = {}
+        cost_matrix, widen = self.build_cost_matrix(pending_reservations, available_taxis)
+        reachable = cost_matrix.reachable()
         # print("Checking Reachability:")
-        for res_id in pending_reservations:
-            is_reachable = False
-            for taxi_id in available_taxis:
-                if taxi_id not in count_taxi_reachability.keys():
-                    count_taxi_reachability[taxi_id] = 0
-                cache_key = (taxi_id, res_id)
-                if cache_key not in route_cache.keys():
-                    route_cache[cache_key] = traci.simulation.findRoute(traci.vehicle.getRoadID(taxi_id), self.all_valid_res[res_id][1], vType="car")
-                if route_cache[cache_key].edges:
-                    is_reachable = True
-                    count_taxi_reachability[taxi_id] += 1
-            if not is_reachable:
+        res_is_reachable = reachable.any(axis=0)
+        for col, res_id in enumerate(pending_reservations):
+            if not res_is_reachable[col]:
                 self.unreached_reservations.append(res_id)
                 unreached_this_step.append(res_id)
-            else:
-                unassigned_res.append(res_id)
-        for taxi_id in available_taxis:
-            if count_taxi_reachability[taxi_id] == 0 and count_taxi_reachability[taxi_id] != len(pending_reservations) - len(unreached_this_step):
+        count_taxi_reachability = reachable.sum(axis=1)
+        for row, taxi_id in enumerate(available_taxis):
+            if count_taxi_reachability[row] == 0 and count_taxi_reachability[row] != len(pending_reservations) - len(unreached_this_step):
                 print(f"\t{taxi_id} CANNOT REACH ANY PASSENGERS AND IS BEING TAKEN OUT OF COMMISSION")
                 put_out_of_commission.append(taxi_id)
-                curr_bat = float(traci.vehicle.getParameter(taxi_id, "device.battery.actualBatteryCapacity"))
-                self.out_of_commission[taxi_id] = [sim_time + 150, curr_bat]
-                traci.vehicle.remove(taxi_id)
-            else:
-                unassigned_taxis.append(taxi_id)
-                available_res[taxi_id] = [res_id for res_id in pending_reservations if res_id not in unreached_this_step]
+                curr_bat = self.fleet.battery(taxi_id)
+                self.take_out_of_commission(taxi_id, sim_time + 150, curr_bat)
+                self.fleet.remove(taxi_id)
         # print("Assignments:")
-        if len(available_taxis)-len(put_out_of_commission) <= len(pending_reservations)-len(unreached_this_step):
-            while len(assignments.keys()) < len(available_taxis)-len(put_out_of_commission):
-                taxi_id = random.choice(unassigned_taxis)
-                nearest_res_id = -1
-                shortest_length = float('inf')
-                shortest_route = None
-                for res_id in available_res[taxi_id]:
-                    cache_key = (taxi_id, res_id)
-                    if cache_key not in route_cache.keys():
-                        route_cache[cache_key] = traci.simulation.findRoute(traci.vehicle.getRoadID(taxi_id),self.all_valid_res[res_id][1], vType="car")
-                    route_to_pickup = route_cache[cache_key]
-                    if route_to_pickup and route_to_pickup.edges:
-                        if route_to_pickup.length < shortest_length:
-                            shortest_length = route_to_pickup.length
-                            nearest_res_id = res_id
-                            shortest_route = route_to_pickup
-                if nearest_res_id >= 0:
-                    already_assigned = False
-                    for dict_key in assignments.keys():
-                        dict_val = assignments[dict_key]
-                        if nearest_res_id == dict_val[0]:
-                            if shortest_length<dict_val[1]:
-                                del assignments[dict_key]
-                                unassigned_taxis.append(dict_key)
-                                available_res[dict_key].remove(nearest_res_id)
-                                assignment = [nearest_res_id, shortest_length, shortest_route]
-                                assignments[taxi_id] = assignment
-                                unassigned_taxis.remove(taxi_id)
-                            else:
-                                available_res[taxi_id].remove(nearest_res_id)
-                            already_assigned = True
-                            break
-                    if not already_assigned:
-                        assignment = [nearest_res_id, shortest_length, shortest_route]
-                        assignments[taxi_id] = assignment
-                        unassigned_taxis.remove(taxi_id)
-        else:
-            while len(assignments.keys()) < len(pending_reservations)-len(unreached_this_step):
-                res_id = random.choice(unassigned_res)
-                nearest_taxi_id = ""
-                shortest_length = float('inf')
-                shortest_route = None
-                for taxi_id in available_taxis:
-                    if taxi_id in available_res.keys() and res_id in available_res[taxi_id]:
-                        cache_key = (taxi_id, res_id)
-                        if cache_key not in route_cache.keys():
-                            route_cache[cache_key] = traci.simulation.findRoute(traci.vehicle.getRoadID(taxi_id),self.all_valid_res[res_id][1], vType="car")
-                        route_to_pickup = route_cache[cache_key]
-                        if route_to_pickup and route_to_pickup.edges:
-                            if route_to_pickup.length < shortest_length:
-                                shortest_length = route_to_pickup.length
-                                nearest_taxi_id = taxi_id
-                                shortest_route = route_to_pickup
-                if len(nearest_taxi_id) != 0:
-                    if nearest_taxi_id in assignments.keys():
-                        dict_val = assignments[nearest_taxi_id]
-                        if shortest_length < dict_val[1]:
-                            del assignments[nearest_taxi_id]
-                            unassigned_res.append(dict_val[0])
-                            available_res[nearest_taxi_id].remove(dict_val[0])
-                            assignment = [res_id, shortest_length, shortest_route]
-                            assignments[nearest_taxi_id] = assignment
-                            unassigned_res.remove(res_id)
-                        else:
-                            available_res[nearest_taxi_id].remove(res_id)
-                    else:
-                        assignment = [res_id, shortest_length, shortest_route]
-                        assignments[nearest_taxi_id] = assignment
-                        unassigned_res.remove(res_id)
+        # the remaining taxis and reachable reservations are matched as one batch, the routes are only rebuilt for the matched pairs
+        taxi_rows = [row for row, taxi_id in enumerate(available_taxis) if taxi_id not in put_out_of_commission]
+        res_cols = [col for col in range(len(pending_reservations)) if res_is_reachable[col]]
+        matched = {taxi_rows[i]: res_cols[j] for i, j in self.assignment_solver.solve(cost_matrix.lengths[np.ix_(taxi_rows, res_cols)])}
+        self.fill_unmatched(cost_matrix, widen, matched, taxi_rows, res_cols, self.assignment_solver.solve)
+        for row in sorted(matched):
+            col = matched[row]
+            assignments[available_taxis[row]] = [pending_reservations[col], float(cost_matrix.lengths[row, col]), cost_matrix.route(row, col)]
         for res_id in unreached_this_step:
-            self.waiting_reservations.remove(res_id)
-        for taxi_id in put_out_of_commission:
-            del self.empty_taxis[taxi_id]
+            del self.waiting_reservations[res_id]
         # if len(assignments) != 0:
         #     print(f"{len(assignments)} taxis successfully assigned to reservations")
         return assignments
 
+    def build_cost_matrix(self, pending_reservations, available_taxis):
+        """
+        Computes the route lengths from the available taxis to the pending reservations' pickup points, with one search per distinct taxi edge.
+        To keep dispatch close to linear in the fleet size, each taxi is only routed to its nearest pickups and each reservation only to its nearest
+        taxis (by straight-line distance). Taxis and reservations that cannot reach any of their candidates get their candidate sets widened
+        until they reach something or have been checked against everything, so unreachable taxis and reservations are still detected correctly
+
+        Args:
+        - pending_reservations: A list of reservation IDs for the pending reservations, one column each
+        - available_taxis: The list of taxis that can be assigned to reservations, one row each
+
+        Returns:
+        - a DispatchCostMatrix holding the taxi x reservation route lengths (infinity if there is no route or the pair was pruned)
+        - a function (rows, columns) -> bool that evaluates more pairs between the given taxis and reservations, for fill_unmatched. It
+          returns False once every pair between them has been evaluated
+        """
+        taxi_edges = [self.fleet.road_id(taxi_id) for taxi_id in available_taxis]
+        pickup_edges = [self.all_valid_res[res_id][1] for res_id in pending_reservations]
+        num_candidates = self.dispatch_candidates
+        if num_candidates <= 0 or (len(available_taxis) <= num_candidates and len(pending_reservations) <= num_candidates):
+            cost_matrix = DispatchCostMatrix(self.router if self.local_routing else None, taxi_edges, pickup_edges, self.find_route, reachability=self.router, cache=self.route_cache)
+            return cost_matrix, lambda rows, cols: False # every pair has been evaluated
+
+        # taxis are placed at the end of the edge they are driving on, pickups at their exact position along the lane
+        for taxi_id, edge_id in zip(available_taxis, taxi_edges):
+            x, y = self.get_edge_end_xy(edge_id)
+            self.taxi_index.update(taxi_id, x, y)
+        available = set(available_taxis)
+        taxi_row = {taxi_id: row for row, taxi_id in enumerate(available_taxis)}
+        pickup_index = GridIndex()
+        for col, res_id in enumerate(pending_reservations):
+            pickup_lane = self.net.getEdge(pickup_edges[col]).getLanes()[0]
+            x, y = self.getXYFromLanePos(pickup_lane, self.all_valid_res[res_id][3])
+            pickup_index.update(col, x, y)
+
+        def nearest_candidates(rows, cols, k, allowed_taxis=available, allowed_cols=None):
+            candidates = {}
+            for row in rows:
+                x, y = self.taxi_index.position(available_taxis[row])
+                candidates.setdefault(row, set()).update(pickup_index.nearest(x, y, k, allowed=allowed_cols))
+            for col in cols:
+                x, y = pickup_index.position(col)
+                for taxi_id in self.taxi_index.nearest(x, y, k, allowed=allowed_taxis):
+                    candidates.setdefault(taxi_row[taxi_id], set()).add(col)
+            return candidates
+
+        cost_matrix = DispatchCostMatrix(self.router if self.local_routing else None, taxi_edges, pickup_edges, self.find_route, reachability=self.router, cache=self.route_cache,
+                                         candidates=nearest_candidates(range(len(available_taxis)), range(len(pending_reservations)), num_candidates))
+        while True:
+            reachable = cost_matrix.reachable()
+            rows_done, cols_done = cost_matrix.fully_evaluated()
+            stuck_rows = np.flatnonzero(~reachable.any(axis=1) & ~rows_done)
+            stuck_cols = np.flatnonzero(~reachable.any(axis=0) & ~cols_done)
+            if len(stuck_rows) == 0 and len(stuck_cols) == 0:
+                break
+            num_candidates *= 2
+            cost_matrix.add_candidates(nearest_candidates(stuck_rows, stuck_cols, num_candidates))
+
+        leftover_candidates = self.dispatch_candidates
+        def widen(rows, cols):
+            # the leftover taxis and reservations are only paired with each other, doubling the number of candidates on every call
+            nonlocal leftover_candidates
+            if cost_matrix.all_evaluated(rows, cols):
+                return False
+            leftover_candidates *= 2
+            cost_matrix.add_candidates(nearest_candidates(rows, cols, leftover_candidates, {available_taxis[row] for row in rows}, set(cols)))
+            return True
+        return cost_matrix, widen
+
+    def fill_unmatched(self, cost_matrix, widen, matched, taxi_rows, res_cols, match):
+        """
+        With pruned candidates, a reservation whose nearest taxis were all matched to other reservations is left unmatched even if free taxis
+        could reach it. This widens the candidates between the taxis and reservations left over after matching and matches them again,
+        until nothing is left over on one side or every pair between the leftovers has been evaluated
+
+        Args:
+        - cost_matrix: the DispatchCostMatrix returned by build_cost_matrix
+        - widen: the widening function returned by build_cost_matrix
+        - matched: dictionary of row -> column of the pairs matched so far, the new pairs are added to it
+        - taxi_rows: the rows that can be matched
+        - res_cols: the columns that can be matched
+        - match: function (lengths submatrix) -> list of (row, column) pairs into the submatrix, the same one that made the first matching
+        """
+        while True:
+            claimed = set(matched.values())
+            free_rows = [row for row in taxi_rows if row not in matched]
+            open_cols = [col for col in res_cols if col not in claimed]
+            if not free_rows or not open_cols or not widen(free_rows, open_cols):
+                return
+            for i, j in match(cost_matrix.lengths[np.ix_(free_rows, open_cols)]):
+                matched[free_rows[i]] = open_cols[j]
+
+    def get_lane_edge(self, lane_id):
+        """
+        Returns the ID of the edge a lane belongs to, read from the network instead of asking TraCI
+        """
+        return self.net.getLane(lane_id).getEdge().getID()
+
+    def get_edge_end_xy(self, edge_id):
+        """
+        Returns the network coordinates of the end of an edge's first lane, the results are cached since the network does not change
+
+        Args:
+        - edge_id: the ID of the edge, may be an internal junction edge
+        """
+        if edge_id not in self.edge_end_xy:
+            end_point = self.net.getEdge(edge_id).getLanes()[0].getShape()[-1]
+            self.edge_end_xy[edge_id] = (end_point[0], end_point[1])
+        return self.edge_end_xy[edge_id]
+
     def cleanup(self):
         """Safely cleans up the simulation environment."""
         print("Cleaning up simulation...")
         try:
-            if traci.isLoaded():
-                traci.close()
+            if self.traci.isLoaded():
+                self.traci.close()
                 print("Closed SUMO connection.")
-        except traci.exceptions.TraCIException as e:
+        except self.traci.TraCIException as e:
             print(f"Error closing SUMO connection: {e}")
         except Exception as e:
             print(f"Unexpected error during cleanup: {e}")
         finally:
             self.is_running = False
+            self.stream.close()
+            if self.trace_demand is not None:
+                self.trace_demand.close()
+                print(f"Demand trace: {self.trace_demand.stats}")
             print("Simulation cleanup complete.\n\n\n")
 
 
@@ -1369,28 +1493,9 @@ class SimulationRunner(threading.Thread):
         #         traci.person.appendDrivingStage(person_id, toEdge=end_edge, lines="taxi")
         #         print(f"Dynamically added person {person_id} from {start_edge} to {end_edge}")
         
-        for _ in range(num_people): # with this version, it's not necessary to call traci.person.add here, because the simulation loop will take care of that
-            edges_are_valid = False
-            pickup_edge_id = random.choice(self.valid_edges)
-            dropoff_edge_id = random.choice(self.valid_edges)
-            curr_route = None
-            while not edges_are_valid:
-                curr_route = traci.simulation.findRoute(pickup_edge_id, dropoff_edge_id, vType="car")
-                if curr_route and curr_route.edges and dropoff_edge_id != pickup_edge_id:
-                    edges_are_valid = True
-                else:
-                    pickup_edge_id = random.choice(self.valid_edges)
-                    dropoff_edge_id = random.choice(self.valid_edges)
-            person_id = f"person_{self.person_counter}"
-            self.person_counter += 1
-            self.person_ids.append(person_id)
-            depart_time = traci.simulation.getTime()-self.traci_start_time
-            pickup_lane = self.net.getEdge(pickup_edge_id).getLanes()[0]
-            dropoff_lane = self.net.getEdge(dropoff_edge_id).getLanes()[0]
-            pickup_pos = random.uniform(max(pickup_lane.getLength()*(1/4), 13), min(pickup_lane.getLength()*(3/4), pickup_lane.getLength()-13))
-            dropoff_pos = random.uniform(max(dropoff_lane.getLength()*(1/4), 13), min(dropoff_lane.getLength()*(3/4), dropoff_lane.getLength()-13))
-            res_id = self.person_counter-1
-            self.all_valid_res[res_id] = [person_id, pickup_edge_id, dropoff_edge_id, pickup_pos, dropoff_pos, depart_time, curr_route.edges, curr_route.length]
+        # with this version, it's not necessary to call traci.person.add here, because the simulation loop will take care of that
+        depart_time = self.traci.simulation.getTime()-self.traci_start_time
+        self.add_pending_people(self.demand_generator.generate(num_people, depart_time=depart_time).requests())
 
     def _add_chargers_at_runtime(self, num_chargers):
         """
@@ -1417,6 +1522,9 @@ class SimulationRunner(threading.Thread):
             charger_id = f"charger_{self.charger_counter}"
             self.charger_counter += 1
             self.active_chargers.append((charger_id, lane.getID(), lane_pos))
+            if self.charger_table is not None:
+                self.charger_table.add_charger(charger_id, edge_id)
+        self.convert_charger_positions(self.active_chargers[len(self.active_chargers) - num_chargers:])
 
     def _spawn_taxis_at_runtime(self, num_taxis):
         """
@@ -1446,28 +1554,17 @@ class SimulationRunner(threading.Thread):
         #         print(f"Error adding taxi dynamically: {e}")
 
         for _ in range(num_taxis):
-            edges_are_valid = False
-            rand_route = None
-            start_edge_id = random.choice(self.valid_edges)
-            dest_edge_id = random.choice(self.valid_edges)
-            while not edges_are_valid:
-                rand_route = traci.simulation.findRoute(start_edge_id, dest_edge_id, vType="car")
-                if rand_route and rand_route.edges and dest_edge_id != start_edge_id:
-                    edges_are_valid = True
-                else:
-                    start_edge_id = random.choice(self.valid_edges)
-                    dest_edge_id = random.choice(self.valid_edges)
+            start_edge_id, dest_edge_id, rand_route = self.choose_random_route()
             taxi_id = f"taxi_{self.taxi_counter}"
             self.taxi_counter += 1
             route_id = f"route_{taxi_id}"
-            traci.route.add(route_id, rand_route.edges)
-            traci.vehicle.add(taxi_id, routeID=route_id, typeID="car", departPos="random", departLane="best", departSpeed="max")
-            self.empty_taxis[taxi_id] = dest_edge_id
+            self.traci.route.add(route_id, rand_route.edges)
+            self.traci.vehicle.add(taxi_id, routeID=route_id, typeID="car", departPos="random", departLane="best", departSpeed="max")
+            self.taxi_registry.add(taxi_id, EMPTY, dest_edge_id)
             charge_amount = random.randint(7,60)
             charge_amount = charge_amount*100
-            traci.vehicle.setParameter(taxi_id, "device.battery.actualBatteryCapacity", charge_amount) #Wh
-            traci.vehicle.setParameter(taxi_id, "device.battery.maximumBatteryCapacity", 8000)  # Wh
-            self.taxi_ids.append(taxi_id)
+            self.traci.vehicle.setParameter(taxi_id, "device.battery.actualBatteryCapacity", str(charge_amount)) #Wh
+            self.traci.vehicle.setParameter(taxi_id, "device.battery.maximumBatteryCapacity", "8000")  # Wh
 
     def _remove_people(self, num_people):
         """
@@ -1517,14 +1614,15 @@ class SimulationRunner(threading.Thread):
                 if removable_person_ids:
                     person_id = random.choice(list(removable_person_ids.keys()))
                     try:
-                        traci.person.remove(person_id)  # Remove from SUMO
+                        self.traci.person.remove(person_id)  # Remove from SUMO
                         self.person_ids.remove(person_id)  # Remove from local tracking
                         del self.all_valid_res[removable_person_ids[person_id]]
-                        self.waiting_reservations.remove(removable_person_ids[person_id])
+                        self.reservations_version += 1
+                        del self.waiting_reservations[removable_person_ids[person_id]]
                         del removable_person_ids[person_id]
                         count_removed_people += 1
                         print(f"Successfully removed person {person_id} from the simulation.")
-                    except traci.exceptions.TraCIException as e:
+                    except self.traci.TraCIException as e:
                         print(f"TraCI error while removing person {person_id}: {e}")
                     except Exception as e:
                         print(f"Unexpected error while removing person {person_id}: {e}")
@@ -1567,13 +1665,12 @@ class SimulationRunner(threading.Thread):
             if removable_taxis:
                 taxi_id = removable_taxis.pop(0)
                 try:
-                    self.taxi_ids.remove(taxi_id)
                     if taxi_id in self.empty_taxis.keys():
-                        traci.vehicle.remove(taxi_id)
-                        del self.empty_taxis[taxi_id]
-                    else:
-                        del self.out_of_commission[taxi_id]
-                except traci.exceptions.TraCIException as e:
+                        self.fleet.remove(taxi_id)
+                    self.taxi_registry.remove(taxi_id)
+                    self.taxi_index.remove(taxi_id)
+                    self.aggregates.remove_taxi(taxi_id)
+                except self.traci.TraCIException as e:
                     print(f"Error removing taxi {taxi_id}: {e}")
             else:
                 print("No more taxis to remove.")
@@ -1591,6 +1688,8 @@ class SimulationRunner(threading.Thread):
         for _ in range(num_chargers):
             if self.active_chargers:
                 charger_id, lane_id, position = self.active_chargers.pop(0)
+                if self.charger_table is not None:
+                    self.charger_table.remove_charger(charger_id)
                 print(f"Removed charger {charger_id} from lane {lane_id} at position {position}.")
             else:
                 print("No more chargers to remove.")
@@ -1601,8 +1700,11 @@ class SimulationRunner(threading.Thread):
         """
         Returns a dictionary of taxi_id -> cumulative electricity consumption in Wh. 
         """
-        consumption = self.electricity_consumption_per_taxi
-        consumption["time"] = traci.simulation.getTime()
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        consumption = dict(snapshot.electricity_consumption) # a copy, so that the "time" entry never ends up in the runner's own dictionary
+        consumption["time"] = snapshot.time
         return consumption
 
     def get_vehicle_positions(self):
@@ -1614,17 +1716,10 @@ class SimulationRunner(threading.Thread):
         ...
         }
         """
-        vehicle_positions = {}
-        for taxi_id in self.taxi_ids:
-            if taxi_id in traci.vehicle.getIDList():
-                try:
-                    x, y = traci.vehicle.getPosition(taxi_id)
-                    # Convert SUMO coordinates (x, y) to geo-coordinates (lon, lat)
-                    lon, lat = traci.simulation.convertGeo(x, y)
-                    vehicle_positions[taxi_id] = {'lat': lat, 'lon': lon}
-                except traci.exceptions.TraCIException as e:
-                    print(f"Error getting position for taxi {taxi_id}: {e}")
-        return vehicle_positions
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        return self.to_lat_lon_dict([taxi.taxi_id for taxi in snapshot.taxis], [taxi.x for taxi in snapshot.taxis], [taxi.y for taxi in snapshot.taxis])
 
     def get_passenger_positions(self):
         """
@@ -1635,39 +1730,12 @@ class SimulationRunner(threading.Thread):
         ...
         }
         """
-        passenger_positions = {}
-        for person_id in traci.person.getIDList():
-            # We only consider persons that we have tracked
-            if person_id in self.person_ids:
-                try:
-                    x, y = traci.person.getPosition(person_id)
-                    lon, lat = traci.simulation.convertGeo(x, y)
-                    passenger_positions[person_id] = {'lat': lat, 'lon': lon}
-                except traci.exceptions.TraCIException as e:
-                    print(f"Error getting position for passenger {person_id}: {e}")
-        return passenger_positions
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        passengers = snapshot.passengers
+        return self.to_lat_lon_dict([passenger.person_id for passenger in passengers], [passenger.x for passenger in passengers], [passenger.y for passenger in passengers])
     
-    def get_charger_positions(self):
-        """
-        Returns the positions of all chargers in the simulation as a dictionary:
-        {
-        "charger_0": {"lat": <latitude>, "lon": <longitude>},
-        "charger_1": {"lat": <latitude>, "lon": <longitude>},
-        ...
-        }
-        """
-        charger_positions = {}
-        for charger_id, lane_id, position in self.active_chargers:
-            try:
-                lane = self.net.getLane(lane_id)
-                # Use lane.getCoord() to get the (x, y) coordinate at the given position
-                x, y = lane.getCoord(position)
-                lon, lat = traci.simulation.convertGeo(x, y)
-                charger_positions[charger_id] = {'lat': lat, 'lon': lon}
-            except Exception as e:
-                print(f"Error getting position for charger {charger_id}: {e}")
-        return charger_positions
-
     def getXYFromLanePos(self, lane, lane_pos):
         """
         Returns the (x, y) coordinate at a specific position along the lane.
@@ -1709,43 +1777,27 @@ class SimulationRunner(threading.Thread):
           ...
         }
         """
-        charger_positions = {}
-        for charger_id, lane_id, position in self.active_chargers:
-            try:
-                lane = self.net.getLane(lane_id)
-                # Use the helper function to get (x, y) at the given position
-                x, y = self.getXYFromLanePos(lane, position)
-                lon, lat = traci.simulation.convertGeo(x, y)
-                charger_positions[charger_id] = {'lat': lat, 'lon': lon}
-            except Exception as e:
-                print(f"Error getting position for charger {charger_id}: {e}")
-        return charger_positions
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        return {charger.charger_id: self.charger_lat_lon[charger.charger_id] for charger in snapshot.chargers} # converted when the chargers were created
 
     def get_battery_levels(self):
         """
         Returns a dictionary of taxi_id -> battery level (in percentage).
         """
-        battery_levels = {}
-        for taxi_id in self.taxi_ids:
-            if taxi_id in traci.vehicle.getIDList():
-                try:
-                    actual_capacity = float(traci.vehicle.getParameter(taxi_id, "device.battery.actualBatteryCapacity"))
-                    maximum_capacity = float(traci.vehicle.getParameter(taxi_id, "device.battery.maximumBatteryCapacity"))
-                    soc_percentage = (actual_capacity / maximum_capacity) * 100.0  # Calculate State of Charge (SoC) in percentage
-                    battery_levels[taxi_id] = soc_percentage
-                except traci.exceptions.TraCIException as e:
-                    print(f"Error getting battery level for taxi {taxi_id}: {e}")
-        return battery_levels
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {}
+        return {taxi.taxi_id: taxi.battery_level for taxi in snapshot.taxis}
     
     def get_average_passenger_wait_time(self):
         """
         Returns the average passenger wait time in seconds.
         If no reservations have been picked up, returns 0.
         """
-        if len(self.reservation_wait_times.values()) > 0:
-            return sum(self.reservation_wait_times.values()) / len(self.reservation_wait_times.values())
-        else:
-            return 0.0
+        snapshot = self.snapshot
+        return snapshot.average_wait_time if snapshot is not None else 0.0
 
     def get_active_passengers_count(self):
         """
@@ -1753,44 +1805,21 @@ class SimulationRunner(threading.Thread):
         Active passengers are those who are waiting to be picked up, assigned and waiting,
         or currently riding in a taxi.
         """
-        # waiting_reservations: reservations waiting to be picked up
-        # assigned_reservations: reservations assigned to a taxi but not picked up yet
-        # heading_home_reservations: reservations currently in a taxi (picked up and not dropped off yet)
-        active_passengers = len(self.waiting_reservations) + len(self.assigned_reservations) + len(self.heading_home_reservations)
-        output = {"active_passengers": active_passengers, "time": traci.simulation.getTime()}
-        return output
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"active_passengers": 0, "time": 0.0}
+        return {"active_passengers": snapshot.active_passengers, "time": snapshot.time}
     
     def get_active_chargers_count(self):
         """
         Returns a dictionary with:
-        - active_chargers: the number of chargers currently in use
-        - time: the current simulation time from TraCI
+        - active_chargers: the number of chargers currently in use, meaning a taxi is within 5 m of the charger on the same lane
+        - time: the simulation time of the snapshot
         """
-        current_time = traci.simulation.getTime()
-        active_count = 0
-        distance_threshold = 5.0  # meters within which a taxi is considered to be using the charger
-
-        # Get the list of taxis currently in the simulation
-        taxis_in_sim = traci.vehicle.getIDList()
-
-        for charger_id, charger_lane_id, charger_position in self.active_chargers:
-            # Check if any taxi is near this charger
-            charger_in_use = False
-            for taxi_id in taxis_in_sim:
-                try:
-                    taxi_lane = traci.vehicle.getLaneID(taxi_id)
-                    taxi_position = traci.vehicle.getLanePosition(taxi_id)
-                    if taxi_lane == charger_lane_id and abs(taxi_position - charger_position) < distance_threshold:
-                        charger_in_use = True
-                        break
-                except traci.exceptions.TraCIException:
-                    # If there's an error fetching parameters for a taxi, ignore and continue
-                    pass
-
-            if charger_in_use:
-                active_count += 1
-
-        return {"active_chargers": active_count, "time": current_time}
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"active_chargers": 0, "time": 0.0}
+        return {"active_chargers": sum(1 for charger in snapshot.chargers if charger.in_use), "time": snapshot.time}
     
     def get_taxis_with_passengers_count(self):
         """
@@ -1798,24 +1827,10 @@ class SimulationRunner(threading.Thread):
         A taxi is considered to have passengers if it is in the self.heading_home_reservations dict (actually transporting a passenger).
         Also, any taxi in dropping_off_taxis is already included since they're moving a passenger.
         """
-        # Each taxi that is in dropping_off_taxis has a passenger.
-        # heading_home_reservations maps reservation_id -> taxi_id for those currently with passengers.
-        # dropping_off_taxis keys are also taxi_ids currently transporting passengers.
-
-        # The number of unique taxi IDs in self.heading_home_reservations.values() or in self.dropping_off_taxis keys 
-        # will give us the count of taxis with passengers.
-        
-        taxis_with_passengers = set()
-
-        for taxi_id in self.dropping_off_taxis.keys():
-            taxis_with_passengers.add(taxi_id)
-
-        # heading_home_reservations also indicates that the reservation is currently being delivered by that taxi
-        for taxi_id in self.heading_home_reservations.values():
-            taxis_with_passengers.add(taxi_id)
-
-        current_time = traci.simulation.getTime()
-        return {"taxis_with_passengers": len(taxis_with_passengers), "time": current_time}
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"taxis_with_passengers": 0, "time": 0.0}
+        return {"taxis_with_passengers": snapshot.taxis_with_passengers, "time": snapshot.time}
 
     def get_passenger_unsatisfaction_rate(self):
         """
@@ -1826,83 +1841,30 @@ class SimulationRunner(threading.Thread):
         - A person is considered unsatisfied if:
         current_time - depart_time > 900 seconds (15 minutes) AND not picked up yet (still waiting or assigned).
         """
-        current_time = traci.simulation.getTime()
-
-        # Total people who have started = all reservations whose depart_time <= current_time
-        total_started = 0
-        unsatisfied_count = 0
-
-        for res_id, res_data in self.all_valid_res.items():
-            depart_time = res_data[5]
-
-            if depart_time <= current_time:
-                total_started += 1
-                wait_duration = current_time - depart_time
-
-                # Check if this reservation is not picked up yet
-                # Not picked up means reservation_id is in waiting_reservations or assigned_reservations
-                # If picked up -> would be in heading_home_reservations or completed_reservations
-                not_picked_up = (res_id in self.waiting_reservations) or (res_id in self.assigned_reservations)
-
-                if not_picked_up and wait_duration > 900:
-                    unsatisfied_count += 1
-
-        unsatisfied_rate = (unsatisfied_count / total_started) if total_started > 0 else 0.0
-
-        return {
-            "unsatisfied_rate": unsatisfied_rate,
-            "unsatisfied_count": unsatisfied_count,
-            "total_started": total_started,
-            "time": current_time
-        }
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"unsatisfied_rate": 0.0, "unsatisfied_count": 0, "total_started": 0, "time": 0.0}
+        return dict(snapshot.unsatisfaction)
     
     def get_total_earnings(self):
         """
-        Computes total earnings from all completed reservations.
-        Uses self.completed_reservations_by_taxi and the pricing model described.
-        """
-        total_satisfied_reservations = 0
-        total_earnings = 0
-        # Iterate over all taxi IDs and sum up the earnings
-        for taxi_id in self.taxi_ids:
-            taxi_earnings = 0
-            if taxi_id in self.completed_reservations_by_taxi.keys():
-                total_satisfied_reservations += len(self.completed_reservations_by_taxi[taxi_id])
-                for completed_trip in self.completed_reservations_by_taxi[taxi_id]:
-                    trip_length = completed_trip[0] / 1000  
-                    trip_demand_multiplier = completed_trip[1]
-                    trip_tod_rate = completed_trip[2]
-                    trip_earnings = self.taxi_ride_base_price + (
-                                (trip_length * self.taxi_ride_distance_rate) * trip_demand_multiplier * trip_tod_rate)
-                    taxi_earnings += trip_earnings
-            total_earnings += taxi_earnings
-        return total_earnings
+        Returns the total earnings from all completed reservations, as of the last snapshot.
+        """
+        snapshot = self.snapshot
+        return snapshot.total_earnings if snapshot is not None else 0
 
     def get_total_cost(self):
         """
-        Computes total cost from all charging trips and tows.
-        Uses self.cost_per_charging_trip and self.cost_per_tow.
+        Returns the total cost of all charging trips and tows, as of the last snapshot.
         """
-        total_cost = 0.0
-        total_num_charging_trips = 0
-        total_num_tows = 0
-
-        # Iterate over all taxi IDs and sum up the costs
-        for taxi_id in self.taxi_ids:
-            if taxi_id in self.cost_per_charging_trip.keys():
-                total_num_charging_trips += len(self.cost_per_charging_trip[taxi_id])
-                total_cost += (len(self.cost_per_charging_trip[taxi_id]) * self.charge_base_price) + sum(self.cost_per_charging_trip[taxi_id])
-            if taxi_id in self.cost_per_tow.keys():
-                total_num_tows += len(self.cost_per_tow[taxi_id])
-                total_cost += (len(self.cost_per_tow[taxi_id]) * self.tow_base_price) + sum(self.cost_per_tow[taxi_id])
-
-        return total_cost
+        snapshot = self.snapshot
+        return snapshot.total_cost if snapshot is not None else 0.0
 
     def get_profit(self):
         """
-        Computes profit as total earnings - total cost.
+        Computes profit as total earnings - total cost, both taken from the same snapshot.
         """
-        total_earnings = self.get_total_earnings()
-        total_cost = self.get_total_cost()
-        # Profit = Earnings - Cost
-        return total_earnings - total_cost
\ No newline at end of file
+        snapshot = self.snapshot # read once, so that earnings and cost come from the same step
+        if snapshot is None:
+            return 0
+        return snapshot.total_earnings - snapshot.total_cost
\ No newline at end of file
@@ -0,0 +1,161 @@
+import math
+
+
+class GridIndex:
+    """
+    Uniform grid over network coordinates (in m) for nearest-neighbour queries on moving or static points.
+    Each item lives in exactly one cell, so moving an item only touches the grid when it crosses into a different cell.
+    The bounding box of the occupied cells is kept up to date as cells fill and empty, it tells queries when to stop widening
+    """
+
+    def __init__(self, cell_size=250.0):
+        """
+        Args:
+        - cell_size: width and height of a grid cell in m
+        """
+        self.cell_size = cell_size
+        self.cells = {} # (cell column, cell row) -> set of item ids in that cell
+        self.items = {} # item id -> (x, y, cell)
+        self.col_counts = {} # cell column -> number of occupied cells in it
+        self.row_counts = {} # cell row -> number of occupied cells in it
+        self.bounds = None # [min column, max column, min row, max row] of the occupied cells, None if there are none
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def _cell(self, x, y):
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    def update(self, item_id, x, y):
+        """
+        Inserts an item or moves it to a new position
+        """
+        cell = self._cell(x, y)
+        old = self.items.get(item_id)
+        if old is not None and old[2] != cell:
+            self._discard(item_id, old[2])
+        if old is None or old[2] != cell:
+            members = self.cells.get(cell)
+            if members is None:
+                members = self.cells[cell] = set()
+                self._occupy(cell)
+            members.add(item_id)
+        self.items[item_id] = (x, y, cell)
+
+    def remove(self, item_id):
+        """
+        Removes an item from the index if it is present
+        """
+        old = self.items.pop(item_id, None)
+        if old is not None:
+            self._discard(item_id, old[2])
+
+    def _discard(self, item_id, cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(item_id)
+            if not members:
+                del self.cells[cell]
+                self._vacate(cell)
+
+    def _occupy(self, cell):
+        col, row = cell
+        self.col_counts[col] = self.col_counts.get(col, 0) + 1
+        self.row_counts[row] = self.row_counts.get(row, 0) + 1
+        if self.bounds is None:
+            self.bounds = [col, col, row, row]
+        else:
+            bounds = self.bounds
+            bounds[0] = min(bounds[0], col)
+            bounds[1] = max(bounds[1], col)
+            bounds[2] = min(bounds[2], row)
+            bounds[3] = max(bounds[3], row)
+
+    def _vacate(self, cell):
+        """
+        Updates the bounding box after a cell became empty. Only an emptied edge column or row moves the box, which then shrinks to
+        the next occupied column or row, so the cost depends on the width of the grid rather than on the number of occupied cells
+        """
+        col, row = cell
+        self.col_counts[col] -= 1
+        if self.col_counts[col] == 0:
+            del self.col_counts[col]
+        self.row_counts[row] -= 1
+        if self.row_counts[row] == 0:
+            del self.row_counts[row]
+        if not self.cells:
+            self.bounds = None
+            return
+        bounds = self.bounds
+        while bounds[0] not in self.col_counts:
+            bounds[0] += 1
+        while bounds[1] not in self.col_counts:
+            bounds[1] -= 1
+        while bounds[2] not in self.row_counts:
+            bounds[2] += 1
+        while bounds[3] not in self.row_counts:
+            bounds[3] -= 1
+
+    def position(self, item_id):
+        x, y, _ = self.items[item_id]
+        return x, y
+
+    def nearest(self, x, y, k, allowed=None):
+        """
+        Finds the k items closest to a point by straight-line distance. The search visits rings of cells around the point and widens
+        until k items are found and no unvisited cell can hold a closer one
+
+        Args:
+        - x, y: the query point
+        - k: the maximum number of items to return
+        - allowed: optional set of item ids, other items are skipped
+
+        Returns:
+        - the ids of up to k items, closest first
+        """
+        if k <= 0 or not self.items:
+            return []
+        limit = len(self.items) if allowed is None else min(len(self.items), len(allowed))
+        k = min(k, limit)
+        cx, cy = self._cell(x, y)
+        if self.bounds is not None:
+            # no ring can hold items beyond the farthest side of the occupied bounding box, so the search always terminates
+            min_col, max_col, min_row, max_row = self.bounds
+            max_ring = max(cx - min_col, max_col - cx, cy - min_row, max_row - cy, 0)
+        else:
+            max_ring = 0
+        found = [] # (distance, item id)
+        ring = 0
+        while ring <= max_ring:
+            for cell in self._ring_cells(cx, cy, ring):
+                for item_id in self.cells.get(cell, ()):
+                    if allowed is not None and item_id not in allowed:
+                        continue
+                    ix, iy, _ = self.items[item_id]
+                    found.append((math.hypot(ix - x, iy - y), item_id))
+            if len(found) >= k:
+                found.sort()
+                # every cell outside the visited rings is at least ring * cell_size away from the query point
+                if found[k-1][0] <= ring * self.cell_size:
+                    break
+            ring += 1
+        found.sort()
+        return [item_id for _, item_id in found[:k]]
+
+    @staticmethod
+    def _ring_cells(cx, cy, ring):
+        """
+        Yields the cells on the square ring at the given distance (in cells) from the center cell
+        """
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for col in range(cx - ring, cx + ring + 1):
+            yield (col, cy - ring)
+            yield (col, cy + ring)
+        for row in range(cy - ring + 1, cy + ring):
+            yield (cx - ring, row)
+            yield (cx + ring, row)
@@ -0,0 +1,41 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+TaxiView = namedtuple("TaxiView", ["taxi_id", "x", "y", "battery_level", "lane_id", "lane_position", "state", "color"]) # battery_level is in %, state is one of taxi_registry.TAXI_STATES, color is the (r, g, b) shown in SUMO
+PassengerView = namedtuple("PassengerView", ["person_id", "x", "y"])
+ChargerView = namedtuple("ChargerView", ["charger_id", "x", "y", "in_use"])
+
+
+class StateSnapshot:
+    """
+    Read-only picture of the simulation at the end of one step. The simulation thread builds a new snapshot after every step and
+    publishes it by replacing a single reference, so request threads always read one complete step, without locks and without calling into SUMO.
+    Positions are kept in network coordinates, readers convert them to longitude and latitude
+    """
+    __slots__ = (
+        "time", # TraCI's simulation time in s
+        "status", # the values reported by get_status
+        "taxis", # tuple of TaxiView, one per taxi in the simulation
+        "passengers", # tuple of PassengerView, one per person waiting for a taxi
+        "chargers", # tuple of ChargerView, one per active charger
+        "electricity_consumption", # taxi ID -> cumulative electricity consumption in Wh
+        "average_wait_time", # in s
+        "active_passengers",
+        "taxis_with_passengers",
+        "unsatisfaction", # see SimulationRunner.get_passenger_unsatisfaction_rate
+        "total_earnings", # in $
+        "total_cost", # in $
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            value = values[name]
+            if isinstance(value, dict):
+                value = MappingProxyType(value)
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StateSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("StateSnapshot is read-only")
@@ -0,0 +1,143 @@
+EMPTY = "empty" # unoccupied and unassigned, circling the map on a random route
+CHARGING = "charging" # on its way to a charger
+PICKING_UP = "picking_up" # on its way to pick up a person
+DROPPING_OFF = "dropping_off" # carrying a person to their destination
+OUT_OF_COMMISSION = "out_of_commission" # not in the simulation until it is put back at a new location
+TAXI_STATES = (EMPTY, CHARGING, PICKING_UP, DROPPING_OFF, OUT_OF_COMMISSION)
+
+# the states a taxi can move to from each state. any state can go out of commission, only out of commission taxis come back
+TRANSITIONS = {
+    EMPTY: (CHARGING, PICKING_UP, OUT_OF_COMMISSION),
+    CHARGING: (EMPTY, OUT_OF_COMMISSION),
+    PICKING_UP: (DROPPING_OFF, OUT_OF_COMMISSION),
+    DROPPING_OFF: (EMPTY, OUT_OF_COMMISSION),
+    OUT_OF_COMMISSION: (EMPTY,),
+}
+
+
+class Taxi:
+    """
+    One taxi of the fleet. data depends on the state:
+    - EMPTY: the taxi's random destination edge
+    - CHARGING: the ID of the charger it is going to
+    - PICKING_UP: [reservation id, pickup edge]
+    - DROPPING_OFF: [reservation id, dropoff edge, pickup time, distance from pickup to dropoff]
+    - OUT_OF_COMMISSION: [time when taxi can re-enter simulation, amount of charge taxi should be reset with]
+    """
+    __slots__ = ("taxi_id", "state", "data")
+
+    def __init__(self, taxi_id, state, data):
+        self.taxi_id = taxi_id
+        self.state = state
+        self.data = data
+
+
+class StateView:
+    """
+    Read-only dictionary of taxi ID -> data for the taxis in one state, in the order they entered it. Taxis change state through
+    TaxiRegistry, so iterating a view while moving taxis out of its state needs a copy (list(view))
+    """
+
+    def __init__(self, members):
+        self.members = members # taxi ID -> Taxi, owned by the registry
+
+    def __contains__(self, taxi_id):
+        return taxi_id in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __getitem__(self, taxi_id):
+        return self.members[taxi_id].data
+
+    def keys(self):
+        return self.members.keys()
+
+    def values(self):
+        return (taxi.data for taxi in self.members.values())
+
+    def items(self):
+        return ((taxi_id, taxi.data) for taxi_id, taxi in self.members.items())
+
+
+class TaxiRegistry:
+    """
+    Every taxi of the fleet with its state, plus one index per state, so that checking a taxi's state is a dictionary lookup and
+    going through the taxis in one state only touches those taxis. State changes are checked against TRANSITIONS
+    """
+
+    def __init__(self):
+        self.taxis = {} # taxi ID -> Taxi, in the order the taxis were added
+        self.by_state = {state: {} for state in TAXI_STATES} # state -> taxi ID -> Taxi
+        self.views = {state: StateView(members) for state, members in self.by_state.items()}
+
+    def __contains__(self, taxi_id):
+        return taxi_id in self.taxis
+
+    def __len__(self):
+        return len(self.taxis)
+
+    def ids(self):
+        """
+        Returns a live view of the IDs of every taxi in the fleet
+        """
+        return self.taxis.keys()
+
+    def view(self, state):
+        return self.views[state]
+
+    def state(self, taxi_id, default=None):
+        taxi = self.taxis.get(taxi_id)
+        return taxi.state if taxi is not None else default
+
+    def add(self, taxi_id, state, data):
+        """
+        Adds a new taxi to the fleet
+        """
+        if taxi_id in self.taxis:
+            raise ValueError(f"Taxi {taxi_id} is already in the fleet")
+        taxi = Taxi(taxi_id, state, data)
+        self.taxis[taxi_id] = taxi
+        self.by_state[state][taxi_id] = taxi
+
+    def remove(self, taxi_id):
+        """
+        Removes a taxi from the fleet
+        """
+        taxi = self.taxis.pop(taxi_id)
+        del self.by_state[taxi.state][taxi_id]
+
+    def transition(self, taxi_id, state, data):
+        """
+        Moves a taxi to a new state
+
+        Args:
+        - taxi_id: the ID of the taxi
+        - state: the new state, which has to be allowed by TRANSITIONS
+        - data: the taxi's data in the new state
+        """
+        taxi = self.taxis[taxi_id]
+        if state not in TRANSITIONS[taxi.state]:
+            raise ValueError(f"Taxi {taxi_id} cannot go from {taxi.state} to {state}")
+        self._move(taxi, state, data)
+
+    def respawn(self, taxi_id, data):
+        """
+        Makes a taxi that was put back into the simulation at a new location empty, whatever its state was
+        """
+        self._move(self.taxis[taxi_id], EMPTY, data)
+
+    def set_data(self, taxi_id, data):
+        """
+        Replaces a taxi's data without changing its state
+        """
+        self.taxis[taxi_id].data = data
+
+    def _move(self, taxi, state, data):
+        del self.by_state[taxi.state][taxi.taxi_id]
+        taxi.state = state
+        taxi.data = data
+        self.by_state[state][taxi.taxi_id] = taxi
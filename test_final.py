@@ -1,6 +1,8 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from simulation_runner import SimulationRunner
+from network_assets import AssetStore
+from map import derive_level
 import os
 import sys
 
@@ -13,6 +15,16 @@ app = Flask(__name__)
 CORS(app)
 
 simulation_runner = None  
+NETWORK_LEVELS = {'full': 'network.geojson', 'medium': 'network_medium.geojson', 'low': 'network_low.geojson'}
+network_assets = AssetStore('.', builders={ # the GeoJSON files written by map.py, kept in memory with their precompressed variants
+    NETWORK_LEVELS[lod]: (lambda path, lod=lod: derive_level(os.path.join(os.path.dirname(path), 'network.geojson'), lod, path)) for lod in ('medium', 'low') # coarser levels missing from the checkout are built from the full one
+})
+
+@app.before_request
+def note_client():
+    # a client polling the backend counts as attached, which throttles the simulation in the "attached" pacing mode
+    if simulation_runner is not None:
+        simulation_runner.pacer.client_seen()
 
 @app.route('/start_simulation', methods=['POST'])
 def start_simulation():
@@ -29,6 +41,27 @@ def start_simulation():
     num_chargers = int(data.get('num_chargers', 100))  # Get num_chargers from POST data
     optimized = bool(data.get('optimized', False))
     output_freq = float(data.get('output_freq', 50))
+    local_routing = bool(data.get('local_routing', True))
+    assignment_backend = data.get('assignment_backend', 'hungarian')
+    dispatch_candidates = int(data.get('dispatch_candidates', 8))
+    route_cache_size = int(data.get('route_cache_size', 50000))
+    route_cache_bucket = data.get('route_cache_bucket')
+    route_cache_bucket = float(route_cache_bucket) if route_cache_bucket is not None else None
+    sumo_backend = data.get('sumo_backend', 'sumo-gui')
+    pacing_mode = data.get('pacing_mode', 'attached')
+    real_time_factor = float(data.get('real_time_factor', 50))
+    demand_trace = data.get('demand_trace') # ride requests to replay, a file in the backend's directory
+    trace_lookahead = float(data.get('trace_lookahead', 600))
+    if assignment_backend not in ('hungarian', 'greedy'):
+        return jsonify({'status': 'error', 'message': 'assignment_backend must be "hungarian" or "greedy".'}), 400
+    if sumo_backend not in ('sumo-gui', 'sumo', 'libsumo'):
+        return jsonify({'status': 'error', 'message': 'sumo_backend must be "sumo-gui", "sumo", or "libsumo".'}), 400
+    if pacing_mode not in ('afap', 'realtime', 'attached') or real_time_factor <= 0:
+        return jsonify({'status': 'error', 'message': 'pacing_mode must be "afap", "realtime", or "attached", and real_time_factor must be positive.'}), 400
+    if demand_trace is not None:
+        trace_path = os.path.abspath(demand_trace)
+        if os.path.commonpath([trace_path, os.getcwd()]) != os.getcwd() or not os.path.isfile(trace_path):
+            return jsonify({'status': 'error', 'message': 'demand_trace must be a file in the backend directory.'}), 400
 
     # Start the simulation runner with initial parameters
     simulation_runner = SimulationRunner(
@@ -39,7 +72,17 @@ def start_simulation():
         num_taxis=num_taxis,
         num_chargers=num_chargers,  # Pass num_chargers to SimulationRunner
         optimized=optimized,
-        output_freq=output_freq
+        output_freq=output_freq,
+        local_routing=local_routing,
+        assignment_backend=assignment_backend,
+        dispatch_candidates=dispatch_candidates,
+        route_cache_size=route_cache_size,
+        route_cache_bucket=route_cache_bucket,
+        sumo_backend=sumo_backend,
+        pacing_mode=pacing_mode,
+        real_time_factor=real_time_factor,
+        demand_trace=demand_trace,
+        trace_lookahead=trace_lookahead
     )
     simulation_runner.start()
 
@@ -116,13 +159,58 @@ def shutdown():
     simulation_runner = None
     return jsonify({'status': 'success', 'message': 'Simulation stopped.'})
 
-# Get network
+# Stream of taxi and passenger updates as server-sent events: a keyframe with the full state on connect, then deltas
+@app.route('/stream', methods=['GET'])
+def stream():
+    if not simulation_runner or not simulation_runner.is_running:
+        return jsonify({'status': 'error', 'message': 'Simulation is not running.'}), 400
+    max_rate = float(request.args.get('max_rate', 5.0)) # updates per second for this client
+    if max_rate < 0:
+        return jsonify({'status': 'error', 'message': 'max_rate must not be negative.'}), 400
+    runner = simulation_runner
+
+    def generate():
+        for event in runner.stream.events(max_rate):
+            runner.pacer.client_seen() # an open stream counts as an attached client
+            yield event
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def send_asset(relative_path):
+    """
+    Sends a static GeoJSON file, precompressed if the client accepts it, with an ETag so that unchanged files are answered with 304
+    """
+    asset = network_assets.get(relative_path)
+    if asset is None:
+        return None
+    headers = {'ETag': f'"{asset.etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'} # no-cache: clients keep the file but check the ETag every time
+    if asset.etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    encoding, body = asset.body(lambda name: request.accept_encodings[name] > 0)
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
+
+# Get network, ?lod=full|medium|low picks the level of detail
 @app.route('/network', methods=['GET'])
 def get_network():
-    try:
-        return send_file('network.geojson', mimetype='application/json')
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    lod = request.args.get('lod', 'full')
+    if lod not in NETWORK_LEVELS:
+        return jsonify({'status': 'error', 'message': f'Unknown level of detail: {lod}'}), 400
+    response = send_asset(NETWORK_LEVELS[lod])
+    if response is None:
+        return jsonify({"error": f"{NETWORK_LEVELS[lod]} not found, run map.py to generate it"}), 404
+    return response
+
+# Get one tile of the network written by map.py --tiles, tiles without any roads are returned empty
+@app.route('/network/tiles/<lod>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_network_tile(lod, z, x, y):
+    if lod not in NETWORK_LEVELS:
+        return jsonify({'status': 'error', 'message': f'Unknown level of detail: {lod}'}), 400
+    response = send_asset(f'network_tiles/{lod}/{z}/{x}/{y}.geojson')
+    if response is None:
+        return jsonify({'type': 'FeatureCollection', 'features': []})
+    return response
     
 # Get electricity consumption
 @app.route('/electricityConsumption', methods=['GET'])
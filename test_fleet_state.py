@@ -0,0 +1,52 @@
+from fleet_state import FleetState, StandInBackend
+
+
+def make_fleet():
+    backend = StandInBackend()
+    backend.add("taxi_0", "E0", lane_position=5.0, battery=8000.0)
+    backend.add("taxi_1", "E1", lane_position=10.0, battery=4000.0)
+    fleet = FleetState(backend)
+    fleet.refresh()
+    return backend, fleet
+
+
+def test_refresh_subscribes_new_vehicles_once():
+    backend, fleet = make_fleet()
+    assert fleet.ids == ["taxi_0", "taxi_1"]
+    assert backend.vehicle.subscriptions == {"taxi_0", "taxi_1"}
+    assert fleet.round_trips == 2 + 2 * 2 # the ID list and all results, then subscribe and read each new vehicle
+
+    backend.move("taxi_0", "E2", 3.0, distance=20.0, consumption=10.0, step_length=0.5)
+    fleet.refresh()
+    assert fleet.round_trips == 6 + 2 # known vehicles only cost the two calls per step
+    state = fleet.get("taxi_0")
+    assert state.road_id == "E2"
+    assert state.lane_position == 3.0
+    assert state.distance == 20.0
+    assert state.battery == 8000.0 - 10.0 * 0.5
+
+    backend.add("taxi_2", "E3")
+    fleet.refresh()
+    assert fleet.round_trips == 8 + 2 + 2
+    assert fleet.road_id("taxi_2") == "E3"
+
+
+def test_set_battery_updates_snapshot():
+    backend, fleet = make_fleet()
+    fleet.set_battery("taxi_1", 7500)
+    assert fleet.battery("taxi_1") == 7500.0
+    fleet.refresh()
+    assert fleet.battery("taxi_1") == 7500.0
+
+
+def test_remove_and_discard_drop_vehicle():
+    backend, fleet = make_fleet()
+    fleet.remove("taxi_0")
+    assert "taxi_0" not in fleet
+    assert fleet.ids == ["taxi_1"]
+    assert "taxi_0" not in backend.vehicle.getIDList()
+
+    fleet.discard("taxi_1")
+    assert fleet.ids == []
+    assert fleet.get("taxi_1") is None
+    fleet.discard("taxi_1") # discarding a taxi that is already gone does nothing